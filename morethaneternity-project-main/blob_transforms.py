@@ -0,0 +1,388 @@
+#!/usr/bin/env python3
+"""
+Blob Transforms
+
+Changes the files of split repositories throughout their history without
+per-commit filter-repo callbacks: drops committed build output such as
+obj/*.o, *.a or the fractol binary, normalizes line endings, or rewrites
+lines like 'LIBFT_PATH = ../libft'. Two kinds of transforms can be
+registered:
+
+    - path transforms get the path of a file and return its new name in the
+      same directory, or None to drop it
+    - blob transforms get the content of a file and return the new content;
+      they only depend on the content, and only apply to paths matching
+      their patterns
+
+The stage runs on an extracted repository and rewrites every branch and tag
+with plumbing. Nothing is done per commit: each tree is rebuilt once per
+path it appears at, and each blob is transformed once per chain of
+transforms that applies to it. The results are kept for the whole run, so a
+library file found in every commit of every target is read and transformed
+once. The blobs are read through the git runner and transformed on a
+process pool; blob transforms must therefore be picklable (module-level
+functions, or partials of them).
+Commits left without changes are pruned like filter-repo prunes them.
+
+Patterns are globs matched against the monorepo path of a file (the path
+in the split repository with the project directory in front), component by
+component, so a '*' never crosses a '/'. A pattern matches the end of a
+path: 'obj/*.o' matches fractol/obj/main.o, '*.a' every archive and
+'fractol/fractol' the fractol binary. A leading '/' anchors a pattern at
+the root of the monorepo.
+
+A replace file holds one rule per line, '<pattern> <regex>==><replacement>'
+with the regex in multi-line mode, e.g.:
+
+    Makefile ^(LIBFT_PATH\\s*=\\s*)\\.\\./libft$==>\\1libft
+
+Usage:
+    python blob_transforms.py REPO [--prefix fractol] [--drop 'obj/*.o' ...] [--eol '*.c' ...]
+                                   [--replace replace_rules.txt] [--workers 4]
+
+Rewrites every branch and tag of REPO in place.
+"""
+
+import os
+import re
+import sys
+import hashlib
+import logging
+import argparse
+import threading
+import subprocess
+from functools import partial
+from fnmatch import fnmatchcase
+from concurrent.futures import ProcessPoolExecutor
+from dataclasses import dataclass
+from typing import Callable, Dict, Iterable, List, Optional, Set, Tuple
+
+from history_rewrite import git, read_commits, read_objects, stitch, apply_rewrite, pruned_as_none, EMPTY_TREE
+from submodule_wiring import TREE_MODE, parse_tree, build_tree
+
+
+# Only regular and executable files have content to transform; symlinks and gitlinks are left alone
+FILE_MODES = (b'100644', b'100755')
+BLOB_CHUNK = 256  # blobs per worker task; a single chunk is transformed without the pool
+BINARY_PROBE = 8000  # bytes searched for a NUL, the way git decides a file is binary
+
+Chain = Tuple[int, ...]  # indices of the blob transforms that apply to a path, in order
+
+
+@dataclass
+class TransformRule:
+    """A registered transform and the paths it applies to."""
+    function: Callable
+    patterns: List[str]
+
+
+def path_matches(path: str, pattern: str) -> bool:
+    """Match a path against a glob component by component, at its end or, with a leading '/', as a whole."""
+    parts = path.split('/')
+    pattern_parts = pattern.strip('/').split('/')
+    if len(pattern_parts) > len(parts):
+        return False
+    if pattern.startswith('/'):
+        return len(pattern_parts) == len(parts) and all(map(fnmatchcase, parts, pattern_parts))
+    return all(map(fnmatchcase, parts[-len(pattern_parts):], pattern_parts))
+
+
+def drop_path(path: str) -> Optional[str]:
+    """Path transform that drops every file it is registered for."""
+    return None
+
+
+def normalize_eol(data: bytes) -> bytes:
+    """Blob transform that turns CRLF line endings into LF, leaving binary files alone."""
+    if b'\0' in data[:BINARY_PROBE]:
+        return data
+    return data.replace(b'\r\n', b'\n')
+
+
+def replace_text(pattern: re.Pattern, replacement: bytes, data: bytes) -> bytes:
+    """Blob transform that substitutes a regex; bind pattern and replacement with functools.partial."""
+    return pattern.sub(replacement, data)
+
+
+def load_replace_rules(path: str) -> List[Tuple[str, Callable[[bytes], bytes]]]:
+    """Read a replace file into (pattern, blob transform) pairs."""
+    rules = []
+    with open(path, 'rb') as f:
+        for number, line in enumerate(f, 1):
+            line = line.rstrip(b'\r\n')
+            if not line.strip() or line.lstrip().startswith(b'#'):
+                continue
+            glob, _, rule = line.strip().partition(b' ')
+            regex, separator, replacement = rule.partition(b'==>')
+            if not separator:
+                raise ValueError(f"{path}:{number}: expected '<pattern> <regex>==><replacement>'")
+            rules.append((glob.decode(), partial(replace_text, re.compile(regex, re.M), replacement)))
+    return rules
+
+
+def transform_blobs(contents: Dict[str, bytes], blobs: List[Tuple[str, Chain]],
+                    functions: List[Callable[[bytes], bytes]]) -> List[Tuple[str, Optional[bytes]]]:
+    """Apply transform chains to blobs whose contents the caller read.
+
+    Runs in a worker process, which starts no git commands of its own.
+    Returns the new object id and object of each blob, in order; the object
+    is None if the content did not change.
+    """
+    results = []
+    for oid, chain in blobs:
+        data = contents[oid]
+        for index in chain:
+            data = functions[index](data)
+        if data == contents[oid]:
+            results.append((oid, None))
+        else:
+            raw = b'blob %d\x00' % len(data) + data
+            results.append((hashlib.sha1(raw).hexdigest(), raw))
+    return results
+
+
+class BlobTransforms:
+    """Registered path and blob transforms, applied to whole histories with memoized results."""
+
+    def __init__(self, workers: int = 0, logger: Optional[logging.Logger] = None):
+        self.workers = workers or os.cpu_count() or 1
+        self.logger = logger or logging.getLogger(__name__)
+        self.path_rules: List[TransformRule] = []
+        self.blob_rules: List[TransformRule] = []
+        self.lock = threading.Lock()
+        self.executor: Optional[ProcessPoolExecutor] = None
+        self.reset()
+
+    def reset(self):
+        """Forget every memoized result; they depend on the registered transforms."""
+        self.paths: Dict[str, Tuple[Optional[str], Chain]] = {}  # path -> (new name, chain)
+        self.blobs: Dict[Tuple[str, Chain], str] = {}  # (blob, chain) -> new blob
+        self.trees: Dict[Tuple[str, str], Optional[str]] = {}  # (tree, path) -> new tree, None if empty
+        self.objects: Dict[str, bytes] = {}  # new trees and blobs
+        self.children: Dict[str, List[str]] = {}  # new tree -> the new objects it refers to
+
+    def add_path_transform(self, function: Callable[[str], Optional[str]], patterns: Iterable[str] = ('*',)):
+        """Register a path transform for the paths matching patterns."""
+        self.path_rules.append(TransformRule(function, list(patterns)))
+        self.reset()
+
+    def add_blob_transform(self, function: Callable[[bytes], bytes], patterns: Iterable[str] = ('*',)):
+        """Register a blob transform for the files whose paths match patterns."""
+        self.blob_rules.append(TransformRule(function, list(patterns)))
+        self.reset()
+
+    def drop(self, patterns: Iterable[str]):
+        """Drop the files matching patterns from the whole history."""
+        self.add_path_transform(drop_path, patterns)
+
+    @property
+    def active(self) -> bool:
+        return bool(self.path_rules or self.blob_rules)
+
+    def resolve_path(self, path: str) -> Tuple[Optional[str], Chain]:
+        """Return the new name of a file (None if it is dropped) and the blob transforms that apply to it."""
+        if path not in self.paths:
+            directory, _, name = path.rpartition('/')
+            new_path: Optional[str] = path
+            for rule in self.path_rules:
+                if any(path_matches(new_path, pattern) for pattern in rule.patterns):
+                    name = rule.function(new_path)
+                    if name is None:
+                        new_path = None
+                        break
+                    if '/' in name:
+                        raise ValueError(f"A path transform moved '{path}' out of its directory: {name}")
+                    new_path = f'{directory}/{name}' if directory else name
+            chain: Chain = ()
+            if new_path is not None:
+                chain = tuple(index for index, rule in enumerate(self.blob_rules)
+                              if any(path_matches(new_path, pattern) for pattern in rule.patterns))
+            self.paths[path] = (name if new_path is not None else None, chain)
+        return self.paths[path]
+
+    def run_blobs(self, repo_path: str, blobs: List[Tuple[str, Chain]]):
+        """Transform blobs not transformed yet, on the process pool if there is more than one chunk.
+
+        The blobs are read here, through the git runner; the pool only transforms them.
+        """
+        functions = [rule.function for rule in self.blob_rules]
+        chunks = [blobs[start:start + BLOB_CHUNK] for start in range(0, len(blobs), BLOB_CHUNK)]
+        contents = (read_objects(repo_path, sorted({oid for oid, _ in chunk})) for chunk in chunks)
+        if len(chunks) > 1 and self.workers > 1:
+            with self.lock:
+                if self.executor is None:
+                    self.executor = ProcessPoolExecutor(max_workers=self.workers)
+            results = self.executor.map(transform_blobs, contents, chunks, [functions] * len(chunks))
+        else:
+            results = [transform_blobs(chunk_contents, chunk, functions)
+                       for chunk_contents, chunk in zip(contents, chunks)]
+        changed = 0
+        for chunk, transformed in zip(chunks, results):
+            with self.lock:
+                for key, (new_oid, raw) in zip(chunk, transformed):
+                    self.blobs[key] = new_oid
+                    if raw is not None:
+                        self.objects[new_oid] = raw
+                        changed += 1
+        return changed
+
+    def transform_trees(self, repo_path: str, roots: Iterable[str], prefix: str) -> Dict[str, Optional[str]]:
+        """Return the new tree of each root tree; prefix is the monorepo path of the repository root."""
+        # Walk down level by level through the trees not seen at their path yet, one cat-file batch per level
+        order: List[Tuple[str, str]] = []
+        entries: Dict[Tuple[str, str], list] = {}
+        blobs: Set[Tuple[str, Chain]] = set()
+        pending = [(root, prefix) for root in set(roots)]
+        while pending:
+            pending = [key for key in dict.fromkeys(pending) if key not in self.trees and key not in entries]
+            if not pending:
+                break
+            raw_trees = read_objects(repo_path, sorted({sha for sha, _ in pending}))
+            next_level = []
+            for sha, path in pending:
+                entries[(sha, path)] = parse_tree(raw_trees[sha])
+                order.append((sha, path))
+                for mode, name, oid in entries[(sha, path)]:
+                    child_path = f"{path}/{name.decode(errors='surrogateescape')}" if path else name.decode(errors='surrogateescape')
+                    if mode == TREE_MODE:
+                        next_level.append((oid.hex(), child_path))
+                        continue
+                    new_name, chain = self.resolve_path(child_path)
+                    if new_name is not None and chain and mode in FILE_MODES and (oid.hex(), chain) not in self.blobs:
+                        blobs.add((oid.hex(), chain))
+            pending = next_level
+
+        changed = self.run_blobs(repo_path, sorted(blobs)) if blobs else 0
+
+        # Children sit at deeper paths, so they were found at later levels and are rebuilt first
+        for sha, path in reversed(order):
+            new_entries = []
+            new_children = []
+            for mode, name, oid in entries[(sha, path)]:
+                child_path = f"{path}/{name.decode(errors='surrogateescape')}" if path else name.decode(errors='surrogateescape')
+                if mode == TREE_MODE:
+                    new_oid = self.trees[(oid.hex(), child_path)]
+                    if new_oid is None:
+                        continue
+                else:
+                    new_name, chain = self.resolve_path(child_path)
+                    if new_name is None:
+                        continue
+                    name = new_name.encode(errors='surrogateescape')
+                    new_oid = self.blobs.get((oid.hex(), chain), oid.hex()) if chain and mode in FILE_MODES else oid.hex()
+                new_entries.append((mode, name, bytes.fromhex(new_oid)))
+                if new_oid in self.objects:
+                    new_children.append(new_oid)
+
+            if new_entries == entries[(sha, path)]:
+                new_tree = sha
+            elif not new_entries:
+                new_tree = None
+            else:
+                raw = build_tree(new_entries)
+                new_tree = hashlib.sha1(raw).hexdigest()
+                with self.lock:
+                    self.objects[new_tree] = raw
+                    self.children[new_tree] = new_children
+            with self.lock:
+                self.trees[(sha, path)] = new_tree
+
+        if order:
+            self.logger.info(f"Transformed {len(order)} trees and {len(blobs)} blobs ({changed} changed)")
+        return {root: self.trees[(root, prefix)] for root in roots}
+
+    def new_objects(self, trees: Iterable[Optional[str]]) -> Dict[str, bytes]:
+        """Return the trees and blobs the transforms created that the given trees refer to."""
+        objects = {}
+        stack = [tree for tree in trees if tree in self.objects]
+        while stack:
+            oid = stack.pop()
+            if oid in objects:
+                continue
+            objects[oid] = self.objects[oid]
+            stack.extend(self.children.get(oid, []))
+        return objects
+
+    def transform_history(self, repo_path: str, prefix: str = '') -> Dict[str, Optional[str]]:
+        """Rewrite every branch and tag of repo_path; returns the old -> new commit map, pruned commits as None.
+
+        prefix is where the repository root lives in the monorepo, e.g. the project directory.
+        """
+        revs = git(repo_path, ['rev-list', '--topo-order', '--reverse', '--branches', '--tags']).decode().split()
+        if not revs:
+            return {}
+        commits = read_commits(repo_path, revs, None)
+        new_trees = self.transform_trees(repo_path, {commit.tree for commit in commits}, prefix.strip('/'))
+        for commit in commits:
+            commit.subtree = new_trees[commit.tree] or EMPTY_TREE
+
+        result = stitch([commits])
+        tips = git(repo_path, ['for-each-ref', '--format=%(objectname) %(refname)', 'refs/heads', 'refs/tags']).decode()
+        emptied = [ref for sha, ref in (line.split() for line in tips.splitlines())
+                   if sha in result.commit_map and result.commit_map[sha] is None]
+        if emptied:
+            raise ValueError(f"No files are left on {', '.join(emptied)} after the transforms")
+
+        objects = {**self.new_objects(new_trees.values()), **result.objects}
+        if None in new_trees.values():
+            objects[EMPTY_TREE] = b'tree 0\x00'
+        apply_rewrite(repo_path, result.commit_map, objects)
+        rewritten = sum(1 for old, new in result.commit_map.items() if old != new)
+        self.logger.info(f"Rewrote {rewritten} of {len(revs)} commits with the transforms")
+        return pruned_as_none(result.commit_map)
+
+    def close(self):
+        """Stop the worker processes."""
+        if self.executor is not None:
+            self.executor.shutdown()
+            self.executor = None
+
+
+def build_transforms(drop: Iterable[str] = (), eol: Iterable[str] = (), replace_file: str = '',
+                     workers: int = 0, logger: Optional[logging.Logger] = None) -> BlobTransforms:
+    """Register the built-in transforms: dropped paths, line endings, and the rules of a replace file."""
+    transforms = BlobTransforms(workers, logger)
+    drop = list(drop)
+    if drop:
+        transforms.drop(drop)
+    eol = list(eol)
+    if eol:
+        transforms.add_blob_transform(normalize_eol, eol)
+    if replace_file:
+        for pattern, function in load_replace_rules(replace_file):
+            transforms.add_blob_transform(function, [pattern])
+    return transforms
+
+
+def main():
+    """Main entry point."""
+    parser = argparse.ArgumentParser(description="Drop files and transform blobs throughout the history of a repository")
+    parser.add_argument('repo', help='Repository to rewrite in place (every branch and tag)')
+    parser.add_argument('--prefix', default='', help='Monorepo path of the repository root, e.g. the project directory')
+    parser.add_argument('--drop', action='append', default=[], help='Glob of files to drop (repeatable)')
+    parser.add_argument('--eol', action='append', default=[], help='Glob of files to normalize to LF (repeatable)')
+    parser.add_argument('--replace', default='', help="File of '<pattern> <regex>==><replacement>' rules")
+    parser.add_argument('--workers', type=int, default=0, help='Worker processes (default: one per CPU)')
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+    try:
+        transforms = build_transforms(args.drop, args.eol, args.replace, args.workers)
+        if not transforms.active:
+            parser.error("give at least one of --drop, --eol and --replace")
+        try:
+            commit_map = transforms.transform_history(args.repo, args.prefix)
+        finally:
+            transforms.close()
+    except (OSError, ValueError) as e:
+        print(f"Error: {e}")
+        sys.exit(1)
+    except subprocess.CalledProcessError as e:
+        print(f"Error: {e.stderr.decode().strip()}")
+        sys.exit(1)
+    pruned = sum(1 for new in commit_map.values() if new is None)
+    print(f"{len(commit_map)} commits rewritten, {pruned} pruned")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,272 @@
+#!/usr/bin/env python3
+"""
+Commit Map Index
+
+Keeps the source -> target commit maps of every split in a local SQLite
+database, per run and per target repository, so that a monorepo SHA can be
+translated into its `<project>-app` counterpart (and back) long after the
+temporary clones are gone. Abbreviated SHAs are looked up as an index range
+scan, not by reading commit-map files.
+
+Usage:
+    python commit_index.py lookup SHA [--target fractol-app] [--run ID] [--json]
+    python commit_index.py reverse SHA [--target fractol-app] [--run ID] [--json]
+    python commit_index.py runs [--json]
+
+Without --run, lookups answer from the newest run that has the target.
+"""
+
+import os
+import sys
+import json
+import time
+import sqlite3
+import argparse
+from contextlib import contextmanager
+from typing import Iterable, List, Dict, Optional, Tuple
+
+
+DEFAULT_INDEX_PATH = 'commit_index.db'
+
+# SHAs per lookup statement, well below SQLite's bound-parameter limit
+QUERY_BATCH = 400
+
+INDEX_SCHEMA = [
+    """
+    CREATE TABLE IF NOT EXISTS runs (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        source_repo_url TEXT NOT NULL,
+        mode TEXT NOT NULL,
+        created_at REAL NOT NULL
+    )
+    """,
+    """
+    CREATE TABLE IF NOT EXISTS commit_map (
+        source_sha TEXT NOT NULL,
+        target TEXT NOT NULL,
+        run_id INTEGER NOT NULL,
+        target_sha TEXT,
+        PRIMARY KEY (source_sha, target, run_id)
+    ) WITHOUT ROWID
+    """,
+    'CREATE INDEX IF NOT EXISTS commit_map_target_sha ON commit_map (target_sha)',
+    'CREATE INDEX IF NOT EXISTS commit_map_run_target ON commit_map (run_id, target)',
+    """
+    CREATE TABLE IF NOT EXISTS sync_state (
+        source_repo_url TEXT NOT NULL,
+        target TEXT NOT NULL,
+        target_sha TEXT NOT NULL,
+        run_id INTEGER NOT NULL,
+        updated_at REAL NOT NULL,
+        PRIMARY KEY (source_repo_url, target)
+    )
+    """,
+]
+
+
+def prefix_range(sha: str) -> Tuple[str, str]:
+    """Return the [low, high) range of full SHAs that start with sha."""
+    sha = sha.lower()
+    # 'g' sorts after every hex digit
+    return sha, f'{sha}g'
+
+
+class CommitIndex:
+    """SQLite store of source -> target commit maps, one set per split run."""
+
+    def __init__(self, db_path: str = DEFAULT_INDEX_PATH):
+        self.db_path = db_path
+        with self.connection() as conn:
+            conn.execute('PRAGMA journal_mode=WAL')
+            for statement in INDEX_SCHEMA:
+                conn.execute(statement)
+
+    @contextmanager
+    def connection(self):
+        """Open an autocommit connection; bulk writes use an explicit transaction."""
+        conn = sqlite3.connect(self.db_path, timeout=30, isolation_level=None)
+        conn.row_factory = sqlite3.Row
+        try:
+            yield conn
+        finally:
+            conn.close()
+
+    def start_run(self, source_repo_url: str, mode: str) -> int:
+        """Register a split run and return its id."""
+        with self.connection() as conn:
+            cursor = conn.execute(
+                'INSERT INTO runs (source_repo_url, mode, created_at) VALUES (?, ?, ?)',
+                (source_repo_url, mode, time.time())
+            )
+            return cursor.lastrowid
+
+    def record(self, run_id: int, target: str, commit_map: Dict[str, Optional[str]]):
+        """Store the commit map of one target for a run, replacing what the run stored before."""
+        with self.connection() as conn:
+            conn.execute('BEGIN IMMEDIATE')
+            conn.execute('DELETE FROM commit_map WHERE run_id = ? AND target = ?', (run_id, target))
+            conn.executemany(
+                'INSERT INTO commit_map (source_sha, target, run_id, target_sha) VALUES (?, ?, ?, ?)',
+                ((source_sha, target, run_id, target_sha) for source_sha, target_sha in commit_map.items())
+            )
+            conn.execute('COMMIT')
+
+    def query(self, column: str, sha: str, target: Optional[str], run_id: Optional[int]) -> List[Dict]:
+        """Return the rows whose column starts with sha, newest run per target unless run_id is given."""
+        return self.query_many(column, [sha], target, run_id)[sha]
+
+    def query_many(self, column: str, shas: Iterable[str], target: Optional[str],
+                   run_id: Optional[int]) -> Dict[str, List[Dict]]:
+        """Answer query() for many SHAs over one connection, QUERY_BATCH SHAs per statement.
+
+        Full SHAs are matched with IN (...), abbreviated ones as index ranges.
+        """
+        shas = list(dict.fromkeys(shas))
+        filters = ''
+        params: list = []
+        if target:
+            filters += ' AND target = ?'
+            params.append(target)
+        if run_id:
+            filters += ' AND run_id = ?'
+            params.append(run_id)
+
+        results: Dict[str, List[Dict]] = {}
+        with self.connection() as conn:
+            for start in range(0, len(shas), QUERY_BATCH):
+                batch = shas[start:start + QUERY_BATCH]
+                full = [sha.lower() for sha in batch if len(sha) == 40]
+                ranges = [prefix_range(sha) for sha in batch if len(sha) != 40]
+                matches = []
+                batch_params: list = []
+                if full:
+                    matches.append(f'{column} IN ({", ".join("?" * len(full))})')
+                    batch_params.extend(full)
+                for low, high in ranges:
+                    matches.append(f'({column} >= ? AND {column} < ?)')
+                    batch_params.extend((low, high))
+                sql = f'SELECT * FROM commit_map WHERE ({" OR ".join(matches)}){filters} ORDER BY run_id DESC'
+                rows = [dict(row) for row in conn.execute(sql, batch_params + params).fetchall()]
+
+                for sha in batch:
+                    prefix = sha.lower()
+                    matching = [row for row in rows if row[column] and row[column].startswith(prefix)]
+                    latest_run = {}
+                    for row in matching:
+                        latest_run.setdefault(row['target'], row['run_id'])
+                    results[sha] = [row for row in matching if row['run_id'] == latest_run[row['target']]]
+        return results
+
+    def lookup(self, source_sha: str, target: Optional[str] = None, run_id: Optional[int] = None) -> List[Dict]:
+        """Return the target commits a (possibly abbreviated) source SHA maps to; pruned ones have no target_sha."""
+        return self.query('source_sha', source_sha, target, run_id)
+
+    def reverse(self, target_sha: str, target: Optional[str] = None, run_id: Optional[int] = None) -> List[Dict]:
+        """Return the source commits that map to a (possibly abbreviated) target SHA."""
+        return self.query('target_sha', target_sha, target, run_id)
+
+    def lookup_many(self, source_shas: Iterable[str], target: Optional[str] = None,
+                    run_id: Optional[int] = None) -> Dict[str, List[Dict]]:
+        """lookup() for many SHAs at once, keyed by SHA."""
+        return self.query_many('source_sha', source_shas, target, run_id)
+
+    def reverse_many(self, target_shas: Iterable[str], target: Optional[str] = None,
+                     run_id: Optional[int] = None) -> Dict[str, List[Dict]]:
+        """reverse() for many SHAs at once, keyed by SHA."""
+        return self.query_many('target_sha', target_shas, target, run_id)
+
+    def sync_boundary(self, source_repo_url: str, target: str) -> List[str]:
+        """Return target commits the monorepo already has: the last synced one and those of newer splits.
+
+        Only the newest split run after the last sync is read; everything older
+        is reachable from it or from the synced commit.
+        """
+        with self.connection() as conn:
+            state = conn.execute('SELECT * FROM sync_state WHERE source_repo_url = ? AND target = ?',
+                                 (source_repo_url, target)).fetchone()
+            synced_run = state['run_id'] if state else 0
+            split_run = conn.execute(
+                'SELECT MAX(runs.id) FROM runs JOIN commit_map ON commit_map.run_id = runs.id '
+                "WHERE runs.source_repo_url = ? AND runs.mode != 'sync' AND commit_map.target = ? AND runs.id > ?",
+                (source_repo_url, target, synced_run)
+            ).fetchone()[0]
+            boundary = [state['target_sha']] if state else []
+            if split_run:
+                rows = conn.execute('SELECT DISTINCT target_sha FROM commit_map '
+                                    'WHERE run_id = ? AND target = ? AND target_sha IS NOT NULL',
+                                    (split_run, target)).fetchall()
+                boundary.extend(row['target_sha'] for row in rows)
+        return boundary
+
+    def record_sync(self, source_repo_url: str, target: str, target_sha: str, run_id: int):
+        """Remember the newest target commit a sync run brought into the monorepo."""
+        with self.connection() as conn:
+            conn.execute(
+                'INSERT OR REPLACE INTO sync_state (source_repo_url, target, target_sha, run_id, updated_at) '
+                'VALUES (?, ?, ?, ?, ?)',
+                (source_repo_url, target, target_sha, run_id, time.time())
+            )
+
+    def runs(self) -> List[Dict]:
+        """Return every run with the number of targets and commits it stored."""
+        with self.connection() as conn:
+            rows = conn.execute(
+                'SELECT runs.*, COUNT(DISTINCT commit_map.target) AS targets, COUNT(commit_map.source_sha) AS commits '
+                'FROM runs LEFT JOIN commit_map ON commit_map.run_id = runs.id GROUP BY runs.id ORDER BY runs.id'
+            ).fetchall()
+        return [dict(row) for row in rows]
+
+
+def print_rows(rows: List[Dict], as_json: bool):
+    """Print lookup results as a table or as JSON."""
+    if as_json:
+        print(json.dumps(rows, indent=2))
+        return
+    if not rows:
+        print("No matching commits")
+        return
+    for row in sorted(rows, key=lambda row: (row['target'], row['source_sha'])):
+        target_sha = row['target_sha'] or '(pruned)'
+        print(f"{row['target']:<24} {row['source_sha']} -> {target_sha}  run {row['run_id']}")
+
+
+def main():
+    """Main entry point."""
+    parser = argparse.ArgumentParser(description="Look up commits in the split commit map index")
+    parser.add_argument('--db', default=os.getenv('COMMIT_INDEX') or DEFAULT_INDEX_PATH, help='Path of the index database')
+    subparsers = parser.add_subparsers(dest='command', required=True)
+
+    for command, help_text in [('lookup', 'Translate a monorepo SHA into target SHAs'),
+                               ('reverse', 'Translate a target SHA back into monorepo SHAs')]:
+        command_parser = subparsers.add_parser(command, help=help_text)
+        command_parser.add_argument('sha', help='Full or abbreviated SHA')
+        command_parser.add_argument('--target', help='Only this target repository, e.g. fractol-app')
+        command_parser.add_argument('--run', type=int, help='Only this run')
+        command_parser.add_argument('--json', action='store_true', help='Print JSON')
+
+    runs_parser = subparsers.add_parser('runs', help='List recorded runs')
+    runs_parser.add_argument('--json', action='store_true', help='Print JSON')
+    args = parser.parse_args()
+
+    if not os.path.exists(args.db):
+        print(f"Error: no commit index at {args.db}")
+        sys.exit(1)
+    index = CommitIndex(args.db)
+
+    if args.command == 'runs':
+        runs = index.runs()
+        if args.json:
+            print(json.dumps(runs, indent=2))
+            return
+        for run in runs:
+            created = time.strftime('%Y-%m-%d %H:%M:%S', time.localtime(run['created_at']))
+            print(f"{run['id']:>4}  {created}  {run['mode']:<8} {run['targets']} targets, "
+                  f"{run['commits']} commits  {run['source_repo_url']}")
+    elif args.command == 'lookup':
+        print_rows(index.lookup(args.sha, args.target, args.run), args.json)
+    else:
+        print_rows(index.reverse(args.sha, args.target, args.run), args.json)
+
+
+if __name__ == "__main__":
+    main()
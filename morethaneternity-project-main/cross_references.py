@@ -0,0 +1,184 @@
+#!/usr/bin/env python3
+"""
+Cross-Project Commit Reference Rewriting
+
+After a split, commit messages still mention monorepo SHAs ("fixes the
+leak from 1a2b3c4"). A SHA whose commit lives on in the same target was
+already rewritten by git filter-repo; one whose commit went to another
+target, or that the sharded rewriter left alone, still points into the
+monorepo.
+
+This pass rewrites those references in all targets of a run at once:
+
+    - a SHA of a commit kept in the same target becomes its new SHA
+    - a SHA of a commit kept in another target becomes `<target>@<new SHA>`
+    - anything else is left as it is
+
+References are resolved through the commit index of the run. Rewriting a
+message changes the commit's SHA and therefore the SHAs every later
+reference needs, so the commits of all targets are rewritten together, in
+the topological order of the monorepo: a message can only mention older
+commits, and those have their final SHA by the time it is reached.
+Abbreviated SHAs keep their length. The SHA-like words of all messages are
+resolved up front, in batched index queries.
+
+With submodule wiring, project commits pin common-libs commits through a
+gitlink, and rewriting common-libs changes those commits too. Pass the
+submodule path and the gitlink of every rewritten commit is moved to the
+final SHA of the commit it pinned; at equal positions a commit that pins
+another one sorts after the commits without a gitlink, so the pinned commit
+is always final first.
+"""
+
+import re
+import hashlib
+import logging
+from typing import List, Dict, Optional, Tuple
+
+from commit_index import CommitIndex
+from history_rewrite import git, read_commits, read_objects, apply_rewrite
+from submodule_wiring import GITLINK_MODE, parse_tree, build_tree
+
+
+# Hex words that are long enough to be abbreviated SHAs
+SHA_PATTERN = re.compile(rb'\b[0-9a-f]{7,40}\b')
+
+
+class CrossReferenceRewriter:
+    """Rewrite monorepo SHA references in the commit messages of every target of a run."""
+
+    def __init__(self, source_repo_path: str, index: CommitIndex, run_id: int,
+                 logger: Optional[logging.Logger] = None, submodule_path: Optional[str] = None):
+        self.source_repo_path = source_repo_path
+        self.index = index
+        self.run_id = run_id
+        self.logger = logger or logging.getLogger(__name__)
+        self.submodule_path = submodule_path.strip('/').encode() if submodule_path else None
+        self.final: Dict[str, Dict[str, str]] = {}  # target -> first-pass SHA -> final SHA
+        self.rewritten: Dict[str, str] = {}  # first-pass SHA -> final SHA, across targets
+        self.resolved: Dict[Tuple[str, bytes], Optional[bytes]] = {}
+        self.sources: Dict[str, List[Dict]] = {}  # SHA-like word -> index rows with it as source SHA
+        self.targets: Dict[str, List[Dict]] = {}  # SHA-like word -> index rows with it as target SHA
+        self.references = 0
+        self.gitlinks = 0
+
+    def load(self, messages: List[bytes]):
+        """Look up every SHA-like word of messages in the index, a batch per query."""
+        tokens = sorted({token.decode() for message in messages for token in SHA_PATTERN.findall(message)})
+        self.sources = self.index.lookup_many(tokens, run_id=self.run_id)
+        self.targets = self.index.reverse_many(tokens, run_id=self.run_id)
+
+    def resolve(self, target: str, token: bytes) -> Optional[bytes]:
+        """Return the replacement for one SHA-like word in a message of target, or None to keep it."""
+        key = (target, token)
+        if key not in self.resolved:
+            self.resolved[key] = self.lookup(target, token.decode())
+        return self.resolved[key]
+
+    def lookup(self, target: str, sha: str) -> Optional[bytes]:
+        """Resolve sha through the index: first as a rewritten SHA of target, then as a monorepo SHA."""
+        rewritten = {row['target_sha'] for row in self.targets.get(sha, []) if row['target'] == target}
+        if len(rewritten) == 1:
+            final = self.final[target].get(rewritten.pop())
+            return final[:len(sha)].encode() if final else None
+
+        rows = self.sources.get(sha, [])
+        if len({row['source_sha'] for row in rows}) != 1:
+            return None  # unknown or ambiguous
+        kept = {row['target']: row['target_sha'] for row in rows if row['target_sha']}
+        if target in kept:
+            final = self.final[target].get(kept[target])
+            return final[:len(sha)].encode() if final else None
+        for other in sorted(kept):
+            final = self.final.get(other, {}).get(kept[other])
+            if final:
+                return f'{other}@{final[:len(sha)]}'.encode()
+        return None
+
+    def rewrite_message(self, target: str, message: bytes) -> bytes:
+        """Replace every resolvable SHA in one commit message."""
+        def replace(match):
+            replacement = self.resolve(target, match.group())
+            if replacement is None or replacement == match.group():
+                return match.group()
+            self.references += 1
+            return replacement
+        return SHA_PATTERN.sub(replace, message)
+
+    def read_gitlinks(self, repo_path: str, commits: List) -> Dict[str, Tuple[bytes, str]]:
+        """Return the raw root tree and pinned commit of every commit with a gitlink at the submodule path."""
+        if not self.submodule_path:
+            return {}
+        trees = read_objects(repo_path, sorted({commit.tree for commit in commits}))
+        gitlinks = {}
+        for commit in commits:
+            for mode, name, oid in parse_tree(trees[commit.tree]):
+                if mode == GITLINK_MODE and name == self.submodule_path:
+                    gitlinks[commit.sha] = (trees[commit.tree], oid.hex())
+        return gitlinks
+
+    def repin(self, raw_tree: bytes, pin: str) -> bytes:
+        """Return raw_tree as a tree object with the gitlink at the submodule path pointing at pin."""
+        entries = [(mode, name, bytes.fromhex(pin) if mode == GITLINK_MODE and name == self.submodule_path else oid)
+                   for mode, name, oid in parse_tree(raw_tree)]
+        return build_tree(entries)
+
+    def rewrite(self, targets: Dict[str, Tuple[str, Dict[str, Optional[str]]]]) -> Dict[str, Dict[str, str]]:
+        """Rewrite every target; targets maps a name to (repo_path, source -> target commit map).
+
+        Returns the first-pass -> final commit map of each target.
+        """
+        source_order = git(self.source_repo_path, ['rev-list', '--topo-order', '--reverse', '--all']).decode().split()
+        position = {sha: index for index, sha in enumerate(source_order)}
+
+        queue: List[Tuple[int, bool, int, int, str, object]] = []
+        gitlinks: Dict[str, Tuple[bytes, str]] = {}
+        for target_index, (target, (repo_path, commit_map)) in enumerate(targets.items()):
+            # Each target commit sorts at the position of the first monorepo commit that produced it
+            created_at: Dict[str, int] = {}
+            for old, new in commit_map.items():
+                if new and old in position:
+                    created_at[new] = min(created_at.get(new, len(source_order)), position[old])
+
+            revs = git(repo_path, ['rev-list', '--topo-order', '--reverse', '--branches', '--tags']).decode().split()
+            commits = read_commits(repo_path, revs, None)
+            gitlinks.update(self.read_gitlinks(repo_path, commits))
+            order: Dict[str, int] = {}
+            for local_index, commit in enumerate(commits):
+                order[commit.sha] = max([created_at.get(commit.sha, -1)] + [order[parent] for parent in commit.parents])
+                queue.append((order[commit.sha], commit.sha in gitlinks, target_index, local_index, target, commit))
+            self.final[target] = {}
+
+        self.load([item[-1].message for item in queue])
+        objects: Dict[str, Dict[str, bytes]] = {target: {} for target in targets}
+        for _, _, _, _, target, commit in sorted(queue, key=lambda item: item[:4]):
+            final = self.final[target]
+            parents = [final[parent] for parent in commit.parents]
+            message = self.rewrite_message(target, commit.message)
+            tree = commit.tree
+            if commit.sha in gitlinks:
+                raw_tree, pin = gitlinks[commit.sha]
+                if self.rewritten.get(pin, pin) != pin:
+                    data = self.repin(raw_tree, self.rewritten[pin])
+                    tree = hashlib.sha1(data).hexdigest()
+                    objects[target][tree] = data
+                    self.gitlinks += 1
+            if message == commit.message and parents == commit.parents and tree == commit.tree:
+                final[commit.sha] = self.rewritten[commit.sha] = commit.sha
+                continue
+
+            body = f'tree {tree}\n'.encode()
+            body += b''.join(f'parent {parent}\n'.encode() for parent in parents)
+            body += commit.headers + b'\n\n' + message
+            data = b'commit %d\x00' % len(body) + body
+            final[commit.sha] = self.rewritten[commit.sha] = hashlib.sha1(data).hexdigest()
+            objects[target][final[commit.sha]] = data
+
+        for target, (repo_path, _) in targets.items():
+            if objects[target]:
+                apply_rewrite(repo_path, self.final[target], objects[target])
+
+        changed = sum(len(target_objects) for target_objects in objects.values())
+        self.logger.info(f"Rewrote {self.references} cross-project commit references and {self.gitlinks} "
+                         f"submodule pins; {changed} objects changed across {len(targets)} targets")
+        return self.final
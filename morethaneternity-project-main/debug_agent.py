@@ -51,15 +51,16 @@ def test_github_connection():
     """Test GitHub connection."""
     print("\nTesting GitHub connection...")
     try:
-        from github import Github
+        from github_cache import GitHubCache, DEFAULT_GITHUB_CACHE
         token = os.getenv('GITHUB_TOKEN')
         if not token:
             print("❌ No GitHub token found")
             return
         
-        github = Github(token)
-        user = github.get_user()
-        print(f"✅ GitHub connection successful: {user.login}")
+        github = GitHubCache(os.getenv('GITHUB_API_URL') or 'https://api.github.com', token,
+                             os.getenv('GITHUB_CACHE', DEFAULT_GITHUB_CACHE), max_age=0)
+        user = github.user()
+        print(f"✅ GitHub connection successful: {user['login']} ({github.summary()})")
     except Exception as e:
         print(f"❌ GitHub connection failed: {e}")
 
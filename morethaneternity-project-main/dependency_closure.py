@@ -0,0 +1,283 @@
+#!/usr/bin/env python3
+"""
+Common Library Dependency Closure
+
+Builds an include/symbol dependency graph between projects and the common
+library from the blobs at a ref of the mirror, without checking anything
+out, and returns the files of the common library each project actually
+needs:
+
+    - `#include "..."` lines, resolved against the including file and the
+      project's Makefile -I paths
+    - Makefile -I/-L paths and `make -C` directories that point into the
+      common library (they pull in its Makefile)
+    - calls to functions defined in common library sources, followed
+      transitively through the library itself
+
+Sources the common library's Makefile names (e.g. in SRC) are not followed;
+instead trim_callback() removes the ones outside the closure from the
+Makefile while the history is rewritten, so the kept library still builds.
+
+Usage:
+    python dependency_closure.py REPO --common libft --project fractol [--project printf] [--ref HEAD]
+"""
+
+import re
+import sys
+import logging
+import argparse
+import posixpath
+import subprocess
+from collections import deque
+from typing import List, Dict, Set, Optional
+
+from history_rewrite import git
+
+
+SOURCE_SUFFIXES = ('.c', '.h')
+MAKEFILE_NAMES = ('Makefile', 'makefile', 'GNUmakefile')
+
+INCLUDE_PATTERN = re.compile(r'^\s*#\s*include\s*"([^"]+)"', re.M)
+ASSIGNMENT_PATTERN = re.compile(r'^\s*([A-Za-z_][A-Za-z0-9_]*)\s*[:?+]?=\s*(.*?)\s*$', re.M)
+VARIABLE_PATTERN = re.compile(r'\$[({]([A-Za-z_][A-Za-z0-9_]*)[)}]')
+FLAG_PATTERN = re.compile(r'-([IL])\s*([^\s;]+)')
+MAKE_DIR_PATTERN = re.compile(r'-C\s*([^\s;]+)')
+# A function definition starts at column 0 and has no ';' (that would be a prototype)
+FUNCTION_PATTERN = re.compile(r'^[A-Za-z_][\w \t*]*?\b([A-Za-z_]\w*)\s*\([^;{]*\)\s*\{?\s*$', re.M)
+CALL_PATTERN = re.compile(r'\b([A-Za-z_]\w*)\s*\(')
+COMMENT_PATTERN = re.compile(r'/\*.*?\*/|//[^\n]*', re.S)
+COMMENT_LINE_PATTERN = re.compile(r'#[^\n]*')
+CONTINUATION_ONLY_PATTERN = rb'(?m)^[ \t]+\\[ \t]*\n'  # a source list line left with only its backslash
+
+
+def is_relevant(path: str) -> bool:
+    """Return True for the files the graph is built from."""
+    return path.endswith(SOURCE_SUFFIXES) or posixpath.basename(path) in MAKEFILE_NAMES
+
+
+def expand_variables(value: str, variables: Dict[str, str]) -> str:
+    """Expand $(VAR) references from simple Makefile assignments."""
+    for _ in range(10):
+        expanded = VARIABLE_PATTERN.sub(lambda match: variables.get(match.group(1), ''), value)
+        if expanded == value:
+            break
+        value = expanded
+    return value
+
+
+class DependencyClosure:
+    """Dependency graph of projects on a common library, read from blobs at one ref."""
+
+    def __init__(self, repo_path: str, common_path: str, ref: str = 'HEAD',
+                 logger: Optional[logging.Logger] = None):
+        self.repo_path = repo_path
+        self.common_path = common_path.strip('/')
+        self.ref = ref
+        self.logger = logger or logging.getLogger(__name__)
+        self.files: Dict[str, str] = {}
+        self.edges: Dict[str, Set[str]] = {}
+        self.definitions: Dict[str, str] = {}  # function name -> common file defining it
+
+    def load(self, projects: List[str]):
+        """Read every relevant blob under the projects and the common library in one batch."""
+        prefixes = [f'{path.strip("/")}/' for path in [self.common_path, *projects]]
+        listing = git(self.repo_path, ['ls-tree', '-r', self.ref, '--', *prefixes]).decode()
+
+        entries = []
+        for line in listing.splitlines():
+            meta, path = line.split('\t', 1)
+            mode, kind, sha = meta.split()
+            if kind == 'blob' and is_relevant(path):
+                entries.append((path, sha))
+
+        batch = git(self.repo_path, ['cat-file', '--batch'], stdin=''.join(f'{sha}\n' for _, sha in entries).encode())
+        offset = 0
+        for path, _ in entries:
+            header_end = batch.index(b'\n', offset)
+            size = int(batch[offset:header_end].split()[2])
+            self.files[path] = batch[header_end + 1:header_end + 1 + size].decode('utf-8', errors='replace')
+            offset = header_end + 1 + size + 1
+
+        for path, content in self.files.items():
+            if self.in_common(path) and path.endswith('.c'):
+                for name in FUNCTION_PATTERN.findall(COMMENT_PATTERN.sub('', content)):
+                    self.definitions.setdefault(name, path)
+
+        for path in self.files:
+            self.edges[path] = self.dependencies(path)
+
+        self.logger.info(f"Dependency graph: {len(self.files)} files, "
+                         f"{sum(len(targets) for targets in self.edges.values())} edges, "
+                         f"{len(self.definitions)} common functions")
+
+    def in_common(self, path: str) -> bool:
+        """Return True if path lies inside the common library."""
+        return path == self.common_path or path.startswith(f'{self.common_path}/')
+
+    def project_of(self, path: str) -> str:
+        """Return the top-level directory a path belongs to."""
+        return path.split('/', 1)[0]
+
+    def makefile_dirs(self, directory: str) -> List[str]:
+        """Return the -I/-L/-C directories of the Makefile in directory, relative to the repo root."""
+        makefile = next((posixpath.join(directory, name) for name in MAKEFILE_NAMES
+                         if posixpath.join(directory, name) in self.files), None)
+        if makefile is None:
+            return []
+        content = self.files[makefile]
+        variables = {name: value for name, value in ASSIGNMENT_PATTERN.findall(content)}
+        content = expand_variables(content, variables)
+        dirs = [value for _, value in FLAG_PATTERN.findall(content)] + MAKE_DIR_PATTERN.findall(content)
+        return [posixpath.normpath(posixpath.join(directory, value)) for value in dirs]
+
+    def resolve_include(self, path: str, include: str) -> Optional[str]:
+        """Resolve an #include the way the compiler would, falling back to the common library name."""
+        search_dirs = [posixpath.dirname(path)] + self.makefile_dirs(self.project_of(path))
+        for directory in search_dirs:
+            candidate = posixpath.normpath(posixpath.join(directory, include))
+            if candidate in self.files:
+                return candidate
+
+        # '#include "libft/libft.h"' names the library by its directory
+        library_name = posixpath.basename(self.common_path)
+        parts = posixpath.normpath(include).split('/')
+        if library_name in parts:
+            rest = '/'.join(parts[parts.index(library_name) + 1:])
+            candidate = posixpath.join(self.common_path, rest)
+            if candidate in self.files:
+                return candidate
+        return None
+
+    def dependencies(self, path: str) -> Set[str]:
+        """Return the files path depends on directly."""
+        content = self.files[path]
+        targets = set()
+
+        if posixpath.basename(path) in MAKEFILE_NAMES:
+            for directory in self.makefile_dirs(posixpath.dirname(path)):
+                if self.in_common(directory):
+                    targets.update(
+                        posixpath.join(directory, name) for name in MAKEFILE_NAMES
+                        if posixpath.join(directory, name) in self.files
+                    )
+            return targets
+
+        code = COMMENT_PATTERN.sub('', content)
+        for include in INCLUDE_PATTERN.findall(code):
+            resolved = self.resolve_include(path, include)
+            if resolved:
+                targets.add(resolved)
+
+        if path.endswith('.h'):
+            # Prototypes in a header declare functions, they do not use them
+            return targets
+        for name in set(CALL_PATTERN.findall(code)):
+            defining_file = self.definitions.get(name)
+            if defining_file and defining_file != path:
+                targets.add(defining_file)
+        return targets
+
+    def closure(self, project: str) -> List[str]:
+        """Return the common library files reachable from a project, sorted."""
+        project = project.strip('/')
+        queue = deque(path for path in self.files if self.project_of(path) == project)
+        seen = set(queue)
+        while queue:
+            for target in self.edges.get(queue.popleft(), ()):
+                if target not in seen:
+                    seen.add(target)
+                    queue.append(target)
+        return sorted(path for path in seen if self.in_common(path))
+
+    def named_sources(self, makefile: str) -> Set[str]:
+        """Return the common sources a Makefile names explicitly, with or without their .c suffix."""
+        words = set(re.findall(r'[\w./-]+', COMMENT_LINE_PATTERN.sub('', self.files[makefile])))
+        return {
+            path for path in self.files
+            if self.in_common(path) and path.endswith('.c')
+            and ({posixpath.basename(path), posixpath.basename(path)[:-2]} & words)
+        }
+
+    def missing_sources(self, files: List[str]) -> Dict[str, List[str]]:
+        """Return the common sources each kept common Makefile names but files leaves out."""
+        kept = set(files)
+        missing = {}
+        for makefile in files:
+            if posixpath.basename(makefile) in MAKEFILE_NAMES and makefile in self.files:
+                left_out = sorted(self.named_sources(makefile) - kept)
+                if left_out:
+                    missing[makefile] = left_out
+        return missing
+
+
+def source_list_pattern(sources: List[str]) -> bytes:
+    """Return a regex matching the names of sources in a Makefile, with or without their .c suffix."""
+    names = b'|'.join(re.escape(posixpath.basename(path)[:-2].encode()) for path in sorted(sources))
+    return rb'(?<=[\s=])(?:' + names + rb')(?:\.c)?(?=[\s\\]|$)'
+
+
+def trim_named_sources(content: bytes, sources: List[str]) -> bytes:
+    """Remove sources from the source lists of a Makefile, and lines left holding only a continuation."""
+    if not sources:
+        return content
+    content = re.sub(source_list_pattern(sources), b'', content)
+    return re.sub(CONTINUATION_ONLY_PATTERN, b'', content)
+
+
+def trim_callback(makefiles: Dict[str, List[str]], replace_text: bool = False) -> str:
+    """Return a git filter-repo --file-info-callback body that does trim_named_sources() on Makefiles.
+
+    makefiles maps each Makefile path, as it is named after the rewrite, to
+    the sources to remove from it. Once a --file-info-callback is given,
+    filter-repo leaves --replace-text to it, so with replace_text the body
+    applies it to every text file as well. Needs git filter-repo 2.45 or newer.
+    """
+    patterns = {path.encode(): source_list_pattern(sources) for path, sources in makefiles.items() if sources}
+    lines = [
+        f'patterns = {patterns!r}',
+        f'if filename not in patterns and not {replace_text!r}:',
+        '    return (filename, mode, blob_id)',
+        'key = (filename in patterns and filename, blob_id)',
+        'if key not in value.data:',
+        '    contents = value.get_contents_by_identifier(blob_id)',
+        '    new_contents = contents',
+        f'    if {replace_text!r} and not value.is_binary(contents):',
+        '        new_contents = value.apply_replace_text(new_contents)',
+        '    if filename in patterns:',
+        '        new_contents = re.sub(patterns[filename], b"", new_contents)',
+        f'        new_contents = re.sub({CONTINUATION_ONLY_PATTERN!r}, b"", new_contents)',
+        '    value.data[key] = blob_id if new_contents == contents else value.insert_file_with_contents(new_contents)',
+        'return (filename, mode, value.data[key])',
+    ]
+    return '\n'.join(lines) + '\n'
+
+
+def main():
+    """Main entry point."""
+    parser = argparse.ArgumentParser(description="Show the common library files each project needs")
+    parser.add_argument('repo', help='Path of the repository (a bare mirror is fine)')
+    parser.add_argument('--common', required=True, help='Path of the common library, e.g. libft')
+    parser.add_argument('--project', action='append', required=True, help='Project directory (repeatable)')
+    parser.add_argument('--ref', default='HEAD', help='Ref to read the blobs from')
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+    try:
+        closure = DependencyClosure(args.repo, args.common, args.ref)
+        closure.load(args.project)
+    except subprocess.CalledProcessError as e:
+        print(f"Error: {e.stderr.decode().strip()}")
+        sys.exit(1)
+
+    common_files = [path for path in closure.files if closure.in_common(path)]
+    for project in args.project:
+        files = closure.closure(project)
+        print(f"{project}: {len(files)} of {len(common_files)} common files")
+        for path in files:
+            print(f"  {path}")
+        for makefile, sources in closure.missing_sources(files).items():
+            print(f"  {makefile}: {len(sources)} sources are trimmed from it")
+
+
+if __name__ == "__main__":
+    main()
@@ -7,7 +7,7 @@ import os
 import subprocess
 import tempfile
 import shutil
-from split_repo_agent import RepoSplitter, RepoSplitterConfig
+from split_repo_agent import RepoSplitter, RepoSplitterConfig, load_env_options, load_target_options
 
 def force_update_repositories():
     """Force update existing repositories with correct content."""
@@ -19,16 +19,18 @@ def force_update_repositories():
     config = RepoSplitterConfig(
         source_repo_url=os.getenv('SOURCE_REPO_URL'),
         mode='project',
-        projects=os.getenv('PROJECTS', '').split(','),
-        common_path=os.getenv('COMMON_PATH'),
         org=os.getenv('ORG'),
         github_token=os.getenv('GITHUB_TOKEN'),
-        dry_run=False
+        dry_run=False,
+        **load_target_options('project'),
+        **load_env_options()
     )
     
     with RepoSplitter(config) as splitter:
         # Clone source repo
         splitter.clone_source_repo()
+        # PROJECTS=auto: the same targets, from the same manifest, as the splitter
+        splitter.resolve_targets(splitter.source_repo_path)
         
         # Force update each project
         for project in config.projects:
@@ -47,11 +49,8 @@ def force_update_repositories():
             # Clone the mirror repo
             splitter.run_git_command(['git', 'clone', splitter.source_repo_path, project_repo_path])
             
-            # Change to the project repo directory
-            os.chdir(project_repo_path)
-            
             # Check if the project directory exists
-            if not os.path.exists(project):
+            if not os.path.exists(os.path.join(project_repo_path, project)):
                 print(f"Warning: Project directory '{project}' not found")
                 continue
             
@@ -61,21 +60,15 @@ def force_update_repositories():
                 '--path', f'{project}/',
                 '--path-rename', f'{project}/:',
                 '--force'
-            ])
+            ], cwd=project_repo_path)
             
             # Check if main branch exists after filtering
-            result = splitter.run_git_command(['git', 'branch', '--list', 'main'], check=False)
+            result = splitter.run_git_command(['git', 'branch', '--list', 'main'], cwd=project_repo_path, check=False)
             if not result.stdout.strip():
-                splitter.run_git_command(['git', 'checkout', '-b', 'main'])
-            
-            # Remove remote origin if it exists
-            result = splitter.run_git_command(['git', 'remote', 'remove', 'origin'], check=False)
-            
-            # Add new remote
-            splitter.run_git_command(['git', 'remote', 'add', 'origin', repo_url])
+                splitter.run_git_command(['git', 'branch', '-m', 'main'], cwd=project_repo_path)
             
             # Force push to update the repository
-            splitter.run_git_command(['git', 'push', '-f', 'origin', 'main'])
+            splitter.publish_repository(project_repo_path, repo_name, repo_url, force=True)
             
             print(f"✅ Updated {repo_name}")
         
@@ -91,30 +84,21 @@ def force_update_repositories():
             # Clone the mirror repo
             splitter.run_git_command(['git', 'clone', splitter.source_repo_path, common_repo_path])
             
-            # Change to the common repo directory
-            os.chdir(common_repo_path)
-            
             # Use git filter-repo to extract only the common path
             splitter.run_git_command([
                 'git', 'filter-repo',
                 '--path', f'{config.common_path}/',
                 '--path-rename', f'{config.common_path}/:',
                 '--force'
-            ])
+            ], cwd=common_repo_path)
             
             # Check if main branch exists after filtering
-            result = splitter.run_git_command(['git', 'branch', '--list', 'main'], check=False)
+            result = splitter.run_git_command(['git', 'branch', '--list', 'main'], cwd=common_repo_path, check=False)
             if not result.stdout.strip():
-                splitter.run_git_command(['git', 'checkout', '-b', 'main'])
-            
-            # Remove remote origin if it exists
-            result = splitter.run_git_command(['git', 'remote', 'remove', 'origin'], check=False)
-            
-            # Add new remote
-            splitter.run_git_command(['git', 'remote', 'add', 'origin', repo_url])
+                splitter.run_git_command(['git', 'branch', '-m', 'main'], cwd=common_repo_path)
             
             # Force push to update the repository
-            splitter.run_git_command(['git', 'push', '-f', 'origin', 'main'])
+            splitter.publish_repository(common_repo_path, repo_name, repo_url, force=True)
             
             print(f"✅ Updated {repo_name}")
 
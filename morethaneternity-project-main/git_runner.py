@@ -0,0 +1,129 @@
+#!/usr/bin/env python3
+"""
+Git Command Runner
+
+Runs the git commands of a split, whichever module issues them. Every
+command starts in its own process group, so a timeout or a cancel stops it
+together with everything it spawned, and every phase ('clone', 'rewrite',
+'push') has its own timeout. A runner keeps track of its running commands:
+cancel() stops all of them, and every later command is refused.
+
+The splitter installs its runner for the duration of a run. The plumbing
+helpers of the other modules (history_rewrite.git and everything built on
+it) run their commands through the installed runner in the 'rewrite' phase,
+so REWRITE_TIMEOUT and cancellation reach them too. Without an installed
+runner, commands run without a timeout.
+"""
+
+import os
+import signal
+import threading
+import subprocess
+from concurrent.futures import CancelledError
+from typing import List, Dict, Optional, Set
+
+
+# How long a cancelled git process group gets to exit before it is killed
+KILL_GRACE_SECONDS = 5
+
+
+class TargetCancelled(CancelledError):
+    """A target stopped because the run was cancelled, not because it failed."""
+
+
+def stop_process_group(process: subprocess.Popen):
+    """Terminate a command started in its own process group, together with everything it spawned."""
+    for sig in (signal.SIGTERM, signal.SIGKILL):
+        try:
+            os.killpg(process.pid, sig)
+        except ProcessLookupError:
+            return
+        try:
+            process.wait(timeout=KILL_GRACE_SECONDS)
+            return
+        except subprocess.TimeoutExpired:
+            continue
+
+
+class GitRunner:
+    """Start git commands in their own process groups, with per-phase timeouts and one cancel for all of them."""
+
+    def __init__(self, timeouts: Optional[Dict[str, int]] = None):
+        self.timeouts = timeouts or {}  # phase -> seconds, 0 for none
+        self.processes: Set[subprocess.Popen] = set()
+        self.lock = threading.Lock()
+        self.cancelled = threading.Event()
+
+    def timeout(self, phase: Optional[str]) -> int:
+        """Return the timeout of a phase in seconds, 0 for none."""
+        return self.timeouts.get(phase, 0) if phase else 0
+
+    def start(self, command: List[str], cwd: Optional[str] = None, stdin: bool = False) -> subprocess.Popen:
+        """Start command in a new process group with piped output; refuse once the runner was cancelled."""
+        if self.cancelled.is_set():
+            raise TargetCancelled(f"Run cancelled before: {' '.join(command)}")
+        process = subprocess.Popen(
+            command,
+            cwd=cwd,
+            stdin=subprocess.PIPE if stdin else subprocess.DEVNULL,
+            stdout=subprocess.PIPE,
+            stderr=subprocess.PIPE,
+            start_new_session=True
+        )
+        with self.lock:
+            self.processes.add(process)
+        return process
+
+    def finish(self, process: subprocess.Popen):
+        """Stop tracking a command that has exited."""
+        with self.lock:
+            self.processes.discard(process)
+
+    def check_cancelled(self, command: List[str], returncode: int):
+        """Report a command that failed because the run was cancelled under it."""
+        if self.cancelled.is_set() and returncode != 0:
+            raise TargetCancelled(f"Run cancelled during: {' '.join(command)}")
+
+    def run(self, command: List[str], cwd: Optional[str] = None, input: Optional[bytes] = None,
+            phase: Optional[str] = None) -> subprocess.CompletedProcess:
+        """Run command to completion and return its result with bytes output; raises TimeoutExpired."""
+        process = self.start(command, cwd, input is not None)
+        timeout = self.timeout(phase)
+        try:
+            stdout, stderr = process.communicate(input, timeout=timeout or None)
+        except subprocess.TimeoutExpired:
+            stop_process_group(process)
+            stdout, stderr = process.communicate()
+            raise subprocess.TimeoutExpired(command, timeout, stdout, stderr)
+        except BaseException:
+            # Ctrl-C while waiting; the command is in its own group and did not get the signal
+            stop_process_group(process)
+            raise
+        finally:
+            self.finish(process)
+        self.check_cancelled(command, process.returncode)
+        return subprocess.CompletedProcess(command, process.returncode, stdout, stderr)
+
+    def cancel(self) -> int:
+        """Refuse new commands and stop every running one; return how many were running."""
+        self.cancelled.set()
+        with self.lock:
+            processes = list(self.processes)
+        for process in processes:
+            stop_process_group(process)
+        return len(processes)
+
+
+active_runner = GitRunner()
+
+
+def current_runner() -> GitRunner:
+    """Return the runner git commands go through."""
+    return active_runner
+
+
+def install_runner(runner: GitRunner) -> GitRunner:
+    """Route git commands through runner; return the runner installed before."""
+    global active_runner
+    previous, active_runner = active_runner, runner
+    return previous
@@ -0,0 +1,238 @@
+#!/usr/bin/env python3
+"""
+GitHub Metadata Cache
+
+Remembers the GitHub API answers the splitter keeps asking for: whether a
+repository exists, its clone URL and default branch, and who the token
+and organization are. They are kept in a JSON file shared by runs, and
+almost never change, so:
+
+    - an answer younger than max_age is used without asking GitHub at all
+    - an older one is revalidated with If-None-Match and its ETag; if it is
+      unchanged, GitHub answers 304 Not Modified without a body, and a 304
+      does not count against the primary rate limit
+    - anything else is fetched and stored with its new ETag
+
+Answers are kept per API URL and token (by a SHA-256 fingerprint, never the
+token itself), since what a token can see depends on who it belongs to. A
+missing repository is not cached: it is usually about to be created.
+
+Usage:
+    python github_cache.py user [--max-age SECONDS]
+    python github_cache.py repo OWNER NAME [--max-age SECONDS]
+    python github_cache.py org NAME [--max-age SECONDS]
+
+Reads GITHUB_TOKEN, GITHUB_API_URL and GITHUB_CACHE from the environment
+(or .env) and prints the answer and whether it came from the cache.
+"""
+
+import os
+import sys
+import json
+import time
+import hashlib
+import logging
+import argparse
+import threading
+from typing import Callable, Dict, Optional, Tuple
+
+from shared_files import locked, replace_json
+
+
+DEFAULT_GITHUB_CACHE = 'github_cache.json'
+DEFAULT_MAX_AGE = 300  # seconds an answer is used without revalidating it
+CACHE_VERSION = 1
+REQUEST_TIMEOUT = 30
+
+# The fields kept of each kind of answer; the full documents are large and mostly unused
+REPO_FIELDS = ('full_name', 'clone_url', 'default_branch', 'private', 'html_url')
+ACCOUNT_FIELDS = ('login', 'type')
+
+
+class GitHubApiError(Exception):
+    """A metadata request failed, or GitHub answered with an unexpected status."""
+
+
+def token_fingerprint(token: str) -> str:
+    """Return a short hash that identifies a token without revealing it."""
+    return hashlib.sha256(token.encode()).hexdigest()[:16] if token else 'anonymous'
+
+
+class GitHubCache:
+    """Conditional, persistent cache of GitHub metadata lookups."""
+
+    def __init__(self, api_url: str, token: str = '', cache_path: str = DEFAULT_GITHUB_CACHE,
+                 max_age: int = DEFAULT_MAX_AGE, logger: Optional[logging.Logger] = None,
+                 on_lookup: Optional[Callable[[str, str], None]] = None):
+        self.api_url = api_url.rstrip('/')
+        self.token = token
+        self.cache_path = cache_path
+        self.max_age = max_age
+        self.logger = logger or logging.getLogger(__name__)
+        self.namespace = f'{self.api_url} {token_fingerprint(token)}'
+        self.entries: Dict[str, Dict] = self.load().get(self.namespace, {})
+        self.removed: Dict[str, float] = {}  # path -> when it turned out not to exist
+        self.lock = threading.Lock()
+        self.session = None
+        # Lookups by result: 'fresh' (no request), 'not_modified' (304) or 'fetched'
+        self.stats: Dict[str, int] = {'fresh': 0, 'not_modified': 0, 'fetched': 0}
+        self.rate_limit: Optional[Tuple[int, int, int]] = None  # remaining, limit, reset of the last response
+        self.on_lookup = on_lookup  # called with (kind, result) after each lookup, e.g. ('repo', 'fresh')
+
+    def load(self) -> Dict[str, Dict[str, Dict]]:
+        """Read the entries of every namespace; an unreadable or outdated cache has none."""
+        if not self.cache_path or not os.path.exists(self.cache_path):
+            return {}
+        try:
+            with open(self.cache_path) as f:
+                cache = json.load(f)
+        except (OSError, ValueError):
+            return {}
+        return cache.get('namespaces', {}) if cache.get('version') == CACHE_VERSION else {}
+
+    def save(self):
+        """Merge our entries into the cache file, newest entry per path, and replace it atomically."""
+        if not self.cache_path:
+            return
+        # Concurrent targets store answers at the same time; one of them writes at a time, and the
+        # lock file keeps other runs (e.g. split service jobs) out while the file is merged
+        with self.lock:
+            try:
+                with locked(self.cache_path):
+                    namespaces = self.load()
+                    entries = namespaces.setdefault(self.namespace, {})
+                    for path, entry in self.entries.items():
+                        if path not in entries or entries[path]['checked_at'] <= entry['checked_at']:
+                            entries[path] = entry
+                    for path, removed_at in self.removed.items():
+                        if path in entries and entries[path]['checked_at'] <= removed_at:
+                            del entries[path]
+                    replace_json(self.cache_path, {'version': CACHE_VERSION, 'namespaces': namespaces})
+            except OSError as e:
+                self.logger.warning(f"Could not write the GitHub metadata cache {self.cache_path}: {e}")
+
+    def request(self, path: str, etag: Optional[str]):
+        """GET an API path, conditionally if there is an ETag."""
+        # Imported here so that runs answered from the cache never load requests
+        import requests
+
+        if self.session is None:
+            self.session = requests.Session()
+        headers = {'Accept': 'application/vnd.github+json'}
+        if self.token:
+            headers['Authorization'] = f'token {self.token}'
+        if etag:
+            headers['If-None-Match'] = etag
+        try:
+            response = self.session.get(f'{self.api_url}{path}', headers=headers, timeout=REQUEST_TIMEOUT)
+        except requests.RequestException as e:
+            raise GitHubApiError(f"GET {path} failed: {e}") from e
+        if 'X-RateLimit-Remaining' in response.headers:
+            self.rate_limit = (int(response.headers['X-RateLimit-Remaining']),
+                               int(response.headers.get('X-RateLimit-Limit', 0)),
+                               int(response.headers.get('X-RateLimit-Reset', 0)))
+        return response
+
+    def get(self, path: str, fields: Tuple[str, ...], kind: str) -> Optional[Dict]:
+        """Return the fields of an API document, None if it does not exist."""
+        with self.lock:
+            entry = self.entries.get(path)
+        if entry and time.time() - entry['checked_at'] < self.max_age:
+            self.count(kind, 'fresh')
+            return entry['data']
+
+        response = self.request(path, entry.get('etag') if entry else None)
+        if response.status_code == 304 and entry:
+            self.count(kind, 'not_modified')
+            self.store(path, entry['data'], entry.get('etag'))
+            return entry['data']
+        self.count(kind, 'fetched')
+        if response.status_code == 404:
+            with self.lock:
+                self.entries.pop(path, None)
+                self.removed[path] = time.time()
+            self.save()
+            return None
+        if response.status_code != 200:
+            raise GitHubApiError(f"GET {path}: {response.status_code} {response.text[:200]}")
+        document = response.json()
+        data = {field: document.get(field) for field in fields}
+        self.store(path, data, response.headers.get('ETag'))
+        return data
+
+    def store(self, path: str, data: Dict, etag: Optional[str] = None):
+        """Remember an answer, e.g. the repository a create call returned."""
+        with self.lock:
+            self.entries[path] = {'data': data, 'etag': etag, 'checked_at': time.time()}
+            self.removed.pop(path, None)
+        self.save()
+
+    def count(self, kind: str, result: str):
+        with self.lock:
+            self.stats[result] += 1
+        if self.on_lookup:
+            self.on_lookup(kind, result)
+
+    def repo(self, owner: str, name: str) -> Optional[Dict]:
+        """Return full_name, clone_url, default_branch, private and html_url of a repository, None if it does not exist."""
+        return self.get(f'/repos/{owner}/{name}', REPO_FIELDS, 'repo')
+
+    def store_repo(self, owner: str, name: str, document: Dict):
+        """Remember a repository from a full API document."""
+        self.store(f'/repos/{owner}/{name}', {field: document.get(field) for field in REPO_FIELDS})
+
+    def user(self) -> Dict:
+        """Return the login and type of the account the token belongs to."""
+        data = self.get('/user', ACCOUNT_FIELDS, 'user')
+        if data is None:
+            raise GitHubApiError("GET /user: 404, the token has no user")
+        return data
+
+    def organization(self, name: str) -> Optional[Dict]:
+        """Return the login and type of an organization, None if it does not exist."""
+        return self.get(f'/orgs/{name}', ACCOUNT_FIELDS, 'organization')
+
+    def summary(self) -> str:
+        """Describe how the lookups were answered, e.g. for the end of a run."""
+        return (f"{sum(self.stats.values())} GitHub metadata lookups: {self.stats['fresh']} from the cache, "
+                f"{self.stats['not_modified']} revalidated (304), {self.stats['fetched']} fetched")
+
+
+def main():
+    """Main entry point."""
+    common = argparse.ArgumentParser(add_help=False)
+    common.add_argument('--max-age', type=int, help=f'Seconds an answer is used without revalidating it (default {DEFAULT_MAX_AGE})')
+    parser = argparse.ArgumentParser(description="Look up GitHub metadata through the shared cache")
+    subparsers = parser.add_subparsers(dest='command', required=True)
+    subparsers.add_parser('user', parents=[common], help='The account the token belongs to')
+    repo_parser = subparsers.add_parser('repo', parents=[common], help='A repository')
+    repo_parser.add_argument('owner')
+    repo_parser.add_argument('name')
+    org_parser = subparsers.add_parser('org', parents=[common], help='An organization')
+    org_parser.add_argument('name')
+    args = parser.parse_args()
+
+    from dotenv import load_dotenv
+    load_dotenv()
+    max_age = args.max_age if args.max_age is not None else int(os.getenv('GITHUB_CACHE_MAX_AGE', DEFAULT_MAX_AGE))
+    cache = GitHubCache(os.getenv('GITHUB_API_URL') or 'https://api.github.com', os.getenv('GITHUB_TOKEN', ''),
+                        os.getenv('GITHUB_CACHE', DEFAULT_GITHUB_CACHE), max_age)
+    try:
+        if args.command == 'user':
+            data = cache.user()
+        elif args.command == 'repo':
+            data = cache.repo(args.owner, args.name)
+        else:
+            data = cache.organization(args.name)
+    except GitHubApiError as e:
+        print(f"Error: {e}")
+        sys.exit(1)
+    if data is None:
+        print("Not found")
+        sys.exit(1)
+    print(json.dumps(data, indent=2))
+    print(cache.summary())
+
+
+if __name__ == "__main__":
+    main()
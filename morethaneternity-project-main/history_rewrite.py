@@ -0,0 +1,565 @@
+#!/usr/bin/env python3
+"""
+Sharded History Rewriter
+
+Rewrites the branches and tags of a repository so that a subdirectory becomes
+the repository root, the same result as `git filter-repo --path DIR/
+--path-rename DIR/:`. The commits of each ref are listed parents-first and cut
+into contiguous chunks whose objects are read by concurrent git processes,
+started through the installed git runner. Stitching the rewritten commits
+together stays serial, since every commit ID depends on the IDs of its
+parents, so sharding only speeds up the reading. Commit IDs do not depend on
+how the history was sharded.
+
+Rules applied to every commit:
+    - its tree becomes the tree of the subdirectory (or stays whole when no
+      subdirectory is given)
+    - parents map to their rewritten commits; duplicate parents are dropped,
+      and so are parents that became ancestors of another parent, unless the
+      merge was already like that (e.g. a --no-ff merge)
+    - a commit that becomes empty is pruned unless it was already empty or
+      is still a merge of two or more distinct parents
+    - signatures (gpgsig, mergetag) are dropped, other headers are kept
+    - hashes of already rewritten commits quoted in its message, abbreviated
+      or not, are replaced by the new hash of the same length
+
+Refs are rewritten one after another into one history, so commits shared
+with an earlier ref are reused. A ref whose commits were all pruned is
+deleted.
+
+With a cutoff (a first-parent commit found from --since or --max-commits),
+only the commits of a ref after its cutoff are read. A synthesized root
+commit holding the tree at the cutoff replaces everything older, so the cost
+scales with recent activity rather than with the age of the repository.
+
+Usage:
+    python history_rewrite.py verify REPO [--ref HEAD] [--subdir DIR] [--shards 4]
+                                          [--since DATE] [--max-commits N]
+"""
+
+import os
+import re
+import sys
+import zlib
+import shutil
+import hashlib
+import logging
+import argparse
+import tempfile
+import subprocess
+from collections import defaultdict
+from dataclasses import dataclass, field
+from concurrent.futures import ThreadPoolExecutor
+from typing import List, Dict, Optional, Tuple
+
+from git_runner import current_runner
+
+
+EMPTY_TREE = '4b825dc642cb6eb9a060e54bf8d69288fbb4904d'
+DROPPED_HEADERS = (b'gpgsig', b'gpgsig-sha256', b'mergetag')
+HASH_PATTERN = re.compile(rb'\b[0-9a-f]{7,40}\b')  # what git filter-repo treats as a commit hash
+
+
+@dataclass
+class SourceCommit:
+    """A commit read from the source history."""
+    sha: str
+    parents: List[str]
+    tree: str  # the original root tree
+    subtree: str  # the tree the rewritten commit gets
+    headers: bytes  # author, committer and any other kept headers
+    message: bytes
+
+
+@dataclass
+class RewriteResult:
+    """Outcome of a rewrite: the new tip and the old -> new commit map."""
+    tip: Optional[str]
+    commit_map: Dict[str, Optional[str]] = field(default_factory=dict)
+    objects: Dict[str, bytes] = field(default_factory=dict)
+    shards: int = 1
+    cutoff: Optional[str] = None
+    tips: Dict[str, Optional[str]] = field(default_factory=dict)  # ref -> rewritten commit, None if empty
+    cutoffs: Dict[str, Optional[str]] = field(default_factory=dict)  # ref -> its cutoff
+
+
+class AncestryGraph:
+    """Answer is-ancestor queries over a commit graph that grows parents first."""
+
+    def __init__(self):
+        self.parents: Dict[str, List[str]] = {}
+        self.generation: Dict[str, int] = {}
+
+    def add(self, sha: str, parents: List[str]):
+        """Add a commit whose parents are already in the graph (or outside of it)."""
+        self.parents[sha] = parents
+        self.generation[sha] = 1 + max((self.generation.get(parent, 0) for parent in parents), default=0)
+
+    def is_ancestor(self, ancestor: str, descendant: str) -> bool:
+        """Return True if ancestor is reachable from descendant."""
+        # Nothing at or below the ancestor's generation can lead to it
+        floor = self.generation.get(ancestor, 0)
+        stack = [descendant]
+        seen = set()
+        while stack:
+            sha = stack.pop()
+            if sha == ancestor:
+                return True
+            if sha in seen or self.generation.get(sha, 0) <= floor:
+                continue
+            seen.add(sha)
+            stack.extend(self.parents.get(sha, []))
+        return False
+
+    def redundant_parents(self, parents: List[str]) -> List[str]:
+        """Return the parents that are ancestors of another parent."""
+        return [
+            parent for parent in parents
+            if any(other != parent and self.is_ancestor(parent, other) for other in parents)
+        ]
+
+
+def git(repo_path: str, args: List[str], stdin: Optional[bytes] = None) -> bytes:
+    """Run a git plumbing command in repo_path through the installed runner and return its stdout."""
+    result = current_runner().run(['git', *args], repo_path, stdin, phase='rewrite')
+    if result.returncode != 0:
+        raise subprocess.CalledProcessError(result.returncode, result.args, result.stdout, result.stderr)
+    return result.stdout
+
+
+def read_objects(repo_path: str, shas: List[str]) -> Dict[str, bytes]:
+    """Read the raw content of objects in one cat-file batch."""
+    batch = git(repo_path, ['cat-file', '--batch'], stdin=''.join(f'{sha}\n' for sha in shas).encode())
+    objects = {}
+    offset = 0
+    for sha in shas:
+        header_end = batch.index(b'\n', offset)
+        size = int(batch[offset:header_end].split()[2])
+        objects[sha] = batch[header_end + 1:header_end + 1 + size]
+        offset = header_end + 1 + size + 1
+    return objects
+
+
+def split_commit(raw: bytes) -> Tuple[str, List[str], bytes, bytes]:
+    """Split a raw commit object into tree, parents, kept headers and message."""
+    header_block, _, message = raw.partition(b'\n\n')
+    tree = None
+    parents = []
+    kept = []
+    dropping = False
+    for line in header_block.split(b'\n'):
+        if line.startswith(b' '):
+            # Continuation of a multi-line header such as gpgsig
+            if not dropping:
+                kept.append(line)
+            continue
+        key, _, value = line.partition(b' ')
+        dropping = key in DROPPED_HEADERS
+        if key == b'tree':
+            tree = value.decode()
+        elif key == b'parent':
+            parents.append(value.decode())
+        elif not dropping:
+            kept.append(line)
+    return tree, parents, b'\n'.join(kept), message
+
+
+def read_commits(repo_path: str, shas: List[str], subdirectory: Optional[str]) -> List[SourceCommit]:
+    """Read the given commits and the tree each one gets after the rewrite."""
+    if not shas:
+        return []
+
+    raw_objects = read_objects(repo_path, shas)
+    raw_commits = [raw_objects[sha] for sha in shas]
+
+    if subdirectory:
+        lookups = ''.join(f'{sha}:{subdirectory}\n' for sha in shas).encode()
+        check = git(repo_path, ['cat-file', '--batch-check=%(objectname) %(objecttype)'], stdin=lookups)
+        subtrees = []
+        for line in check.decode().splitlines():
+            parts = line.split()
+            subtrees.append(parts[0] if parts[-1] == 'tree' else EMPTY_TREE)
+
+    commits = []
+    for index, (sha, raw) in enumerate(zip(shas, raw_commits)):
+        tree, parents, headers, message = split_commit(raw)
+        commits.append(SourceCommit(
+            sha=sha,
+            parents=parents,
+            tree=tree,
+            subtree=subtrees[index] if subdirectory else tree,
+            headers=headers,
+            message=message,
+        ))
+    return commits
+
+
+def synthesized_root(cutoff: SourceCommit) -> bytes:
+    """Build the root commit object that stands in for all history up to the cutoff."""
+    body = f'tree {cutoff.subtree}\n'.encode() + cutoff.headers
+    body += f'\n\nImport history up to {cutoff.sha}\n'.encode()
+    return b'commit %d\x00' % len(body) + body
+
+
+class Stitcher:
+    """Rewrite commits parents-first into new commit objects.
+
+    Batches of commits can be added one after another, e.g. one per ref;
+    commits rewritten for an earlier batch are kept as they are.
+    """
+
+    def __init__(self):
+        self.commit_map: Dict[str, Optional[str]] = {}
+        self.roots: Dict[str, str] = {}  # cutoff -> synthesized root
+        self.kept: Dict[str, str] = {}  # old -> new of the commits that were not pruned
+        self.short_hashes: Dict[str, set] = defaultdict(set)
+        self.original_trees: Dict[str, str] = {}
+        self.new_trees: Dict[str, str] = {}
+        self.objects: Dict[str, bytes] = {}
+        self.original_graph = AncestryGraph()
+        self.new_graph = AncestryGraph()
+
+    def add_root(self, cutoff: SourceCommit) -> Optional[str]:
+        """Add the root commit that parents older than cutoff collapse into, None if its tree is empty."""
+        if cutoff.subtree == EMPTY_TREE:
+            return None
+        data = synthesized_root(cutoff)
+        root = hashlib.sha1(data).hexdigest()
+        self.objects[root] = data
+        self.new_trees[root] = cutoff.subtree
+        self.new_graph.add(root, [])
+        self.roots[cutoff.sha] = root
+        return root
+
+    def translate_hashes(self, message: bytes) -> bytes:
+        """Replace quoted hashes of rewritten commits the way git filter-repo does.
+
+        A hash of at least 7 digits is replaced by the same number of digits of
+        the new commit if it names exactly one commit kept so far; anything
+        else, including hashes of pruned commits, is left alone.
+        """
+        def translate(match):
+            old = match.group(0).decode()
+            if old in self.kept:
+                return self.kept[old][:len(old)].encode()
+            candidates = [sha for sha in self.short_hashes.get(old[:7], ()) if sha.startswith(old)]
+            if len(candidates) != 1:
+                return match.group(0)
+            return self.kept[candidates[0]][:len(old)].encode()
+        return HASH_PATTERN.sub(translate, message)
+
+    def add(self, commits: List[SourceCommit], root: Optional[str] = None):
+        """Rewrite commits in order; parents outside of what was added so far map to root."""
+        for commit in commits:
+            if commit.sha in self.commit_map:
+                continue
+            self.original_trees[commit.sha] = commit.tree
+            self.original_graph.add(commit.sha, commit.parents)
+
+            parents = []
+            for parent in commit.parents:
+                new_parent = self.commit_map[parent] if parent in self.commit_map else root
+                if new_parent and new_parent not in parents:
+                    parents.append(new_parent)
+
+            if len(parents) > 1 and not self.original_graph.redundant_parents(commit.parents):
+                redundant = self.new_graph.redundant_parents(parents)
+                parents = [parent for parent in parents if parent not in redundant]
+
+            parent_tree = self.new_trees[parents[0]] if parents else EMPTY_TREE
+            was_empty = commit.tree == (self.original_trees.get(commit.parents[0]) if commit.parents else EMPTY_TREE)
+            if commit.subtree == parent_tree and len(parents) < 2 and not was_empty:
+                self.commit_map[commit.sha] = parents[0] if parents else None
+                continue
+
+            body = f'tree {commit.subtree}\n'.encode()
+            body += b''.join(f'parent {parent}\n'.encode() for parent in parents)
+            body += commit.headers + b'\n\n' + self.translate_hashes(commit.message)
+            data = b'commit %d\x00' % len(body) + body
+            new_sha = hashlib.sha1(data).hexdigest()
+
+            self.objects[new_sha] = data
+            self.new_trees[new_sha] = commit.subtree
+            self.new_graph.add(new_sha, parents)
+            self.commit_map[commit.sha] = new_sha
+            self.kept[commit.sha] = new_sha
+            self.short_hashes[commit.sha[:7]].add(commit.sha)
+
+    def full_map(self) -> Dict[str, Optional[str]]:
+        """Return the commit map including the cutoffs, which come first since they produced their roots."""
+        cutoffs = {cutoff: root for cutoff, root in self.roots.items() if cutoff not in self.commit_map}
+        return {**cutoffs, **self.commit_map}
+
+
+def stitch(shards: List[List[SourceCommit]], cutoff: Optional[SourceCommit] = None) -> RewriteResult:
+    """Rewrite commits shard by shard, in order, into new commit objects."""
+    stitcher = Stitcher()
+    root = stitcher.add_root(cutoff) if cutoff else None
+    for commits in shards:
+        stitcher.add(commits, root)
+
+    last_shard = next((commits for commits in reversed(shards) if commits), [])
+    tip = stitcher.commit_map.get(last_shard[-1].sha) if last_shard else root
+    return RewriteResult(tip=tip, commit_map=stitcher.full_map(), objects=stitcher.objects,
+                         shards=max(len(shards), 1), cutoff=cutoff.sha if cutoff else None)
+
+
+def pruned_as_none(commit_map: Dict[str, Optional[str]]) -> Dict[str, Optional[str]]:
+    """Return commit_map the way git filter-repo writes it: pruned commits map to None.
+
+    stitch() maps a pruned commit to its parent's new commit. Its map is in
+    topological order, so the first commit that maps to a new commit is the one
+    that produced it.
+    """
+    produced = set()
+    result = {}
+    for old, new in commit_map.items():
+        result[old] = new if new not in produced else None
+        produced.add(new)
+    return result
+
+
+def write_loose_object(objects_dir: str, sha: str, data: bytes):
+    """Write one object in loose format unless it already exists."""
+    path = os.path.join(objects_dir, sha[:2], sha[2:])
+    if os.path.exists(path):
+        return
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    temp_path = f'{path}.tmp{os.getpid()}'
+    with open(temp_path, 'wb') as f:
+        f.write(zlib.compress(data))
+    os.replace(temp_path, path)
+
+
+def write_objects(repo_path: str, objects: Dict[str, bytes]):
+    """Write objects into repo_path as loose objects, in parallel."""
+    objects_dir = os.path.join(repo_path, git(repo_path, ['rev-parse', '--git-path', 'objects']).decode().strip())
+    with ThreadPoolExecutor(max_workers=os.cpu_count()) as executor:
+        list(executor.map(lambda item: write_loose_object(objects_dir, *item), objects.items()))
+
+
+def apply_rewrite(repo_path: str, commit_map: Dict[str, Optional[str]], objects: Dict[str, bytes]):
+    """Write rewritten objects and move every branch and tag of repo_path to its rewritten commit.
+
+    Annotated tags get a new tag object that points at the rewritten commit.
+    Refs whose commit maps to None, i.e. was pruned with all its ancestors,
+    are deleted.
+    """
+    refs = git(repo_path, ['for-each-ref', '--format=%(objectname) %(objecttype) %(refname)',
+                           'refs/heads', 'refs/tags']).decode().splitlines()
+    updates = []
+    for target, kind, ref in (line.split() for line in refs):
+        if kind == 'commit':
+            new_target = commit_map.get(target, target)
+        elif kind == 'tag':
+            header, _, rest = read_objects(repo_path, [target])[target].partition(b'\n')
+            tagged = header.split()[1].decode()
+            new_tagged = commit_map.get(tagged, tagged)
+            if new_tagged is None:
+                new_target = None
+            else:
+                data = b'object ' + new_tagged.encode() + b'\n' + rest
+                data = b'tag %d\x00' % len(data) + data
+                new_target = hashlib.sha1(data).hexdigest()
+                objects[new_target] = data
+        else:
+            continue
+        if new_target is None:
+            updates.append(f'delete {ref}\n')
+        elif new_target != target:
+            updates.append(f'update {ref} {new_target}\n')
+
+    write_objects(repo_path, objects)
+    if updates:
+        git(repo_path, ['update-ref', '--stdin'], stdin=''.join(updates).encode())
+
+
+def read_filter_repo_map(repo_path: str) -> Dict[str, Optional[str]]:
+    """Read the old -> new commit map git filter-repo left in a repository; pruned commits map to None."""
+    map_path = os.path.join(repo_path, '.git', 'filter-repo', 'commit-map')
+    if not os.path.exists(map_path):
+        map_path = os.path.join(repo_path, 'filter-repo', 'commit-map')  # bare repository
+    commit_map = {}
+    with open(map_path) as f:
+        next(f)  # "old new" header
+        for line in f:
+            old, new = line.split()
+            commit_map[old] = None if new.strip('0') == '' else new
+    return commit_map
+
+
+class HistoryRewriter:
+    """Rewrite the refs of a repository to a subdirectory, reading their history across processes."""
+
+    def __init__(self, repo_path: str, subdirectory: Optional[str] = None, logger: Optional[logging.Logger] = None):
+        self.repo_path = repo_path
+        self.subdirectory = subdirectory.strip('/') if subdirectory else None
+        self.logger = logger or logging.getLogger(__name__)
+
+    def find_cutoff(self, ref: str, since: Optional[str] = None, max_commits: int = 0) -> Optional[str]:
+        """Return the newest first-parent commit to squash into the root, or None to keep all history."""
+        candidates = []
+        if max_commits:
+            candidates.append(git(self.repo_path, ['rev-list', '-1', '--first-parent', f'--skip={max_commits}', ref]))
+        if since:
+            candidates.append(git(self.repo_path, ['rev-list', '-1', '--first-parent', f'--before={since}', ref]))
+        candidates = [sha.decode().strip() for sha in candidates if sha.strip()]
+        if not candidates:
+            return None
+
+        # Both limits apply, so keep the shorter history: the cutoff nearest the tip
+        cutoff = candidates[0]
+        for candidate in candidates[1:]:
+            is_ancestor = current_runner().run(['git', 'merge-base', '--is-ancestor', cutoff, candidate],
+                                               self.repo_path, phase='rewrite').returncode == 0
+            if is_ancestor:
+                cutoff = candidate
+        return cutoff
+
+    def find_cutoffs(self, refs: List[str], since: Optional[str] = None,
+                     max_commits: int = 0) -> Dict[str, Optional[str]]:
+        """Return the cutoff of each ref, in the order of refs."""
+        return {ref: self.find_cutoff(ref, since, max_commits) for ref in refs}
+
+    def read_in_shards(self, ref: str, shas: List[str], shards: int) -> List[List[SourceCommit]]:
+        """Read commits in up to shards contiguous chunks, each by its own git processes, keeping their order."""
+        if not shas:
+            return []
+        shards = max(1, min(shards, len(shas)))
+        size = len(shas) / shards
+        chunks = [shas[round(size * i):round(size * (i + 1))] for i in range(shards)]
+        self.logger.info(f"Reading {len(shas)} commits of {ref} in {len(chunks)} shards")
+
+        if len(chunks) == 1:
+            return [read_commits(self.repo_path, chunks[0], self.subdirectory)]
+        with ThreadPoolExecutor(max_workers=len(chunks)) as executor:
+            futures = [executor.submit(read_commits, self.repo_path, chunk, self.subdirectory) for chunk in chunks]
+            return [future.result() for future in futures]
+
+    def rewrite(self, ref: str, shards: int = 1, cutoff: Optional[str] = None) -> RewriteResult:
+        """Read the history of ref after cutoff in shards and stitch it into rewritten commits."""
+        return self.rewrite_refs({ref: cutoff}, shards)
+
+    def rewrite_refs(self, cutoffs: Dict[str, Optional[str]], shards: int = 1) -> RewriteResult:
+        """Rewrite the history of each ref after its own cutoff into one set of commits.
+
+        Refs are rewritten in the order of cutoffs and commits an earlier ref
+        already rewrote are not read again, so the main branch goes first. The
+        result's tip is the one of the first ref.
+        """
+        refs = list(cutoffs)
+        ref_commits = dict(zip(refs, git(self.repo_path, ['rev-parse', *[f'{ref}^{{commit}}' for ref in refs]])
+                               .decode().split()))
+        stitcher = Stitcher()
+        read_shards = 1
+        for ref, cutoff in cutoffs.items():
+            exclude = [f'^{cutoff}'] if cutoff else []
+            revs = git(self.repo_path, ['rev-list', '--topo-order', '--reverse', ref, *exclude]).decode().split()
+            revs = [sha for sha in revs if sha not in stitcher.commit_map]
+            root = stitcher.add_root(read_commits(self.repo_path, [cutoff], self.subdirectory)[0]) if cutoff else None
+
+            shard_commits = self.read_in_shards(ref, revs, shards)
+            read_shards = max(read_shards, len(shard_commits))
+            for commits in shard_commits:
+                stitcher.add(commits, root)
+
+        commit_map = stitcher.full_map()
+        tips = {ref: commit_map.get(ref_commits[ref]) for ref in refs}
+        first_cutoff = cutoffs[refs[0]] if refs else None
+        self.logger.info(f"Rewrote {len(commit_map)} commits of {len(refs)} refs into {len(stitcher.objects)}")
+        return RewriteResult(tip=tips[refs[0]] if refs else None, commit_map=commit_map, objects=stitcher.objects,
+                             shards=read_shards, cutoff=first_cutoff, tips=tips, cutoffs=dict(cutoffs))
+
+    def write(self, result: RewriteResult, ref: str, branch: str = 'main'):
+        """Store the rewritten commits, move every branch and tag, and check out ref as branch.
+
+        Branches and tags whose commits were all pruned are deleted, as after
+        git filter-repo.
+        """
+        apply_rewrite(self.repo_path, result.commit_map, result.objects)
+
+        if result.tip and ref != f'refs/heads/{branch}':
+            git(self.repo_path, ['update-ref', f'refs/heads/{branch}', result.tip])
+            git(self.repo_path, ['update-ref', '-d', ref])
+        git(self.repo_path, ['symbolic-ref', 'HEAD', f'refs/heads/{branch}'])
+
+    def filter_repo_rewrite(self, refs: List[str]) -> Tuple[Dict[str, Optional[str]], Dict[str, Optional[str]]]:
+        """Run git filter-repo on a scratch clone holding only refs; return its commit map and the new ref tips."""
+        scratch = tempfile.mkdtemp(prefix='verify_rewrite_')
+        try:
+            git(scratch, ['clone', '--bare', '--quiet', os.path.abspath(self.repo_path), 'repo.git'])
+            repo = os.path.join(scratch, 'repo.git')
+            others = [ref for ref in git(repo, ['for-each-ref', '--format=%(refname)']).decode().split()
+                      if ref not in refs]
+            if others:
+                git(repo, ['update-ref', '--stdin'], stdin=''.join(f'delete {ref}\n' for ref in others).encode())
+
+            paths = ['--path', f'{self.subdirectory}/', '--path-rename', f'{self.subdirectory}/:'] \
+                if self.subdirectory else []
+            git(repo, ['filter-repo', *paths, '--force', '--quiet'])
+
+            listing = git(repo, ['for-each-ref', '--format=%(refname) %(objectname) %(*objectname)']).decode()
+            tips = {ref: None for ref in refs}
+            for line in listing.splitlines():
+                ref, *objects = line.split()
+                tips[ref] = objects[-1]  # the peeled commit for annotated tags
+            return read_filter_repo_map(repo), tips
+        finally:
+            shutil.rmtree(scratch, ignore_errors=True)
+
+    def verify(self, sharded: RewriteResult):
+        """Prove a sharded rewrite matches git filter-repo on the same refs.
+
+        filter-repo has no cutoff, so a history-limited rewrite is compared with
+        a serial rewrite of the same refs instead, which only shows that
+        sharding did not change the result.
+        """
+        if any(sharded.cutoffs.values()):
+            serial = self.rewrite_refs(sharded.cutoffs, shards=1)
+            expected_map, expected_tips, reference = serial.commit_map, serial.tips, 'a serial rewrite'
+            actual_map = sharded.commit_map
+        else:
+            expected_map, expected_tips = self.filter_repo_rewrite(list(sharded.tips))
+            actual_map, reference = pruned_as_none(sharded.commit_map), 'git filter-repo'
+
+        differing = [sha for sha in {**expected_map, **actual_map} if expected_map.get(sha) != actual_map.get(sha)]
+        moved = [ref for ref in expected_tips if expected_tips[ref] != sharded.tips.get(ref)]
+        if differing or moved:
+            raise RuntimeError(
+                f"Sharded rewrite differs from {reference}: {len(differing)} commits map differently, "
+                f"{len(moved)} refs point elsewhere{': ' + ', '.join(moved[:5]) if moved else ''}"
+            )
+        self.logger.info(
+            f"Verified sharded rewrite ({sharded.shards} shards): "
+            f"{len(expected_map)} commits and {len(expected_tips)} refs identical to {reference}"
+        )
+
+
+def main():
+    """Main entry point."""
+    parser = argparse.ArgumentParser(description="Compare a sharded history rewrite against git filter-repo")
+    subparsers = parser.add_subparsers(dest='command', required=True)
+    verify_parser = subparsers.add_parser('verify', help='Rewrite in shards and check against git filter-repo')
+    verify_parser.add_argument('repo', help='Path of the repository to read')
+    verify_parser.add_argument('--ref', default='HEAD', help='Branch or tag whose history is rewritten')
+    verify_parser.add_argument('--subdir', help='Subdirectory that becomes the new root')
+    verify_parser.add_argument('--shards', type=int, default=os.cpu_count(), help='Number of shards')
+    verify_parser.add_argument('--since', help='Only keep first-parent history since this date')
+    verify_parser.add_argument('--max-commits', type=int, default=0, help='Only keep the last N first-parent commits')
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+    rewriter = HistoryRewriter(args.repo, args.subdir)
+    try:
+        ref = git(args.repo, ['rev-parse', '--symbolic-full-name', args.ref]).decode().strip()
+        if not ref:
+            raise RuntimeError(f"--ref must name a branch or tag, not {args.ref}")
+        cutoffs = rewriter.find_cutoffs([ref], args.since, args.max_commits)
+        rewriter.verify(rewriter.rewrite_refs(cutoffs, shards=args.shards))
+    except (RuntimeError, subprocess.CalledProcessError) as e:
+        print(f"Error: {e}")
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,128 @@
+#!/usr/bin/env python3
+"""
+Import bundles written by split_repo_agent.py in bundle mode
+
+Verifies each bundle against manifest.json, provisions the GitHub repository
+and pushes the branches and tags of the bundle, uploading the LFS objects
+exported next to the bundles first. Pushes run in parallel so the network
+transfer can be batched separately from the rewrite.
+
+Usage:
+    python import_bundles.py [--bundle-dir bundles] [--workers 4] [--dry-run]
+"""
+
+import os
+import sys
+import json
+import argparse
+import tempfile
+import subprocess
+from concurrent.futures import ThreadPoolExecutor, as_completed
+
+from dotenv import load_dotenv
+
+from split_repo_agent import RepoSplitter, RepoSplitterConfig, file_sha256, format_size, load_env_options
+from lfs_transfer import LfsTransfer, LfsError
+from github_cache import GitHubApiError
+
+
+def import_bundle(splitter: RepoSplitter, bundle_dir: str, entry: dict) -> bool:
+    """Verify one bundle, create its repository and push it."""
+    repo_name = entry['repo_name']
+    bundle_path = os.path.abspath(os.path.join(bundle_dir, entry['bundle']))
+
+    if file_sha256(bundle_path) != entry['sha256']:
+        splitter.logger.error(f"Checksum mismatch for {bundle_path}, skipping {repo_name}")
+        return False
+
+    repo_url = splitter.create_github_repo(repo_name, entry.get('description', ""))
+    if not repo_url:
+        splitter.logger.error(f"Failed to create repository for bundle: {repo_name}")
+        return False
+
+    if splitter.config.dry_run:
+        splitter.logger.info(f"[DRY RUN] Would push {bundle_path} to {repo_url}")
+        return True
+
+    repo_path = os.path.join(splitter.temp_dir, repo_name)
+    splitter.run_git_command(['git', 'init', '--bare', repo_path])
+    # Every branch and tag in the bundle; publish_repository applies the ref selection again
+    splitter.run_git_command(['git', 'fetch', bundle_path, 'refs/*:refs/*'], cwd=repo_path)
+    splitter.publish_repository(repo_path, repo_name, repo_url)
+
+    splitter.logger.info(f"Imported '{repo_name}' from {entry['bundle']}")
+    return True
+
+
+def import_bundles(bundle_dir: str, workers: int, dry_run: bool) -> bool:
+    """Import every bundle listed in the manifest."""
+    load_dotenv()
+
+    with open(os.path.join(bundle_dir, 'manifest.json')) as f:
+        manifest = json.load(f)
+
+    config = RepoSplitterConfig(
+        source_repo_url=manifest.get('source_repo_url', ''),
+        mode=os.getenv('MODE', 'project').lower(),
+        org=os.getenv('ORG', ''),
+        github_token=os.getenv('GITHUB_TOKEN', ''),
+        dry_run=dry_run,
+        **load_env_options()
+    )
+    # The importer always pushes, even if OUTPUT_MODE=bundle is still set in .env
+    config.output_mode = 'push'
+    if not config.org:
+        raise ValueError("ORG is required")
+    if not config.github_token:
+        raise ValueError("GITHUB_TOKEN is required")
+
+    all_imported = True
+    with RepoSplitter(config) as splitter:
+        splitter.temp_dir = tempfile.mkdtemp(prefix="repo_splitter_import_")
+        if any(entry.get('lfs_objects') for entry in manifest['bundles']):
+            # The split exported the LFS objects of the bundles to lfs/, in the cache layout
+            splitter.lfs = LfsTransfer(os.path.join(bundle_dir, 'lfs'), auth=('x-access-token', config.github_token),
+                                       workers=config.lfs_workers, logger=splitter.logger)
+
+        with ThreadPoolExecutor(max_workers=workers) as executor:
+            futures = {
+                executor.submit(import_bundle, splitter, bundle_dir, entry): entry['repo_name']
+                for entry in manifest['bundles']
+            }
+            for future in as_completed(futures):
+                # One failed bundle must not keep the others from being imported
+                try:
+                    imported = future.result()
+                except (subprocess.CalledProcessError, subprocess.TimeoutExpired, GitHubApiError, LfsError,
+                        OSError) as e:
+                    splitter.logger.error(f"Failed to import '{futures[future]}': {e}")
+                    imported = False
+                if not imported:
+                    all_imported = False
+
+        for repo, stats in splitter.push_stats.items():
+            splitter.logger.info(f"  - {repo}: {stats['refs']} refs, {format_size(stats['bytes'])} "
+                                 f"in {stats['seconds']:.1f}s")
+
+    return all_imported
+
+
+def main():
+    """Main entry point."""
+    parser = argparse.ArgumentParser(description="Create repositories and push them from split bundles")
+    parser.add_argument('--bundle-dir', default=os.getenv('BUNDLE_DIR', 'bundles'),
+                       help='Directory containing the bundles and manifest.json')
+    parser.add_argument('--workers', type=int, default=4, help='Number of parallel pushes')
+    parser.add_argument('--dry-run', action='store_true', help='Verify bundles without creating or pushing')
+    args = parser.parse_args()
+
+    try:
+        if not import_bundles(args.bundle_dir, args.workers, args.dry_run):
+            sys.exit(1)
+    except Exception as e:
+        print(f"Error: {e}")
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
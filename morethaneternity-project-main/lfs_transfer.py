@@ -0,0 +1,369 @@
+#!/usr/bin/env python3
+"""
+Git LFS Transfer for Split Targets
+
+`git clone --mirror` does not fetch LFS objects and `git push` does not
+upload them, so without this step split repositories end up with pointers
+to content their remotes do not have. For each target this module finds
+the LFS pointers reachable from the refs being published, fetches the
+objects that are not cached yet into a local cache shared by all targets
+(and kept across runs), and uploads them to the target's LFS server before
+the push. It speaks the batch API directly, so git-lfs does not need to be
+installed:
+
+    - pointers are found with one `rev-list --objects` and two cat-file
+      batches; only blobs small enough to be pointers are read
+    - each object is downloaded once, however many targets need it
+    - transfers run in parallel, and the upload batch skips objects the
+      server already has
+
+A source given as a local path is read from its own LFS storage
+(`lfs/objects` of a bare repository, `.git/lfs/objects` otherwise).
+
+Usage:
+    python lfs_transfer.py scan REPO [--ref refs/heads/main ...]
+    python lfs_transfer.py fetch REPO --source URL_OR_PATH [--cache lfs_cache]
+    python lfs_transfer.py push REPO --remote URL [--cache lfs_cache]
+"""
+
+import os
+import re
+import sys
+import json
+import shutil
+import hashlib
+import logging
+import argparse
+import threading
+import subprocess
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from typing import List, Dict, Optional, Tuple, Iterable
+from urllib.parse import urlsplit
+
+from history_rewrite import git, read_objects
+
+
+DEFAULT_CACHE_PATH = 'lfs_cache'
+POINTER_MAX_SIZE = 1024  # git-lfs never writes bigger pointer files
+POINTER_VERSION = b'version https://git-lfs.github.com/spec/v1\n'
+POINTER_OID_PATTERN = re.compile(rb'^oid sha256:([0-9a-f]{64})$', re.M)
+POINTER_SIZE_PATTERN = re.compile(rb'^size (\d+)$', re.M)
+SSH_URL_PATTERN = re.compile(r'^(?:ssh://)?(?:[\w.-]+@)?([\w.-]+)[:/](.+)$')
+
+MEDIA_TYPE = 'application/vnd.git-lfs+json'
+BATCH_SIZE = 100  # objects per batch request, the limit most servers enforce
+CHUNK_SIZE = 1024 * 1024
+
+
+class LfsError(Exception):
+    """An LFS object could not be transferred."""
+
+
+def parse_pointer(data: bytes) -> Optional[Tuple[str, int]]:
+    """Return (oid, size) if data is an LFS pointer file."""
+    if not data.startswith(POINTER_VERSION):
+        return None
+    oid = POINTER_OID_PATTERN.search(data)
+    size = POINTER_SIZE_PATTERN.search(data)
+    if not oid or not size:
+        return None
+    return oid.group(1).decode(), int(size.group(1))
+
+
+def scan_pointers(repo_path: str, refs: List[str]) -> Dict[str, int]:
+    """Return oid -> size of every LFS object a pointer reachable from refs points at."""
+    if not refs:
+        return {}
+    shas = git(repo_path, ['rev-list', '--objects', '--no-object-names', *refs]).decode().split()
+    checks = git(repo_path, ['cat-file', '--batch-check=%(objectname) %(objecttype) %(objectsize)'],
+                 stdin=''.join(f'{sha}\n' for sha in shas).encode()).decode()
+    candidates = [
+        sha for sha, kind, size in (line.split() for line in checks.splitlines())
+        if kind == 'blob' and int(size) < POINTER_MAX_SIZE
+    ]
+
+    objects = {}
+    for data in read_objects(repo_path, candidates).values():
+        pointer = parse_pointer(data)
+        if pointer:
+            objects[pointer[0]] = pointer[1]
+    return objects
+
+
+def lfs_endpoint(remote_url: str) -> str:
+    """Return the LFS server URL git-lfs derives from a remote URL."""
+    url = remote_url.rstrip('/')
+    if not url.startswith(('http://', 'https://')):
+        match = SSH_URL_PATTERN.match(url)
+        if not match:
+            raise ValueError(f"Cannot derive an LFS endpoint from {remote_url}")
+        url = f'https://{match.group(1)}/{match.group(2)}'
+    if not url.endswith('.git'):
+        url += '.git'
+    return f'{url}/info/lfs'
+
+
+def local_lfs_store(source: str) -> Optional[str]:
+    """Return the LFS object directory of a local repository path, if it has one."""
+    path = source[len('file://'):] if source.startswith('file://') else source
+    for candidate in [os.path.join(path, 'lfs', 'objects'), os.path.join(path, '.git', 'lfs', 'objects')]:
+        if os.path.isdir(candidate):
+            return candidate
+    return None
+
+
+class LfsCache:
+    """LFS objects on disk, laid out like .git/lfs/objects."""
+
+    def __init__(self, root: str):
+        self.root = root
+        os.makedirs(self.root, exist_ok=True)
+
+    def path(self, oid: str) -> str:
+        """Return where an object is stored."""
+        return os.path.join(self.root, oid[:2], oid[2:4], oid)
+
+    def has(self, oid: str, size: int) -> bool:
+        """Return True if the object is stored with the expected size."""
+        path = self.path(oid)
+        return os.path.exists(path) and os.path.getsize(path) == size
+
+    def store(self, oid: str, size: int, chunks: Iterable[bytes]):
+        """Write an object from chunks, checking its hash and size before it becomes visible."""
+        path = self.path(oid)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        temp_path = f'{path}.tmp{threading.get_ident()}'
+        digest = hashlib.sha256()
+        written = 0
+        try:
+            with open(temp_path, 'wb') as f:
+                for chunk in chunks:
+                    digest.update(chunk)
+                    written += len(chunk)
+                    f.write(chunk)
+            if digest.hexdigest() != oid or written != size:
+                raise LfsError(f"LFS object {oid} is corrupt: got {written} bytes hashing to {digest.hexdigest()}")
+            os.replace(temp_path, path)
+        finally:
+            if os.path.exists(temp_path):
+                os.remove(temp_path)
+
+    def link(self, oid: str, source_path: str):
+        """Add an object from another store, hardlinked when possible."""
+        path = self.path(oid)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        try:
+            os.link(source_path, path)
+        except FileExistsError:
+            pass
+        except OSError:
+            shutil.copyfile(source_path, path)
+
+
+class LfsClient:
+    """Client for the Git LFS batch API with the basic transfer adapter."""
+
+    def __init__(self, url: str, auth: Optional[Tuple[str, str]] = None, workers: int = 8,
+                 logger: Optional[logging.Logger] = None):
+        self.url = url
+        self.auth = auth
+        self.workers = max(workers, 1)
+        self.logger = logger or logging.getLogger(__name__)
+        # Imported here so that runs without LFS never load requests
+        import requests
+        self.session = requests.Session()
+
+    def batch(self, operation: str, objects: Dict[str, int]) -> List[Dict]:
+        """Ask the server how to transfer objects, BATCH_SIZE at a time."""
+        items = sorted(objects.items())
+        results = []
+        for start in range(0, len(items), BATCH_SIZE):
+            payload = {
+                'operation': operation,
+                'transfers': ['basic'],
+                'objects': [{'oid': oid, 'size': size} for oid, size in items[start:start + BATCH_SIZE]],
+            }
+            response = self.session.post(f'{self.url}/objects/batch', data=json.dumps(payload), auth=self.auth,
+                                         headers={'Accept': MEDIA_TYPE, 'Content-Type': MEDIA_TYPE}, timeout=60)
+            response.raise_for_status()
+            results.extend(response.json().get('objects', []))
+        return results
+
+    def action_auth(self, action: Dict) -> Optional[Tuple[str, str]]:
+        """Send our credentials along only if the action has none and stays on the LFS host."""
+        if action.get('header') or urlsplit(action['href']).netloc != urlsplit(self.url).netloc:
+            return None
+        return self.auth
+
+    def run_parallel(self, function, items: List[Dict]):
+        """Run one transfer per object on the worker pool and raise the first failure."""
+        import requests
+
+        errors = []
+        with ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix='lfs') as executor:
+            futures = [executor.submit(function, item) for item in items]
+            for future in as_completed(futures):
+                try:
+                    future.result()
+                except (requests.RequestException, OSError, LfsError) as e:
+                    errors.append(e)
+        if errors:
+            raise LfsError(f"{len(errors)} of {len(items)} LFS transfers failed: {errors[0]}")
+
+    def download(self, objects: Dict[str, int], cache: LfsCache):
+        """Download objects into cache."""
+        responses = self.batch('download', objects)
+        for item in responses:
+            if 'error' in item:
+                raise LfsError(f"LFS object {item['oid']}: {item['error'].get('message')}")
+
+        def download_one(item: Dict):
+            action = item['actions']['download']
+            with self.session.get(action['href'], headers=action.get('header', {}), auth=self.action_auth(action),
+                                  stream=True, timeout=60) as response:
+                response.raise_for_status()
+                cache.store(item['oid'], item['size'], response.iter_content(CHUNK_SIZE))
+
+        self.run_parallel(download_one, responses)
+
+    def upload(self, objects: Dict[str, int], cache: LfsCache) -> int:
+        """Upload the objects the server does not have yet; return how many were sent."""
+        responses = self.batch('upload', objects)
+        for item in responses:
+            if 'error' in item:
+                raise LfsError(f"LFS object {item['oid']}: {item['error'].get('message')}")
+        # Objects the server already has come back without actions
+        pending = [item for item in responses if item.get('actions', {}).get('upload')]
+
+        def upload_one(item: Dict):
+            action = item['actions']['upload']
+            headers = {'Content-Type': 'application/octet-stream', **action.get('header', {})}
+            with open(cache.path(item['oid']), 'rb') as f:
+                response = self.session.put(action['href'], data=f, headers=headers,
+                                            auth=self.action_auth(action), timeout=60)
+            response.raise_for_status()
+            verify = item['actions'].get('verify')
+            if verify:
+                response = self.session.post(verify['href'], data=json.dumps({'oid': item['oid'], 'size': item['size']}),
+                                             headers={'Content-Type': MEDIA_TYPE, **verify.get('header', {})},
+                                             auth=self.action_auth(verify), timeout=60)
+                response.raise_for_status()
+
+        self.run_parallel(upload_one, pending)
+        return len(pending)
+
+
+class LfsTransfer:
+    """Moves the LFS objects of split targets from the source, through a shared cache, to each destination."""
+
+    def __init__(self, cache_dir: str, source_store: Optional[str] = None, source_lfs_url: Optional[str] = None,
+                 auth: Optional[Tuple[str, str]] = None, workers: int = 8, logger: Optional[logging.Logger] = None):
+        self.cache = LfsCache(cache_dir)
+        self.source_store = source_store
+        self.auth = auth
+        self.workers = workers
+        self.logger = logger or logging.getLogger(__name__)
+        self.source = LfsClient(source_lfs_url, auth, workers, self.logger) if source_lfs_url else None
+        self.lock = threading.Lock()
+        self.in_flight: Dict[str, threading.Event] = {}
+        self.stats = {'fetched': 0, 'fetched_bytes': 0, 'uploaded': 0}
+
+    def fetch(self, objects: Dict[str, int]):
+        """Make sure every object is cached; objects another target is fetching are waited for."""
+        with self.lock:
+            missing = {}
+            waiting = []
+            for oid, size in objects.items():
+                if oid in self.in_flight:
+                    waiting.append(self.in_flight[oid])
+                elif not self.cache.has(oid, size):
+                    missing[oid] = size
+                    self.in_flight[oid] = threading.Event()
+
+        try:
+            if missing:
+                self.fetch_missing(missing)
+        finally:
+            with self.lock:
+                for oid in missing:
+                    self.in_flight.pop(oid).set()
+        for event in waiting:
+            event.wait()
+
+        absent = sorted(oid for oid, size in objects.items() if not self.cache.has(oid, size))
+        if absent:
+            raise LfsError(f"{len(absent)} LFS objects are not available from the source, e.g. {absent[0]}")
+
+    def fetch_missing(self, objects: Dict[str, int]):
+        """Copy objects from the local source store or download them from the source LFS server."""
+        if self.source_store:
+            for oid in objects:
+                source_path = os.path.join(self.source_store, oid[:2], oid[2:4], oid)
+                if os.path.exists(source_path):
+                    self.cache.link(oid, source_path)
+        elif self.source:
+            self.source.download(objects, self.cache)
+        fetched = [oid for oid, size in objects.items() if self.cache.has(oid, size)]
+        with self.lock:
+            self.stats['fetched'] += len(fetched)
+            self.stats['fetched_bytes'] += sum(objects[oid] for oid in fetched)
+        self.logger.info(f"Fetched {len(fetched)} LFS objects into {self.cache.root}")
+
+    def push(self, objects: Dict[str, int], remote_url: str) -> int:
+        """Upload cached objects to the LFS server of remote_url; return how many were sent."""
+        client = LfsClient(lfs_endpoint(remote_url), self.auth, self.workers, self.logger)
+        uploaded = client.upload(objects, self.cache)
+        with self.lock:
+            self.stats['uploaded'] += uploaded
+        return uploaded
+
+    def export(self, objects: Dict[str, int], directory: str):
+        """Copy cached objects into directory with the same layout, e.g. next to bundles."""
+        target = LfsCache(directory)
+        for oid, size in objects.items():
+            if not target.has(oid, size):
+                target.link(oid, self.cache.path(oid))
+
+
+def main():
+    """Main entry point."""
+    parser = argparse.ArgumentParser(description="Find, fetch and upload the LFS objects of a split repository")
+    subparsers = parser.add_subparsers(dest='command', required=True)
+
+    scan_parser = subparsers.add_parser('scan', help='List the LFS objects reachable from refs')
+    fetch_parser = subparsers.add_parser('fetch', help='Fetch the reachable LFS objects into the cache')
+    push_parser = subparsers.add_parser('push', help='Upload the reachable LFS objects from the cache')
+    for command_parser in [scan_parser, fetch_parser, push_parser]:
+        command_parser.add_argument('repo', help='Repository to scan')
+        command_parser.add_argument('--ref', action='append', help='Ref to scan (repeatable, default: all branches and tags)')
+        command_parser.add_argument('--cache', default=os.getenv('LFS_CACHE', DEFAULT_CACHE_PATH), help='LFS cache directory')
+    fetch_parser.add_argument('--source', required=True, help='Source repository URL or local path')
+    push_parser.add_argument('--remote', required=True, help='Destination repository URL')
+    args = parser.parse_args()
+
+    import requests
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+    token = os.getenv('GITHUB_TOKEN')
+    auth = ('x-access-token', token) if token else None
+    try:
+        objects = scan_pointers(args.repo, args.ref or ['--branches', '--tags'])
+        if args.command == 'scan':
+            for oid, size in sorted(objects.items()):
+                print(f"{oid} {size}")
+            print(f"{len(objects)} LFS objects, {sum(objects.values())} bytes")
+        elif args.command == 'fetch':
+            store = local_lfs_store(args.source)
+            transfer = LfsTransfer(args.cache, source_store=store,
+                                   source_lfs_url=None if store else lfs_endpoint(args.source), auth=auth)
+            transfer.fetch(objects)
+        else:
+            transfer = LfsTransfer(args.cache, auth=auth)
+            transfer.fetch(objects)
+            print(f"Uploaded {transfer.push(objects, args.remote)} of {len(objects)} LFS objects")
+    except (OSError, ValueError, LfsError, requests.RequestException, subprocess.CalledProcessError) as e:
+        print(f"Error: {e}")
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
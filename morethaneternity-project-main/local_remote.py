@@ -0,0 +1,506 @@
+#!/usr/bin/env python3
+"""
+Local Git Remote with a Shaped Network
+
+Serves bare repositories over git's smart HTTP protocol (`git http-backend`)
+together with a minimal fake of the GitHub endpoints the splitter uses to
+create repositories, so a whole split can be benchmarked and stress-tested
+offline. Every request can be slowed down and made to fail:
+
+    - latency: seconds added before each response (each git round trip pays it)
+    - bandwidth: bytes per second for request and response bodies, per connection
+    - failure rate: share of git and LFS requests that fail, either with a 503
+      or by dropping the connection halfway through the response
+
+Fake API endpoints, under <url>/api/v3:
+
+    GET  /user, /orgs/{org}
+    GET  /repos/{owner}/{name}
+    POST /user/repos, /orgs/{org}/repos   (creates {root}/{owner}/{name}.git)
+
+GET answers carry an ETag, and a request whose If-None-Match matches it gets
+304 Not Modified, which like on GitHub does not lower X-RateLimit-Remaining.
+
+Each repository also has an LFS server at <clone URL>/info/lfs (batch API,
+basic transfers). It stores objects in the repository's own lfs/objects,
+laid out the way git-lfs stores them locally.
+
+Usage:
+    python local_remote.py ROOT [--port 8900] [--latency 0.05] [--bandwidth 2M]
+                                [--failure-rate 0.1] [--failure-mode status|reset] [--seed 1]
+
+Then run the splitter against it:
+    GITHUB_API_URL=http://127.0.0.1:8900/api/v3 ORG=splitter GITHUB_TOKEN=any python split_repo_agent.py
+"""
+
+import os
+import re
+import sys
+import json
+import time
+import hashlib
+import random
+import logging
+import argparse
+import threading
+import subprocess
+from dataclasses import dataclass, asdict
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+from typing import Dict, Optional, Tuple
+from urllib.parse import urlsplit
+
+
+API_PREFIX = '/api/v3'
+GIT_PREFIX = '/git'
+CHUNK_SIZE = 16 * 1024
+SIZE_SUFFIXES = {'': 1, 'K': 1024, 'M': 1024 ** 2, 'G': 1024 ** 3}
+# Reported in X-RateLimit-* headers like GitHub's limit for tokens
+RATE_LIMIT = 5000
+RATE_LIMIT_WINDOW = 3600
+
+LFS_PATH_PATTERN = re.compile(r'^/([\w.-]+)/([\w.-]+)\.git/info/lfs/objects/(batch|[0-9a-f]{64})$')
+LFS_MEDIA_TYPE = 'application/vnd.git-lfs+json'
+REPO_PATH_PATTERN = re.compile(r'^/repos/([\w.-]+)/([\w.-]+)$')
+CREATE_PATH_PATTERN = re.compile(r'^/(?:user|orgs/([\w.-]+))/repos$')
+
+
+@dataclass
+class NetworkProfile:
+    """How the local remote shapes git traffic."""
+    latency: float = 0.0  # seconds before every response
+    bandwidth: int = 0  # bytes per second per connection and direction; 0 is unlimited
+    failure_rate: float = 0.0  # share of git and LFS transfer requests that fail
+    failure_mode: str = 'status'  # 'status' answers 503, 'reset' drops the connection mid-response
+    seed: Optional[int] = None  # makes the injected failures repeatable
+
+
+def parse_rate(value: str) -> int:
+    """Parse a byte rate such as 512K or 2M."""
+    match = re.fullmatch(r'(\d+(?:\.\d+)?)([KMG]?)(?:i?B)?(?:/s)?', value.strip(), re.I)
+    if not match:
+        raise ValueError(f"Invalid rate: {value}")
+    return int(float(match.group(1)) * SIZE_SUFFIXES[match.group(2).upper()])
+
+
+class LocalRemote:
+    """A threaded HTTP server for git smart HTTP and fake GitHub repository creation."""
+
+    def __init__(self, root: str, profile: Optional[NetworkProfile] = None, host: str = '127.0.0.1',
+                 port: int = 0, user: str = 'splitter', logger: Optional[logging.Logger] = None):
+        if profile and profile.failure_mode not in ('status', 'reset'):
+            raise ValueError("failure_mode must be either 'status' or 'reset'")
+        self.root = os.path.abspath(root)
+        self.profile = profile or NetworkProfile()
+        self.user = user
+        self.logger = logger or logging.getLogger(__name__)
+        self.random = random.Random(self.profile.seed)
+        self.rate_limit_reset = int(time.time()) + RATE_LIMIT_WINDOW
+        self.lock = threading.Lock()
+        self.stats: Dict[str, int] = {
+            'requests': 0, 'api_requests': 0, 'api_not_modified': 0, 'fetches': 0, 'pushes': 0, 'repos_created': 0,
+            'lfs_downloads': 0, 'lfs_uploads': 0,
+            'failures_injected': 0, 'bytes_received': 0, 'bytes_sent': 0,
+        }
+        os.makedirs(self.root, exist_ok=True)
+
+        self.server = ThreadingHTTPServer((host, port), RemoteRequestHandler)
+        self.server.daemon_threads = True
+        self.server.remote = self
+        self.thread: Optional[threading.Thread] = None
+
+    @property
+    def url(self) -> str:
+        """Base URL of the server."""
+        host, port = self.server.server_address[:2]
+        return f'http://{host}:{port}'
+
+    @property
+    def api_url(self) -> str:
+        """Base URL of the fake GitHub API, for github_api_url / GITHUB_API_URL."""
+        return self.url + API_PREFIX
+
+    def clone_url(self, owner: str, name: str) -> str:
+        """Return the smart HTTP URL of a repository."""
+        return f'{self.url}{GIT_PREFIX}/{owner}/{name}.git'
+
+    def start(self) -> 'LocalRemote':
+        """Serve in a background thread."""
+        self.thread = threading.Thread(target=self.server.serve_forever, name='local-remote', daemon=True)
+        self.thread.start()
+        return self
+
+    def stop(self):
+        """Stop serving and close the socket."""
+        self.server.shutdown()
+        self.server.server_close()
+        if self.thread:
+            self.thread.join()
+
+    def __enter__(self):
+        """Context manager entry."""
+        return self.start()
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        """Context manager exit - stop the server."""
+        self.stop()
+
+    def count(self, key: str, amount: int = 1):
+        """Add to one of the traffic counters."""
+        with self.lock:
+            self.stats[key] += amount
+
+    def should_fail(self) -> bool:
+        """Decide whether the current request gets an injected failure."""
+        if self.profile.failure_rate <= 0:
+            return False
+        with self.lock:
+            return self.random.random() < self.profile.failure_rate
+
+    def throttle(self, num_bytes: int):
+        """Sleep as long as num_bytes take at the configured bandwidth."""
+        if self.profile.bandwidth > 0:
+            time.sleep(num_bytes / self.profile.bandwidth)
+
+    def repo_path(self, owner: str, name: str) -> str:
+        """Return where the bare repository of owner/name lives."""
+        return os.path.join(self.root, owner, f'{name}.git')
+
+    def lfs_path(self, owner: str, name: str, oid: str) -> str:
+        """Return where an LFS object of owner/name is stored."""
+        return os.path.join(self.repo_path(owner, name), 'lfs', 'objects', oid[:2], oid[2:4], oid)
+
+    def repo_json(self, owner: str, name: str) -> Dict:
+        """Return the GitHub API representation of a repository."""
+        with open(os.path.join(self.repo_path(owner, name), 'description')) as f:
+            description = f.read().strip()
+        return {
+            'name': name,
+            'full_name': f'{owner}/{name}',
+            'owner': {'login': owner},
+            'description': description,
+            'private': False,
+            'default_branch': 'main',
+            'clone_url': self.clone_url(owner, name),
+            'html_url': f'{self.url}/{owner}/{name}',
+            'url': f'{self.api_url}/repos/{owner}/{name}',
+        }
+
+    def create_repo(self, owner: str, name: str, description: str = '') -> Optional[Dict]:
+        """Create a bare repository; return None if it already exists."""
+        path = self.repo_path(owner, name)
+        with self.lock:
+            if os.path.exists(path):
+                return None
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            subprocess.run(['git', 'init', '-q', '--bare', '--initial-branch=main', path], check=True)
+            with open(os.path.join(path, 'description'), 'w') as f:
+                f.write(f'{description}\n')
+            self.stats['repos_created'] += 1
+        self.logger.info(f"Created {owner}/{name}")
+        return self.repo_json(owner, name)
+
+
+class RemoteRequestHandler(BaseHTTPRequestHandler):
+    """Dispatches fake GitHub API calls and git smart HTTP requests."""
+
+    server_version = 'LocalRemote/1.0'
+
+    @property
+    def remote(self) -> LocalRemote:
+        return self.server.remote
+
+    def log_message(self, format, *args):
+        self.remote.logger.debug(f"{self.address_string()} {format % args}")
+
+    def do_GET(self):
+        self.handle_request()
+
+    def do_POST(self):
+        self.handle_request()
+
+    def do_PUT(self):
+        self.handle_request()
+
+    def handle_request(self):
+        """Route one request after the configured latency."""
+        self.remote.count('requests')
+        if self.remote.profile.latency > 0:
+            time.sleep(self.remote.profile.latency)
+
+        path = urlsplit(self.path).path
+        if path == '/_stats':
+            self.send_json(200, dict(self.remote.stats))
+        elif path.startswith(API_PREFIX + '/'):
+            self.handle_api(path[len(API_PREFIX):])
+        elif path.startswith(GIT_PREFIX + '/'):
+            lfs = LFS_PATH_PATTERN.match(path[len(GIT_PREFIX):])
+            if lfs:
+                self.handle_lfs(*lfs.groups())
+            else:
+                self.handle_git(path[len(GIT_PREFIX):])
+        else:
+            self.send_json(404, {'message': 'Not Found'})
+
+    def read_body(self) -> bytes:
+        """Read the request body at the configured bandwidth, de-chunking it if needed."""
+        body = b''
+        if self.headers.get('Transfer-Encoding', '').lower() == 'chunked':
+            while True:
+                size = int(self.rfile.readline().split(b';')[0].strip(), 16)
+                if size == 0:
+                    self.rfile.readline()
+                    break
+                body += self.rfile.read(size)
+                self.rfile.readline()
+                self.remote.throttle(size)
+        else:
+            remaining = int(self.headers.get('Content-Length') or 0)
+            while remaining:
+                chunk = self.rfile.read(min(remaining, CHUNK_SIZE))
+                if not chunk:
+                    break
+                body += chunk
+                remaining -= len(chunk)
+                self.remote.throttle(len(chunk))
+        self.remote.count('bytes_received', len(body))
+        return body
+
+    def send_json(self, status: int, data: Dict):
+        """Answer with a JSON document, or 304 Not Modified if an API client already has it."""
+        payload = json.dumps(data).encode()
+        api = self.path.startswith(API_PREFIX + '/')
+        etag = f'"{hashlib.sha1(payload).hexdigest()}"' if api and self.command == 'GET' and status == 200 else None
+        if etag and self.headers.get('If-None-Match') == etag:
+            self.remote.count('api_not_modified')
+            status, payload = 304, b''
+        self.send_response(status)
+        if status != 304:
+            self.send_header('Content-Type', LFS_MEDIA_TYPE if '/info/lfs/' in self.path else 'application/json; charset=utf-8')
+        if etag:
+            self.send_header('ETag', etag)
+        if api:
+            # Like GitHub, so clients can watch their headroom; a 304 costs none of it
+            used = self.remote.stats['api_requests'] - self.remote.stats['api_not_modified']
+            self.send_header('X-RateLimit-Limit', str(RATE_LIMIT))
+            self.send_header('X-RateLimit-Remaining', str(max(RATE_LIMIT - used, 0)))
+            self.send_header('X-RateLimit-Reset', str(self.remote.rate_limit_reset))
+        self.send_header('Content-Length', str(len(payload)))
+        self.end_headers()
+        self.wfile.write(payload)
+
+    def handle_api(self, path: str):
+        """Answer the repository endpoints of the GitHub REST API."""
+        self.remote.count('api_requests')
+        body = self.read_body() if self.command == 'POST' else b''
+
+        if self.command == 'GET' and path == '/user':
+            self.send_json(200, {'login': self.remote.user, 'type': 'User'})
+            return
+        if self.command == 'GET' and path.startswith('/orgs/'):
+            self.send_json(200, {'login': path.split('/')[2], 'type': 'Organization'})
+            return
+
+        match = REPO_PATH_PATTERN.match(path)
+        if self.command == 'GET' and match:
+            owner, name = match.groups()
+            if os.path.isdir(self.remote.repo_path(owner, name)):
+                self.send_json(200, self.remote.repo_json(owner, name))
+            else:
+                self.send_json(404, {'message': 'Not Found'})
+            return
+
+        match = CREATE_PATH_PATTERN.match(path)
+        if self.command == 'POST' and match:
+            try:
+                data = json.loads(body or b'{}')
+            except ValueError:
+                self.send_json(400, {'message': 'Problems parsing JSON'})
+                return
+            if not data.get('name'):
+                self.send_json(422, {'message': 'Validation Failed', 'errors': [{'field': 'name', 'code': 'missing'}]})
+                return
+            owner = match.group(1) or self.remote.user
+            repo = self.remote.create_repo(owner, data['name'], data.get('description', ''))
+            if repo is None:
+                self.send_json(422, {'message': 'Repository creation failed.',
+                                     'errors': [{'field': 'name', 'code': 'custom',
+                                                 'message': 'name already exists on this account'}]})
+            else:
+                self.send_json(201, repo)
+            return
+
+        self.send_json(404, {'message': 'Not Found'})
+
+    def handle_lfs(self, owner: str, name: str, target: str):
+        """Answer the LFS batch API and basic transfers of one repository."""
+        body = self.read_body() if self.command in ('POST', 'PUT') else b''
+        if not os.path.isdir(self.remote.repo_path(owner, name)):
+            self.send_json(404, {'message': 'Repository not found'})
+            return
+
+        if target == 'batch' and self.command == 'POST':
+            self.send_json(200, self.lfs_batch(owner, name, json.loads(body or b'{}')))
+            return
+
+        path = self.remote.lfs_path(owner, name, target)
+        fail = self.remote.should_fail()
+        if fail and self.remote.profile.failure_mode == 'status':
+            self.remote.count('failures_injected')
+            self.send_error(503, 'Injected failure')
+            return
+
+        if self.command == 'PUT':
+            if hashlib.sha256(body).hexdigest() != target:
+                self.send_json(422, {'message': 'Object does not match its OID'})
+                return
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            temp_path = f'{path}.tmp{threading.get_ident()}'
+            with open(temp_path, 'wb') as f:
+                f.write(body)
+            os.replace(temp_path, path)
+            self.remote.count('lfs_uploads')
+            self.send_payload(200, [], b'')
+        elif self.command == 'GET' and os.path.exists(path):
+            with open(path, 'rb') as f:
+                payload = f.read()
+            self.remote.count('lfs_downloads')
+            self.send_payload(200, [('Content-Type', 'application/octet-stream')], payload, fail)
+        else:
+            self.send_json(404, {'message': 'Object does not exist'})
+
+    def lfs_batch(self, owner: str, name: str, request: Dict) -> Dict:
+        """Return the actions for a batch request: downloads of stored objects, uploads of missing ones."""
+        base = f'{self.remote.clone_url(owner, name)}/info/lfs/objects'
+        objects = []
+        for item in request.get('objects', []):
+            oid, size = item['oid'], item['size']
+            path = self.remote.lfs_path(owner, name, oid)
+            stored = os.path.exists(path) and os.path.getsize(path) == size
+            entry = {'oid': oid, 'size': size, 'authenticated': True}
+            if request.get('operation') == 'upload':
+                if not stored:
+                    entry['actions'] = {'upload': {'href': f'{base}/{oid}', 'header': {}}}
+            elif stored:
+                entry['actions'] = {'download': {'href': f'{base}/{oid}', 'header': {}}}
+            else:
+                entry['error'] = {'code': 404, 'message': 'Object does not exist'}
+            objects.append(entry)
+        return {'transfer': 'basic', 'objects': objects}
+
+    def send_payload(self, status: int, headers: list, payload: bytes, fail: bool = False):
+        """Send a response body at the configured bandwidth; a reset sends half of it and closes the connection."""
+        self.send_response(status)
+        for key, value in headers:
+            self.send_header(key, value)
+        self.send_header('Content-Length', str(len(payload)))
+        self.end_headers()
+
+        limit = len(payload) // 2 if fail else len(payload)
+        for offset in range(0, limit, CHUNK_SIZE):
+            chunk = payload[offset:min(offset + CHUNK_SIZE, limit)]
+            try:
+                self.wfile.write(chunk)
+            except (BrokenPipeError, ConnectionResetError) as e:
+                # The client gave up, e.g. a push that timed out or was cancelled; not a server error
+                self.remote.logger.debug(f"{self.address_string()} disconnected during {self.command} {self.path}: {e}")
+                self.close_connection = True
+                return
+            self.remote.count('bytes_sent', len(chunk))
+            self.remote.throttle(len(chunk))
+        if fail:
+            self.remote.count('failures_injected')
+            self.close_connection = True
+            self.wfile.flush()
+            self.connection.close()
+
+    def handle_git(self, path_info: str):
+        """Run git http-backend for one smart HTTP request, with failures and bandwidth applied."""
+        body = self.read_body() if self.command == 'POST' else b''
+        if path_info.endswith('/git-receive-pack'):
+            self.remote.count('pushes')
+        elif path_info.endswith('/git-upload-pack'):
+            self.remote.count('fetches')
+
+        fail = self.remote.should_fail()
+        if fail and self.remote.profile.failure_mode == 'status':
+            self.remote.count('failures_injected')
+            self.send_error(503, 'Injected failure')
+            return
+
+        env = {
+            'PATH': os.environ.get('PATH', ''),
+            'HOME': os.environ.get('HOME', ''),
+            'GIT_PROJECT_ROOT': self.remote.root,
+            'GIT_HTTP_EXPORT_ALL': '1',
+            # A remote user enables receive-pack without per-repository http.receivepack
+            'REMOTE_USER': self.remote.user,
+            'REMOTE_ADDR': self.client_address[0],
+            'REQUEST_METHOD': self.command,
+            'PATH_INFO': path_info,
+            'QUERY_STRING': urlsplit(self.path).query,
+            'CONTENT_TYPE': self.headers.get('Content-Type', ''),
+            'CONTENT_LENGTH': str(len(body)),
+        }
+        if self.headers.get('Content-Encoding'):
+            env['HTTP_CONTENT_ENCODING'] = self.headers['Content-Encoding']
+        if self.headers.get('Git-Protocol'):
+            env['GIT_PROTOCOL'] = self.headers['Git-Protocol']
+
+        result = subprocess.run(['git', 'http-backend'], input=body, env=env, capture_output=True)
+        status, headers, payload = parse_cgi_response(result.stdout)
+        self.send_payload(status, headers, payload, fail)
+
+
+def parse_cgi_response(output: bytes) -> Tuple[int, list, bytes]:
+    """Split CGI output into status, headers and body."""
+    separator = b'\r\n\r\n' if b'\r\n\r\n' in output else b'\n\n'
+    head, _, body = output.partition(separator)
+    status = 200
+    headers = []
+    for line in head.decode('latin-1').splitlines():
+        key, _, value = line.partition(':')
+        if key.lower() == 'status':
+            status = int(value.split()[0])
+        elif key:
+            headers.append((key, value.strip()))
+    return status, headers, body
+
+
+def main():
+    """Main entry point."""
+    parser = argparse.ArgumentParser(description="Serve local bare repositories and a fake GitHub API over a shaped network")
+    parser.add_argument('root', help='Directory holding the repositories ({owner}/{name}.git)')
+    parser.add_argument('--host', default='127.0.0.1', help='Address to listen on')
+    parser.add_argument('--port', type=int, default=8900, help='Port to listen on (0 picks a free one)')
+    parser.add_argument('--user', default='splitter', help='Login of the authenticated fake user')
+    parser.add_argument('--latency', type=float, default=0.0, help='Seconds added before every response')
+    parser.add_argument('--bandwidth', default='0', help='Bytes per second per connection, e.g. 2M (0 is unlimited)')
+    parser.add_argument('--failure-rate', type=float, default=0.0, help='Share of git requests that fail (0-1)')
+    parser.add_argument('--failure-mode', choices=['status', 'reset'], default='status',
+                        help='Answer 503, or drop the connection halfway through the response')
+    parser.add_argument('--seed', type=int, help='Random seed for repeatable failures')
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+    try:
+        profile = NetworkProfile(latency=args.latency, bandwidth=parse_rate(args.bandwidth),
+                                 failure_rate=args.failure_rate, failure_mode=args.failure_mode, seed=args.seed)
+        remote = LocalRemote(args.root, profile, host=args.host, port=args.port, user=args.user)
+    except (OSError, ValueError) as e:
+        print(f"Error: {e}")
+        sys.exit(1)
+
+    print(f"Serving {remote.root} at {remote.url}{GIT_PREFIX}/")
+    print(f"Fake GitHub API: {remote.api_url}  (ORG={args.user})")
+    print(f"Network: {json.dumps(asdict(profile))}")
+    try:
+        remote.server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        remote.server.server_close()
+        print(f"Traffic: {json.dumps(remote.stats)}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,329 @@
+#!/usr/bin/env python3
+"""
+Preflight Checks
+
+Checks that a split can run before it starts: the interpreter, git and
+git-filter-repo, the Python packages, the configuration, the GitHub token
+and the source repository. The checks run at the same time, so the doctor
+takes as long as its slowest check instead of the sum of them.
+
+A passing result is cached in a JSON file for a TTL, under a key of what it
+depends on:
+
+    git, git-filter-repo   path, size and modification time of the executable,
+                           so an upgrade invalidates the result
+    GitHub                 API URL and a SHA-256 fingerprint of the token
+    source repository      URL and the git executable
+
+A new token or tool therefore runs the check again at once, and a scheduler
+that asks the doctor before every split makes the live calls once per TTL.
+Failures are never cached; the next run checks again. The cache holds no
+secrets, only hashes of the keys.
+
+Usage:
+    python preflight.py [--mode branch|project] [--refresh] [--ttl SECONDS] [--json]
+    python split_repo_agent.py --doctor [--refresh-preflight]
+"""
+
+import os
+import sys
+import json
+import time
+import shutil
+import hashlib
+import argparse
+import subprocess
+import importlib.util
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass, asdict
+from typing import Callable, Dict, List, Optional, Tuple
+
+from shared_files import locked, replace_json
+from target_discovery import parse_names, wants_discovery
+from github_cache import GitHubCache, GitHubApiError, DEFAULT_GITHUB_CACHE
+
+
+DEFAULT_PREFLIGHT_CACHE = 'preflight_cache.json'
+DEFAULT_PREFLIGHT_TTL = 900
+CACHE_VERSION = 1
+MIN_PYTHON = (3, 9)
+CHECK_TIMEOUT = 30
+DEFAULT_GITHUB_API_URL = "https://api.github.com"
+
+# (package, import name) of the runtime dependencies; found without importing them
+REQUIRED_PACKAGES = [
+    ('PyGithub', 'github'),
+    ('python-dotenv', 'dotenv'),
+    ('requests', 'requests'),
+]
+
+Outcome = Tuple[bool, str, str]  # (passed, detail, hint)
+
+
+@dataclass
+class PreflightSettings:
+    """The parts of the splitter configuration the checks look at."""
+    source_repo_url: str
+    mode: str
+    targets: Optional[List[str]]  # branches or projects; None if they are discovered
+    org: str = ""
+    github_token: str = ""
+    github_api_url: str = DEFAULT_GITHUB_API_URL
+    output_mode: str = "push"
+    github_cache: str = DEFAULT_GITHUB_CACHE
+
+
+@dataclass
+class Check:
+    """One preflight check."""
+    name: str
+    run: Callable[[], Outcome]
+    key: str = ""  # what a passing result depends on; empty means it is never cached
+
+
+@dataclass
+class CheckResult:
+    """The outcome of one check."""
+    name: str
+    passed: bool
+    detail: str
+    hint: str = ""
+    cached: bool = False
+    seconds: float = 0.0  # time the check took, or the age of a cached result
+
+
+def load_settings(mode: Optional[str] = None) -> PreflightSettings:
+    """Read the settings from environment variables (load .env first)."""
+    mode = (mode or os.getenv('MODE', 'branch')).lower()
+    variable = 'BRANCHES' if mode == 'branch' else 'PROJECTS'
+    return PreflightSettings(
+        source_repo_url=os.getenv('SOURCE_REPO_URL', ''),
+        mode=mode,
+        targets=None if wants_discovery(os.getenv(variable)) else parse_names(os.getenv(variable)),
+        org=os.getenv('ORG', ''),
+        github_token=os.getenv('GITHUB_TOKEN', ''),
+        github_api_url=os.getenv('GITHUB_API_URL') or DEFAULT_GITHUB_API_URL,
+        output_mode=os.getenv('OUTPUT_MODE', 'push').lower(),
+        github_cache=os.getenv('GITHUB_CACHE', DEFAULT_GITHUB_CACHE),
+    )
+
+
+def tool_fingerprint(name: str) -> str:
+    """Identify the installed version of an executable without running it."""
+    path = shutil.which(name)
+    if not path:
+        return f'{name}:missing'
+    stat = os.stat(path)
+    return f'{path}:{stat.st_size}:{stat.st_mtime_ns}'
+
+
+def secret_fingerprint(value: str) -> str:
+    """Return a short hash of a secret; the secret itself never reaches the cache."""
+    return hashlib.sha256(value.encode()).hexdigest()[:16] if value else 'none'
+
+
+def run_tool(command: List[str]) -> subprocess.CompletedProcess:
+    """Run a command of a check, never waiting for a password prompt."""
+    return subprocess.run(command, capture_output=True, text=True, timeout=CHECK_TIMEOUT,
+                          env={**os.environ, 'GIT_TERMINAL_PROMPT': '0'})
+
+
+def check_python() -> Outcome:
+    version = sys.version_info
+    if version[:2] < MIN_PYTHON:
+        return False, f"Python {MIN_PYTHON[0]}.{MIN_PYTHON[1]}+ required, found {version.major}.{version.minor}", ""
+    return True, f"Python {version.major}.{version.minor}.{version.micro}", ""
+
+
+def check_tool(command: List[str], hint: str) -> Outcome:
+    """Run a tool's --version."""
+    try:
+        result = run_tool(command)
+    except FileNotFoundError:
+        return False, f"{command[0]} not found in PATH", hint
+    if result.returncode != 0:
+        return False, f"{' '.join(command)} failed: {result.stderr.strip()}", hint
+    return True, result.stdout.strip(), ""
+
+
+def check_packages() -> Outcome:
+    missing = [package for package, module in REQUIRED_PACKAGES if importlib.util.find_spec(module) is None]
+    if missing:
+        return False, f"not installed: {', '.join(missing)}", f"Install with: pip install {' '.join(missing)}"
+    return True, ', '.join(package for package, _ in REQUIRED_PACKAGES), ""
+
+
+def check_config(settings: PreflightSettings) -> Outcome:
+    problems = []
+    if settings.mode not in ('branch', 'project'):
+        problems.append(f"MODE must be 'branch' or 'project', not '{settings.mode}'")
+    if not settings.source_repo_url:
+        problems.append("SOURCE_REPO_URL is not set")
+    if settings.output_mode == 'push':
+        problems.extend(f"{name} is not set" for name, value in (('ORG', settings.org),
+                                                                  ('GITHUB_TOKEN', settings.github_token)) if not value)
+    variable = 'BRANCHES' if settings.mode == 'branch' else 'PROJECTS'
+    if settings.targets is not None and not settings.targets:
+        problems.append(f"{variable} is empty (or set it to auto)")
+    if problems:
+        return False, '; '.join(problems), "Copy env.example to .env and fill it in"
+    targets = (f"{variable}=auto" if settings.targets is None
+               else f"{len(settings.targets)} {'branches' if settings.mode == 'branch' else 'projects'}")
+    return True, f"{settings.mode} mode, {targets}, output {settings.output_mode}", ""
+
+
+def check_github(settings: PreflightSettings) -> Outcome:
+    # Always revalidated (max_age 0): a revoked token answers 401 instead of 304, and a 304 is free
+    github = GitHubCache(settings.github_api_url, settings.github_token, settings.github_cache, max_age=0)
+    try:
+        login = github.user()['login']
+    except GitHubApiError as e:
+        return False, f"{settings.github_api_url}: {e}", "Check GITHUB_TOKEN and GITHUB_API_URL"
+    return True, f"authenticated as {login} at {settings.github_api_url}", ""
+
+
+def check_source(settings: PreflightSettings) -> Outcome:
+    try:
+        result = run_tool(['git', 'ls-remote', settings.source_repo_url, 'HEAD'])
+    except subprocess.TimeoutExpired:
+        return False, f"no answer from {settings.source_repo_url} within {CHECK_TIMEOUT}s", ""
+    except FileNotFoundError:
+        return False, "git not found in PATH", ""
+    if result.returncode != 0 or not result.stdout.strip():
+        error = result.stderr.strip().splitlines()[-1:] or ["no HEAD"]
+        return False, f"{settings.source_repo_url}: {error[0]}", "Check SOURCE_REPO_URL and the credentials git uses for it"
+    return True, f"HEAD at {result.stdout.split()[0][:12]}", ""
+
+
+def default_checks(settings: PreflightSettings) -> List[Check]:
+    """Return the checks of a configuration."""
+    git = tool_fingerprint('git')
+    checks = [
+        Check('Python', check_python),
+        Check('git', lambda: check_tool(['git', '--version'], "Install git"), git),
+        Check('git-filter-repo', lambda: check_tool(['git-filter-repo', '--version'], "Install with: pip install git-filter-repo"),
+              tool_fingerprint('git-filter-repo')),
+        Check('Python packages', check_packages),
+        Check('Configuration', lambda: check_config(settings)),
+    ]
+    if settings.github_token:
+        checks.append(Check('GitHub', lambda: check_github(settings),
+                            f'{settings.github_api_url}:{secret_fingerprint(settings.github_token)}'))
+    if settings.source_repo_url:
+        checks.append(Check('Source repository', lambda: check_source(settings), f'{settings.source_repo_url}:{git}'))
+    return checks
+
+
+def load_cache(cache_path: str) -> Dict[str, Dict]:
+    """Read the cached results; an unreadable or outdated cache has none."""
+    if not cache_path or not os.path.exists(cache_path):
+        return {}
+    try:
+        with open(cache_path) as f:
+            cache = json.load(f)
+    except (OSError, ValueError):
+        return {}
+    return cache.get('results', {}) if cache.get('version') == CACHE_VERSION else {}
+
+
+def save_cache(cache_path: str, updates: Dict[str, Optional[Dict]]):
+    """Merge updated results into the cache (None removes one) and replace it atomically; concurrent runs share it."""
+    with locked(cache_path):
+        results = load_cache(cache_path)
+        for name, entry in updates.items():
+            if entry is None:
+                results.pop(name, None)
+            else:
+                results[name] = entry
+        replace_json(cache_path, {'version': CACHE_VERSION, 'results': results})
+
+
+def cache_key(check: Check) -> str:
+    return hashlib.sha256(f'{check.name}\0{check.key}'.encode()).hexdigest()
+
+
+def run_check(check: Check) -> CheckResult:
+    start = time.monotonic()
+    try:
+        passed, detail, hint = check.run()
+    except Exception as e:
+        passed, detail, hint = False, f"{type(e).__name__}: {e}", ""
+    return CheckResult(check.name, passed, detail, hint, seconds=time.monotonic() - start)
+
+
+def run_checks(checks: List[Check], cache_path: str = DEFAULT_PREFLIGHT_CACHE, ttl: int = DEFAULT_PREFLIGHT_TTL,
+               refresh: bool = False) -> List[CheckResult]:
+    """Run the checks concurrently, reusing passing results younger than ttl seconds; results keep check order."""
+    cache = load_cache(cache_path) if cache_path else {}
+    now = time.time()
+    results: Dict[str, CheckResult] = {}
+    pending = []
+    for check in checks:
+        entry = cache.get(check.name)
+        if (check.key and not refresh and ttl > 0 and entry and entry['key'] == cache_key(check)
+                and now - entry['checked_at'] < ttl):
+            results[check.name] = CheckResult(check.name, True, entry['detail'], cached=True,
+                                              seconds=now - entry['checked_at'])
+        else:
+            pending.append(check)
+
+    if pending:
+        updates: Dict[str, Optional[Dict]] = {}
+        with ThreadPoolExecutor(max_workers=len(pending), thread_name_prefix='preflight') as executor:
+            for check, result in zip(pending, executor.map(run_check, pending)):
+                results[check.name] = result
+                if check.key and result.passed:
+                    updates[check.name] = {'key': cache_key(check), 'detail': result.detail, 'checked_at': now}
+                else:
+                    updates[check.name] = None
+        if cache_path:
+            try:
+                save_cache(cache_path, updates)
+            except OSError:
+                pass  # a read-only working directory only costs the next run its cache
+    return [results[check.name] for check in checks]
+
+
+def print_results(results: List[CheckResult]):
+    """Print one line per check, with a hint under failed ones."""
+    for result in results:
+        note = f" (cached {result.seconds:.0f}s ago)" if result.cached else ""
+        print(f"{'✅' if result.passed else '❌'} {result.name}: {result.detail}{note}")
+        if result.hint and not result.passed:
+            print(f"   {result.hint}")
+
+
+def doctor(settings: PreflightSettings, cache_path: str = DEFAULT_PREFLIGHT_CACHE, ttl: int = DEFAULT_PREFLIGHT_TTL,
+           refresh: bool = False, as_json: bool = False) -> bool:
+    """Run and print every check of a configuration; return True if all of them passed."""
+    start = time.monotonic()
+    results = run_checks(default_checks(settings), cache_path, ttl, refresh)
+    if as_json:
+        print(json.dumps([asdict(result) for result in results], indent=2))
+    else:
+        print_results(results)
+        cached = sum(result.cached for result in results)
+        print(f"{len(results)} checks in {time.monotonic() - start:.2f}s ({cached} cached)")
+    return all(result.passed for result in results)
+
+
+def main():
+    """Main entry point."""
+    parser = argparse.ArgumentParser(description="Check that the repository splitter can run")
+    parser.add_argument('--mode', choices=['branch', 'project'], help='Mode to check (default: MODE)')
+    parser.add_argument('--cache', default=None, help=f"Result cache ('' disables it, default {DEFAULT_PREFLIGHT_CACHE})")
+    parser.add_argument('--ttl', type=int, help='Seconds a passing result is reused')
+    parser.add_argument('--refresh', action='store_true', help='Run every check, ignoring cached results')
+    parser.add_argument('--json', action='store_true', help='Print the results as JSON')
+    args = parser.parse_args()
+
+    from dotenv import load_dotenv
+    load_dotenv()
+    cache_path = args.cache if args.cache is not None else os.getenv('PREFLIGHT_CACHE', DEFAULT_PREFLIGHT_CACHE)
+    ttl = args.ttl if args.ttl is not None else int(os.getenv('PREFLIGHT_TTL', DEFAULT_PREFLIGHT_TTL))
+    if not doctor(load_settings(args.mode), cache_path, ttl, args.refresh, args.json):
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
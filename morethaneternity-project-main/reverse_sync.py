@@ -0,0 +1,259 @@
+#!/usr/bin/env python3
+"""
+Reverse Sync
+
+Replays the commits made in a split repository since the last sync onto a
+monorepo branch, so teams that moved to `<project>-app` and teams that still
+work in the monorepo stop overwriting each other. Each new commit of the
+target becomes one monorepo commit whose `<prefix>/` is the target's tree,
+with the rest of the monorepo left as it was:
+
+    target commit T --> monorepo commit: tree = branch tip with <prefix>/ = tree of T
+                                         author, committer, message of T
+
+Only the first-parent chain since the boundary is replayed, so a merge in
+the target lands as one commit carrying what it merged. The boundary is
+the set of target commits the monorepo already has: the last synced one
+and the commits of the newest split (see CommitIndex.sync_boundary()), so
+the work grows with the number of new commits, not with history.
+
+Paths where the monorepo differs from the target's starting point keep
+the monorepo's content: files changed in the monorepo since the split, or
+ones the split added to the target, such as the common-libs submodule. If
+the target changed one of them as well, the target is not synced.
+
+Usage:
+    python reverse_sync.py REPO TARGET_REF --prefix fractol [--branch main]
+                           (--boundary SHA ... | --source-url URL --target fractol-app [--db commit_index.db])
+
+    REPO must have the objects of TARGET_REF, e.g. after
+    `git fetch <target url> main:refs/sync/fractol-app`. The branch is moved
+    to the replayed commits; pushing it is left to the caller.
+"""
+
+import os
+import sys
+import hashlib
+import logging
+import argparse
+import subprocess
+from dataclasses import dataclass, field
+from typing import Dict, Iterable, List, Optional, Tuple
+
+from commit_index import CommitIndex, DEFAULT_INDEX_PATH
+from history_rewrite import git, read_commits, read_objects, write_objects, EMPTY_TREE
+from submodule_wiring import TreeEntry, TREE_MODE, parse_tree, build_tree
+
+
+Entry = Optional[Tuple[bytes, str]]  # (mode, object id) of a path, None where it does not exist
+
+
+class SyncConflict(Exception):
+    """The split repository changed paths that differ in the monorepo."""
+
+
+@dataclass
+class SyncResult:
+    """What replaying one target produced."""
+    target: str
+    tip: str  # newest monorepo commit, the one the next target is replayed onto
+    commit_map: Dict[str, str] = field(default_factory=dict)  # new monorepo commit -> target commit
+    target_tip: Optional[str] = None  # newest target commit replayed; None if there was nothing new
+    skipped: int = 0  # target commits that changed nothing the monorepo keeps
+
+
+def split_path(path: str) -> List[bytes]:
+    """Split a repository path into its components."""
+    return [part.encode() for part in path.strip('/').split('/') if part]
+
+
+class ReverseSync:
+    """Replay new commits of split repositories onto monorepo branches in one repository."""
+
+    def __init__(self, repo_path: str, logger: Optional[logging.Logger] = None):
+        self.repo_path = repo_path
+        self.logger = logger or logging.getLogger(__name__)
+        self.objects: Dict[str, bytes] = {}
+        self.trees: Dict[str, List[TreeEntry]] = {}
+
+    def store(self, data: bytes) -> str:
+        """Hash an object and queue it for writing."""
+        sha = hashlib.sha1(data).hexdigest()
+        self.objects[sha] = data
+        return sha
+
+    def store_tree(self, entries: List[TreeEntry]) -> str:
+        """Store a tree object; an empty one is the empty tree."""
+        data = build_tree(entries)
+        sha = self.store(data)
+        self.trees[sha] = parse_tree(data[data.index(b'\0') + 1:])
+        return sha
+
+    def tree_entries(self, tree: str) -> List[TreeEntry]:
+        """Return the entries of a tree, reading it from the repository once."""
+        if tree not in self.trees:
+            self.trees[tree] = parse_tree(read_objects(self.repo_path, [tree])[tree])
+        return self.trees[tree]
+
+    def entry_at(self, tree: str, parts: List[bytes]) -> Entry:
+        """Return the mode and object id at a path of a tree."""
+        entry: Entry = (TREE_MODE, tree)
+        for part in parts:
+            if entry[0] != TREE_MODE:
+                return None
+            match = next((found for found in self.tree_entries(entry[1]) if found[1] == part), None)
+            if match is None:
+                return None
+            entry = (match[0], match[2].hex())
+        return entry
+
+    def set_path(self, tree: Optional[str], parts: List[bytes], entry: Entry) -> Optional[str]:
+        """Return tree with the path set to entry, or removed for None; None if nothing is left."""
+        entries = self.tree_entries(tree) if tree else []
+        current = next((found for found in entries if found[1] == parts[0]), None)
+        entries = [found for found in entries if found[1] != parts[0]]
+        if len(parts) > 1:
+            subtree = current[2].hex() if current and current[0] == TREE_MODE else None
+            subtree = self.set_path(subtree, parts[1:], entry)
+            entry = (TREE_MODE, subtree) if subtree else None
+        if entry:
+            entries.append((entry[0], parts[0], bytes.fromhex(entry[1])))
+        return self.store_tree(entries) if entries else None
+
+    def new_commits(self, tip: str, boundary: List[str]) -> List[str]:
+        """Return the first-parent commits of tip that are not reachable from the boundary, oldest first."""
+        # Boundary commits of an older split may be gone from a target that was force-updated since
+        exclude = ''.join(f'^{sha}\n' for sha in boundary).encode()
+        revs = git(self.repo_path, ['rev-list', '--first-parent', '--reverse', '--ignore-missing', '--stdin', tip],
+                   stdin=exclude)
+        return revs.decode().split()
+
+    def divergence(self, base_tree: str, monorepo_tree: str) -> Dict[bytes, Entry]:
+        """Return the monorepo's entry of every path where it differs from the target's starting point."""
+        output = git(self.repo_path, ['diff-tree', '-r', '-z', base_tree, monorepo_tree]).split(b'\0')
+        paths = {}
+        for header, path in zip(output[0::2], output[1::2]):
+            _, new_mode, _, new_sha, status = header.split()
+            paths[path] = None if status == b'D' else (new_mode, new_sha.decode())
+        return paths
+
+    def check_conflicts(self, target: str, base: Optional[str], shas: List[str], paths: Iterable[bytes]):
+        """Raise SyncConflict if a new target commit changed one of paths since base."""
+        paths = sorted(paths)
+        if not paths:
+            return
+        revisions = ([base] if base else []) + shas
+        lookups = b''.join(sha.encode() + b':' + path + b'\n' for sha in revisions for path in paths)
+        check = git(self.repo_path, ['cat-file', '--batch-check=%(objectname)'], stdin=lookups).decode().splitlines()
+        found = [None if line.endswith(' missing') else line for line in check]
+        rows = [found[offset:offset + len(paths)] for offset in range(0, len(found), len(paths))]
+        start = rows.pop(0) if base else [None] * len(paths)
+        changed = {paths[index].decode(errors='replace') for row in rows
+                   for index, value in enumerate(row) if value != start[index]}
+        if changed:
+            raise SyncConflict(f"'{target}' changed paths that also changed in the monorepo: "
+                               f"{', '.join(sorted(changed)[:10])}")
+
+    def replay(self, target: str, tip: str, boundary: List[str], onto: str, prefix: str,
+               ignore: Iterable[str] = ()) -> SyncResult:
+        """Replay the commits of target from the boundary to tip onto the monorepo commit onto.
+
+        prefix is where the target lives in the monorepo, '' for the whole tree
+        (branch mode). Paths in ignore only exist in the split repository, e.g.
+        the common-libs submodule; they keep the monorepo's content, and changes
+        to them are not conflicts.
+        """
+        if not boundary:
+            raise ValueError(f"No split of '{target}' is recorded, so there is nothing to sync from")
+        result = SyncResult(target, onto)
+        shas = self.new_commits(tip, boundary)
+        if not shas:
+            return result
+
+        commits = read_commits(self.repo_path, shas, None)
+        base = commits[0].parents[0] if commits[0].parents else None
+        base_tree = git(self.repo_path, ['rev-parse', f'{base}^{{tree}}']).decode().strip() if base else EMPTY_TREE
+        onto_tree = git(self.repo_path, ['rev-parse', f'{onto}^{{tree}}']).decode().strip()
+        parts = split_path(prefix)
+        monorepo_entry = self.entry_at(onto_tree, parts) if parts else (TREE_MODE, onto_tree)
+        monorepo_tree = monorepo_entry[1] if monorepo_entry and monorepo_entry[0] == TREE_MODE else EMPTY_TREE
+
+        kept = self.divergence(base_tree, monorepo_tree)
+        ignored = {path.strip('/').encode() for path in ignore}
+        self.check_conflicts(target, base, shas, [path for path in kept if path not in ignored])
+        if kept:
+            self.logger.info(f"'{target}': keeping the monorepo's version of {len(kept)} paths")
+
+        tree = onto_tree
+        for commit in commits:
+            subtree: Optional[str] = commit.tree
+            for path, entry in kept.items():
+                subtree = self.set_path(subtree, path.split(b'/'), entry)
+            if parts:
+                new_tree = self.set_path(tree, parts, (TREE_MODE, subtree) if subtree else None)
+            else:
+                new_tree = subtree
+            new_tree = new_tree or self.store_tree([])
+            if new_tree == tree:
+                result.skipped += 1
+                continue
+
+            body = f'tree {new_tree}\nparent {result.tip}\n'.encode() + commit.headers + b'\n\n' + commit.message
+            result.tip = self.store(b'commit %d\x00' % len(body) + body)
+            result.commit_map[result.tip] = commit.sha
+            tree = new_tree
+
+        result.target_tip = shas[-1]
+        self.logger.info(f"'{target}': replayed {len(result.commit_map)} of {len(shas)} new commits"
+                         + (f" ({result.skipped} changed nothing the monorepo keeps)" if result.skipped else ""))
+        return result
+
+    def write(self):
+        """Write the replayed commits and trees into the repository."""
+        write_objects(self.repo_path, self.objects)
+
+
+def main():
+    """Main entry point."""
+    parser = argparse.ArgumentParser(description="Replay new commits of a split repository onto a monorepo branch")
+    parser.add_argument('repo', help='Monorepo clone that has the objects of the target ref')
+    parser.add_argument('target_ref', help='Fetched ref of the split repository, e.g. refs/sync/fractol-app')
+    parser.add_argument('--prefix', default='', help="Where the target lives in the monorepo ('' for a branch target)")
+    parser.add_argument('--branch', help="Monorepo branch to replay onto (default: the repository's HEAD)")
+    parser.add_argument('--ignore', action='append', default=[], help='Path that only exists in the target (repeatable)')
+    parser.add_argument('--boundary', action='append', default=[], help='Target commit the monorepo already has (repeatable)')
+    parser.add_argument('--db', default=os.getenv('COMMIT_INDEX') or DEFAULT_INDEX_PATH, help='Commit index for the boundary')
+    parser.add_argument('--source-url', help='Source URL of the split, to read the boundary from the commit index')
+    parser.add_argument('--target', help='Target repository name, e.g. fractol-app')
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+    boundary = list(args.boundary)
+    if not boundary:
+        if not args.source_url or not args.target:
+            parser.error("give --boundary, or --source-url and --target to read it from the commit index")
+        boundary = CommitIndex(args.db).sync_boundary(args.source_url, args.target)
+
+    try:
+        branch = args.branch or git(args.repo, ['symbolic-ref', '--short', 'HEAD']).decode().strip()
+        onto = git(args.repo, ['rev-parse', '--verify', f'refs/heads/{branch}']).decode().strip()
+        tip = git(args.repo, ['rev-parse', '--verify', args.target_ref]).decode().strip()
+        sync = ReverseSync(args.repo)
+        result = sync.replay(args.target or args.target_ref, tip, boundary, onto, args.prefix, args.ignore)
+        if result.commit_map:
+            sync.write()
+            git(args.repo, ['update-ref', f'refs/heads/{branch}', result.tip, onto])
+    except (SyncConflict, ValueError) as e:
+        print(f"Error: {e}")
+        sys.exit(1)
+    except subprocess.CalledProcessError as e:
+        print(f"Error: {e.stderr.decode().strip()}")
+        sys.exit(1)
+
+    for new, old in result.commit_map.items():
+        print(f"{old} -> {new}")
+    print(f"{branch}: {onto[:12]} -> {result.tip[:12]}")
+
+
+if __name__ == "__main__":
+    main()
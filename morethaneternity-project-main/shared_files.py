@@ -0,0 +1,35 @@
+#!/usr/bin/env python3
+"""
+Shared State Files
+
+Helpers for the JSON files that several runs update at once, e.g. split
+service jobs in one working directory: the timing history, the GitHub
+metadata cache, the target manifest and the preflight cache. An update
+takes an exclusive lock on FILE.lock, reads the file again, merges its own
+entries and replaces the file atomically, so no run loses the entries
+another one wrote in the meantime.
+"""
+
+import os
+import json
+import fcntl
+from contextlib import contextmanager
+
+
+@contextmanager
+def locked(path: str):
+    """Hold an exclusive lock on path, across processes, through path.lock."""
+    with open(f'{path}.lock', 'a') as lock_file:
+        fcntl.flock(lock_file, fcntl.LOCK_EX)
+        try:
+            yield
+        finally:
+            fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+
+def replace_json(path: str, data):
+    """Write data as JSON to path atomically; readers see the old or the new file, never half of one."""
+    temp_path = f'{path}.tmp{os.getpid()}'
+    with open(temp_path, 'w') as f:
+        json.dump(data, f, indent=2, sort_keys=True)
+    os.replace(temp_path, path)
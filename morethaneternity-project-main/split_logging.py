@@ -0,0 +1,228 @@
+#!/usr/bin/env python3
+"""
+Split Logging
+
+Workers of a split only put their log records on a queue; a single listener
+thread formats them and does the file I/O, so a slow disk never holds a
+rewrite or a push. The listener writes:
+
+    - the console and the shared repo_splitter.log, rotated once it reaches
+      its size limit
+    - one JSON-lines file per target (<log dir>/<time>-<pid>/<target>.jsonl) with
+      that target's records, including what git printed for it
+
+Records are tagged with the target whose thread emitted them
+(see target_context()); records of no target only reach the shared log.
+Lines of git output carry `git_output` and stay out of the console and the
+shared log.
+
+Usage:
+    python split_logging.py logs/20240101-120000-4242 [--target fractol-app]
+    python split_logging.py logs/20240101-120000-4242/fractol-app.jsonl
+
+Prints the records of a target log, or of every target log in a run directory.
+"""
+
+import os
+import sys
+import json
+import queue
+import atexit
+import logging
+import argparse
+import threading
+from contextlib import contextmanager
+from datetime import datetime
+from logging.handlers import QueueHandler, QueueListener, RotatingFileHandler
+from typing import Callable, Dict, Iterator, List, Optional
+
+
+DEFAULT_LOG_FILE = 'repo_splitter.log'
+DEFAULT_LOG_DIR = 'logs'
+DEFAULT_MAX_BYTES = 10 * 1024 * 1024
+DEFAULT_BACKUPS = 5
+LOG_FORMAT = '%(asctime)s - %(levelname)s - %(message)s'
+
+context = threading.local()
+listener: Optional[QueueListener] = None
+
+
+def current_target() -> Optional[str]:
+    """Return the target the calling thread works for, if any."""
+    return getattr(context, 'target', None)
+
+
+@contextmanager
+def target_context(name: str) -> Iterator[None]:
+    """Tag the records this thread emits with a target name."""
+    previous = current_target()
+    context.target = name
+    try:
+        yield
+    finally:
+        context.target = previous
+
+
+def run_in_target(name: str, function: Callable, *args):
+    """Call function with this thread's records tagged with a target, e.g. in a worker pool."""
+    with target_context(name):
+        return function(*args)
+
+
+class TargetFilter(logging.Filter):
+    """Stamp a record with the target of the emitting thread; runs before the record is queued."""
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        if not hasattr(record, 'target'):
+            record.target = current_target()
+        return True
+
+
+class SharedFilter(logging.Filter):
+    """Keep git output out of the console and the shared log; it goes to the target logs."""
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        return not getattr(record, 'git_output', False)
+
+
+class JsonFormatter(logging.Formatter):
+    """Format a record as one JSON object per line."""
+
+    def format(self, record: logging.LogRecord) -> str:
+        entry = {
+            'time': datetime.fromtimestamp(record.created).isoformat(timespec='milliseconds'),
+            'level': record.levelname,
+            'target': getattr(record, 'target', None),
+            'thread': record.threadName,
+            'source': 'git' if getattr(record, 'git_output', False) else record.name,
+            'message': record.getMessage(),
+        }
+        if getattr(record, 'command', None):
+            entry['command'] = record.command
+        return json.dumps(entry)
+
+
+class TargetFileHandler(logging.Handler):
+    """Write each record to the JSON-lines file of its target; records of no target are dropped."""
+
+    def __init__(self, directory: str):
+        super().__init__()
+        self.directory = directory
+        self.handlers: Dict[str, logging.FileHandler] = {}
+
+    def emit(self, record: logging.LogRecord):
+        target = getattr(record, 'target', None)
+        if not target:
+            return
+        if target not in self.handlers:
+            os.makedirs(self.directory, exist_ok=True)
+            handler = logging.FileHandler(os.path.join(self.directory, f'{target}.jsonl'), encoding='utf-8')
+            handler.setFormatter(JsonFormatter())
+            self.handlers[target] = handler
+        self.handlers[target].emit(record)
+
+    def close(self):
+        for handler in self.handlers.values():
+            handler.close()
+        self.handlers.clear()
+        super().close()
+
+
+def setup_logging(log_file: str = DEFAULT_LOG_FILE, max_bytes: int = DEFAULT_MAX_BYTES,
+                  backup_count: int = DEFAULT_BACKUPS, level: int = logging.INFO):
+    """Send root logging through a queue to the console and a rotating shared log.
+
+    Does nothing when the root logger already has handlers, e.g. on a second call.
+    """
+    global listener
+    root = logging.getLogger()
+    if listener is not None or root.handlers:
+        # Like logging.basicConfig, leave logging an embedding program configured alone
+        return
+
+    formatter = logging.Formatter(LOG_FORMAT)
+    handlers = [logging.StreamHandler(sys.stdout),
+                RotatingFileHandler(log_file, maxBytes=max_bytes, backupCount=backup_count,
+                                    encoding='utf-8', delay=True)]
+    for handler in handlers:
+        handler.setFormatter(formatter)
+        handler.addFilter(SharedFilter())
+
+    records = queue.SimpleQueue()
+    root.setLevel(level)
+    root.addHandler(QueueHandler(records))
+    listener = QueueListener(records, *handlers, respect_handler_level=True)
+    listener.start()
+    # Drain the queue before the interpreter exits
+    atexit.register(listener.stop)
+
+
+class TargetLogs:
+    """Per-target JSON-lines logs of one run, fed through their own queue from the given loggers."""
+
+    def __init__(self, loggers: List[logging.Logger], directory: str):
+        self.loggers = loggers
+        self.directory = directory
+        self.records = queue.SimpleQueue()
+        self.handler = QueueHandler(self.records)
+        self.handler.addFilter(TargetFilter())
+        self.file_handler = TargetFileHandler(directory)
+        self.listener = QueueListener(self.records, self.file_handler)
+
+    def start(self):
+        for logger in self.loggers:
+            logger.addHandler(self.handler)
+        self.listener.start()
+
+    def stop(self):
+        """Detach from the loggers and flush the records still queued."""
+        for logger in self.loggers:
+            logger.removeHandler(self.handler)
+        self.listener.stop()
+        self.file_handler.close()
+
+    def __enter__(self):
+        self.start()
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.stop()
+
+
+def print_log(path: str):
+    """Print the records of one target log."""
+    with open(path, encoding='utf-8') as f:
+        for line in f:
+            entry = json.loads(line)
+            prefix = 'git' if entry['source'] == 'git' else entry['level']
+            print(f"{entry['time']} [{entry['target']}] {prefix}: {entry['message']}")
+
+
+def main():
+    """Main entry point."""
+    parser = argparse.ArgumentParser(description="Print per-target split logs")
+    parser.add_argument('path', help='Target log file, or a run directory of them')
+    parser.add_argument('--target', help='Only this target of a run directory')
+    args = parser.parse_args()
+
+    if os.path.isdir(args.path):
+        names = sorted(name for name in os.listdir(args.path) if name.endswith('.jsonl'))
+        if args.target:
+            names = [name for name in names if name == f'{args.target}.jsonl']
+        paths = [os.path.join(args.path, name) for name in names]
+    else:
+        paths = [args.path]
+    if not paths:
+        print(f"Error: no target logs in {args.path}")
+        sys.exit(1)
+
+    try:
+        for path in paths:
+            print_log(path)
+    except (OSError, ValueError, KeyError) as e:
+        print(f"Error: {e}")
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
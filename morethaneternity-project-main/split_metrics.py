@@ -0,0 +1,178 @@
+#!/usr/bin/env python3
+"""
+Split Metrics
+
+A small metrics registry for split runs, exported in the Prometheus text
+format: as a textfile for node_exporter's textfile collector, and optionally
+over HTTP on a local port while the run lasts. The splitter updates it as the
+run goes (phase durations, bytes pushed, commits rewritten, GitHub API calls
+and rate-limit headroom) and rewrites the textfile at every milestone, so a
+run that hangs or dies still leaves its latest numbers behind.
+
+Every sample carries the constant labels of the run (source and mode), so
+runs of several monorepos can share one collector directory.
+
+Usage:
+    python split_metrics.py [split_metrics.prom]
+
+Prints the metrics a textfile holds, one sample per line.
+"""
+
+import os
+import sys
+import time
+import logging
+import argparse
+import threading
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+from typing import Dict, Optional, Tuple
+
+
+DEFAULT_METRICS_FILE = 'split_metrics.prom'
+CONTENT_TYPE = 'text/plain; version=0.0.4; charset=utf-8'
+
+# name -> (type, help); the splitter only updates metrics listed here
+METRICS = {
+    'split_run_start_timestamp_seconds': ('gauge', 'When the run started, as a Unix timestamp.'),
+    'split_run_duration_seconds': ('gauge', 'Seconds the run has taken so far, or took.'),
+    'split_run_success': ('gauge', '1 if the run finished without failed targets, 0 if not; absent while running.'),
+    'split_targets': ('gauge', 'Targets of the run by state.'),
+    'split_phase_seconds': ('gauge', 'Seconds a target spent in a phase; the source clone is target "source".'),
+    'split_git_commands_total': ('counter', 'Git commands run, by phase and result.'),
+    'split_git_seconds_total': ('counter', 'Seconds spent in git commands, by phase.'),
+    'split_pushed_bytes_total': ('counter', 'Pack bytes pushed, as git push reported them.'),
+    'split_lfs_objects_uploaded_total': ('counter', 'LFS objects uploaded to the target LFS server.'),
+    'split_commits_rewritten': ('gauge', 'Commits in the rewritten history of a target.'),
+    'split_commits_synced_total': ('counter', 'Commits of a target replayed onto the monorepo by a reverse sync.'),
+    'split_github_api_calls_total': ('counter', 'GitHub API calls made, by operation.'),
+    'split_github_cache_lookups_total': ('counter', 'GitHub metadata lookups, by kind and result: fresh (no request), not_modified (304) or fetched.'),
+    'split_github_rate_limit': ('gauge', 'GitHub API requests allowed per rate-limit window.'),
+    'split_github_rate_limit_remaining': ('gauge', 'GitHub API requests left in the current window.'),
+    'split_github_rate_limit_reset_timestamp_seconds': ('gauge', 'When the GitHub rate-limit window resets.'),
+}
+
+Labels = Tuple[Tuple[str, str], ...]
+
+
+def escape_label(value: str) -> str:
+    """Escape a label value for the text format."""
+    return value.replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def format_labels(labels: Labels) -> str:
+    """Format a label set, e.g. '{phase="push",target="fractol-app"}'."""
+    if not labels:
+        return ''
+    return '{' + ','.join(f'{name}="{escape_label(value)}"' for name, value in labels) + '}'
+
+
+class MetricsRegistry:
+    """Counters and gauges with labels, rendered in the Prometheus text format."""
+
+    def __init__(self, constant_labels: Optional[Dict[str, str]] = None):
+        self.constant_labels: Dict[str, str] = dict(constant_labels or {})
+        self.samples: Dict[str, Dict[Labels, float]] = {name: {} for name in METRICS}
+        self.lock = threading.Lock()
+
+    def key(self, name: str, labels: Dict[str, str]) -> Labels:
+        if name not in METRICS:
+            raise KeyError(f"Unknown metric: {name}")
+        return tuple(sorted({**self.constant_labels, **{label: str(value) for label, value in labels.items()}}.items()))
+
+    def inc(self, name: str, value: float = 1, **labels):
+        """Add to a counter."""
+        with self.lock:
+            key = self.key(name, labels)
+            self.samples[name][key] = self.samples[name].get(key, 0.0) + value
+
+    def set(self, name: str, value: float, **labels):
+        """Set a gauge."""
+        with self.lock:
+            self.samples[name][self.key(name, labels)] = float(value)
+
+    def get(self, name: str, **labels) -> Optional[float]:
+        """Return the current value of a sample, if it has one."""
+        with self.lock:
+            return self.samples[name].get(self.key(name, labels))
+
+    def render(self) -> str:
+        """Return every metric that has samples, in the text exposition format."""
+        lines = []
+        with self.lock:
+            for name, (kind, help_text) in METRICS.items():
+                if not self.samples[name]:
+                    continue
+                lines.append(f'# HELP {name} {help_text}')
+                lines.append(f'# TYPE {name} {kind}')
+                for labels, value in sorted(self.samples[name].items()):
+                    lines.append(f'{name}{format_labels(labels)} {value!r}')
+        return '\n'.join(lines) + '\n'
+
+    def write(self, path: str):
+        """Replace a textfile atomically; the textfile collector must never read half of one."""
+        temp_path = f'{path}.tmp{os.getpid()}'
+        with open(temp_path, 'w') as f:
+            f.write(self.render())
+        os.replace(temp_path, path)
+
+
+class MetricsRequestHandler(BaseHTTPRequestHandler):
+    """Serve the registry at /metrics."""
+
+    def do_GET(self):
+        if self.path.split('?')[0] not in ('/', '/metrics'):
+            self.send_error(404)
+            return
+        payload = self.server.registry.render().encode()
+        self.send_response(200)
+        self.send_header('Content-Type', CONTENT_TYPE)
+        self.send_header('Content-Length', str(len(payload)))
+        self.end_headers()
+        self.wfile.write(payload)
+
+    def log_message(self, format, *args):
+        logging.getLogger(__name__).debug(f"{self.address_string()} {format % args}")
+
+
+class MetricsServer:
+    """Serve a registry over HTTP on a local port from a background thread."""
+
+    def __init__(self, registry: MetricsRegistry, port: int, host: str = '127.0.0.1'):
+        self.server = ThreadingHTTPServer((host, port), MetricsRequestHandler)
+        self.server.daemon_threads = True
+        self.server.registry = registry
+        self.thread = threading.Thread(target=self.server.serve_forever, name='metrics', daemon=True)
+
+    @property
+    def url(self) -> str:
+        host, port = self.server.server_address[:2]
+        return f'http://{host}:{port}/metrics'
+
+    def start(self):
+        self.thread.start()
+
+    def stop(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+
+def main():
+    """Main entry point."""
+    parser = argparse.ArgumentParser(description="Print the samples of a split metrics textfile")
+    parser.add_argument('path', nargs='?', default=DEFAULT_METRICS_FILE, help='Metrics textfile written by the splitter')
+    args = parser.parse_args()
+
+    try:
+        with open(args.path) as f:
+            samples = [line.rstrip('\n') for line in f if line.strip() and not line.startswith('#')]
+    except OSError as e:
+        print(f"Error: {e}")
+        sys.exit(1)
+    age = time.time() - os.path.getmtime(args.path)
+    print(f"{args.path}: {len(samples)} samples, written {age:.0f}s ago")
+    for sample in samples:
+        print(sample)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,348 @@
+#!/usr/bin/env python3
+"""
+Split Progress
+
+Turns the progress meters git prints while a split runs into one status for
+the whole run. run_git_command hands every redraw of a meter to
+ProgressTracker.update():
+
+    Receiving objects:  45% (450/1000), 1.20 MiB | 2.00 MiB/s    clone, fetch
+    Writing objects:  80% (80/100), 3.10 MiB | 1.50 MiB/s        push
+    Parsed 1200 commits                                          git filter-repo
+
+Each target shows its current stage with throughput and the ETA of that
+stage. The run's progress weighs every target by its estimated cost from the
+scheduler: finished targets count fully, running ones by the time they have
+spent against their estimate, corrected by how far off the estimates of the
+finished targets were. The run's ETA extrapolates from that.
+
+A reporter thread logs a one-line status and rewrites a JSON feed
+(split_progress.json) at a fixed interval, for dashboards and the split
+service.
+
+Usage:
+    python split_progress.py [split_progress.json] [--watch 2]
+
+Prints the status of the run a feed describes.
+"""
+
+import os
+import re
+import sys
+import json
+import time
+import logging
+import argparse
+import threading
+from dataclasses import dataclass, field, asdict
+from typing import Dict, List, Optional
+
+
+DEFAULT_PROGRESS_FILE = 'split_progress.json'
+DEFAULT_PROGRESS_INTERVAL = 10
+
+# "Writing objects:  80% (80/100), 3.10 MiB | 1.50 MiB/s"; the size and rate come with transfers only
+METER_PATTERN = re.compile(
+    r'^(?:remote: )?(?P<stage>[A-Z][a-z]+(?: [a-z]+)*):\s+(?P<percent>\d+)% \((?P<done>\d+)/(?P<total>\d+)\)'
+    r'(?:, (?P<size>[\d.]+) (?P<unit>[KMG]?i?B|bytes?))?'
+)
+# "Enumerating objects: 92" counts without knowing the total
+COUNTER_PATTERN = re.compile(r'^(?:remote: )?(?P<stage>[A-Z][a-z]+(?: [a-z]+)*): (?P<done>\d+)(?:, done\.)?$')
+PARSED_PATTERN = re.compile(r'^Parsed (?P<done>\d+) commits')
+SIZE_UNITS = {'byte': 1, 'bytes': 1, 'B': 1, 'KiB': 1024, 'MiB': 1024 ** 2, 'GiB': 1024 ** 3}
+
+PHASES = {'git clone': 'clone', 'git fetch': 'clone', 'git filter-repo': 'rewrite', 'git push': 'push'}
+
+
+@dataclass
+class StageProgress:
+    """The latest state of one progress meter of a target."""
+    phase: str
+    stage: str
+    done: int = 0
+    total: int = 0  # 0 when git does not know it yet
+    bytes: int = 0
+    started_at: float = field(default_factory=time.monotonic)
+    updated_at: float = field(default_factory=time.monotonic)
+    start_done: int = 0  # the first state seen of this meter
+    start_bytes: int = 0
+
+    def rates(self) -> Dict[str, float]:
+        """Return items and bytes per second since the first state seen; zero until there are two."""
+        seconds = self.updated_at - self.started_at
+        if seconds <= 0:
+            return {'items_per_second': 0.0, 'bytes_per_second': 0.0}
+        return {'items_per_second': (self.done - self.start_done) / seconds,
+                'bytes_per_second': (self.bytes - self.start_bytes) / seconds}
+
+    def eta(self) -> Optional[float]:
+        """Return the seconds the stage still needs at its rate so far, if its total is known."""
+        rate = self.rates()['items_per_second']
+        if not self.total or not rate:
+            return None
+        return max(self.total - self.done, 0) / rate
+
+
+@dataclass
+class TargetProgress:
+    """Progress of one target of the run."""
+    name: str
+    cost: float = 0.0  # estimated seconds
+    state: str = 'queued'  # queued, running, done or failed
+    started_at: Optional[float] = None
+    finished_at: Optional[float] = None
+    stage: Optional[StageProgress] = None
+
+    def fraction(self, now: float, scale: float = 1.0) -> float:
+        """Return how far the target is, judged by its time spent against its estimate times scale."""
+        if self.state in ('done', 'failed'):
+            return 1.0
+        if self.state == 'queued' or self.started_at is None:
+            return 0.0
+        if not self.cost:
+            return 0.5
+        # Never finished on time alone; only the scheduler knows when it is done
+        return min((now - self.started_at) / (self.cost * scale), 0.95)
+
+
+def parse_progress(line: str, phase: str) -> Optional[StageProgress]:
+    """Parse one state of a git or git filter-repo progress meter."""
+    line = line.strip()
+    match = METER_PATTERN.match(line)
+    if match:
+        size = 0
+        if match.group('size'):
+            size = int(float(match.group('size')) * SIZE_UNITS.get(match.group('unit'), 1))
+        return StageProgress(phase, match.group('stage'), int(match.group('done')), int(match.group('total')), size)
+    match = PARSED_PATTERN.match(line)
+    if match:
+        return StageProgress(phase, 'Parsed commits', int(match.group('done')))
+    match = COUNTER_PATTERN.match(line)
+    if match:
+        return StageProgress(phase, match.group('stage'), int(match.group('done')))
+    return None
+
+
+def format_duration(seconds: Optional[float]) -> str:
+    """Format an ETA for the status line."""
+    if seconds is None:
+        return '?'
+    seconds = int(seconds)
+    if seconds >= 3600:
+        return f"{seconds // 3600}h{seconds % 3600 // 60:02d}m"
+    if seconds >= 60:
+        return f"{seconds // 60}m{seconds % 60:02d}s"
+    return f"{seconds}s"
+
+
+def format_rate(bytes_per_second: float) -> str:
+    """Format a throughput for the status line."""
+    for unit in ['B', 'KiB', 'MiB']:
+        if bytes_per_second < 1024:
+            return f"{bytes_per_second:.1f} {unit}/s"
+        bytes_per_second /= 1024
+    return f"{bytes_per_second:.1f} GiB/s"
+
+
+class ProgressTracker:
+    """Aggregate the git progress of all targets of a run into one status and a JSON feed."""
+
+    def __init__(self, feed_path: str = '', interval: float = DEFAULT_PROGRESS_INTERVAL,
+                 logger: Optional[logging.Logger] = None):
+        self.feed_path = feed_path
+        self.interval = interval
+        self.logger = logger or logging.getLogger(__name__)
+        self.targets: Dict[str, TargetProgress] = {}
+        self.source: Optional[StageProgress] = None  # the mirror clone, before any target runs
+        self.source_commits = 0  # what git filter-repo parses in each target clone
+        self.started_at = time.monotonic()
+        self.started_wall = time.time()
+        self.lock = threading.Lock()
+        self.stopped = threading.Event()
+        self.reporter: Optional[threading.Thread] = None
+
+    def add_targets(self, targets: List):
+        """Register scheduled targets (anything with a name and an estimated cost)."""
+        with self.lock:
+            for target in targets:
+                self.targets[target.name] = TargetProgress(target.name, cost=getattr(target, 'cost', 0.0))
+
+    def start(self, name: str):
+        """Mark a target as running."""
+        with self.lock:
+            progress = self.targets.setdefault(name, TargetProgress(name))
+            progress.state = 'running'
+            progress.started_at = time.monotonic()
+
+    def finish(self, name: str, failed: bool = False):
+        """Mark a target as done or failed."""
+        with self.lock:
+            progress = self.targets.setdefault(name, TargetProgress(name))
+            progress.state = 'failed' if failed else 'done'
+            progress.finished_at = time.monotonic()
+
+    def update(self, target: Optional[str], command: str, line: str):
+        """Record one progress line a git command printed for target; None is the source clone."""
+        stage = parse_progress(line, PHASES.get(command, command))
+        if stage is None:
+            return
+        if stage.stage == 'Parsed commits':
+            stage.total = self.source_commits
+        with self.lock:
+            previous = self.source if target is None else getattr(self.targets.get(target), 'stage', None)
+            if previous and (previous.phase, previous.stage) == (stage.phase, stage.stage) \
+                    and stage.done >= previous.done:
+                # The same meter redrawn: measure the rates from its first state
+                stage.started_at = previous.started_at
+                stage.start_done = previous.start_done
+                stage.start_bytes = previous.start_bytes
+            else:
+                stage.start_done = stage.done
+                stage.start_bytes = stage.bytes
+            if target is None:
+                self.source = stage
+            else:
+                self.targets.setdefault(target, TargetProgress(target, state='running')).stage = stage
+
+    def snapshot(self) -> Dict:
+        """Return the status of the run as the JSON feed carries it."""
+        now = time.monotonic()
+        with self.lock:
+            targets = list(self.targets.values())
+            source = self.source
+
+            def stage_status(stage: Optional[StageProgress]) -> Optional[Dict]:
+                if stage is None:
+                    return None
+                status = {key: value for key, value in asdict(stage).items()
+                          if key in ('phase', 'stage', 'done', 'total', 'bytes')}
+                status.update({key: round(value, 1) for key, value in stage.rates().items()})
+                status['eta_seconds'] = stage.eta()
+                return status
+
+            # Correct the estimates of running targets by how far off they were for finished ones
+            finished = [target for target in targets if target.state == 'done' and target.cost]
+            scale = sum(target.finished_at - target.started_at for target in finished) / \
+                sum(target.cost for target in finished) if finished else 1.0
+            weights = {target.name: target.cost or 1.0 for target in targets}
+            total_weight = sum(weights.values())
+            fraction = sum(weights[target.name] * target.fraction(now, scale) for target in targets) / total_weight \
+                if total_weight else 0.0
+            running_since = min((target.started_at for target in targets if target.started_at), default=None)
+            eta = None
+            if running_since is not None and fraction >= 0.01:
+                eta = (now - running_since) * (1 - fraction) / fraction
+
+            return {
+                'started_at': self.started_wall,
+                'updated_at': time.time(),
+                'elapsed_seconds': round(now - self.started_at, 1),
+                'targets_total': len(targets),
+                'targets_done': sum(1 for target in targets if target.state in ('done', 'failed')),
+                'targets_failed': sum(1 for target in targets if target.state == 'failed'),
+                'fraction': round(fraction, 3),
+                'eta_seconds': round(eta, 1) if eta is not None else None,
+                'source': stage_status(source),
+                'targets': {
+                    target.name: {
+                        'state': target.state,
+                        'estimated_seconds': round(target.cost, 1),
+                        'elapsed_seconds': round((target.finished_at or now) - target.started_at, 1)
+                        if target.started_at else None,
+                        'stage': stage_status(target.stage) if target.state == 'running' else None,
+                    }
+                    for target in targets
+                },
+            }
+
+    def write_feed(self, snapshot: Dict):
+        """Replace the JSON feed atomically, so readers never see half of it."""
+        if not self.feed_path:
+            return
+        temp_path = f'{self.feed_path}.tmp{os.getpid()}'
+        with open(temp_path, 'w') as f:
+            json.dump(snapshot, f, indent=2)
+        os.replace(temp_path, self.feed_path)
+
+    def report(self, final: bool = False):
+        """Log the status line and write the feed."""
+        snapshot = self.snapshot()
+        if final:
+            snapshot['finished'] = True
+        self.write_feed(snapshot)
+        if not final:
+            self.logger.info(status_line(snapshot))
+
+    def run_reporter(self):
+        """Report every interval seconds until stopped."""
+        while not self.stopped.wait(self.interval):
+            try:
+                self.report()
+            except OSError as e:
+                self.logger.warning(f"Could not write progress feed {self.feed_path}: {e}")
+
+    def start_reporting(self):
+        """Report every interval seconds until stop_reporting()."""
+        if self.interval > 0:
+            self.reporter = threading.Thread(target=self.run_reporter, name='progress', daemon=True)
+            self.reporter.start()
+
+    def stop_reporting(self):
+        """Stop the reporter and write the final feed."""
+        self.stopped.set()
+        if self.reporter:
+            self.reporter.join()
+        try:
+            self.report(final=True)
+        except OSError as e:
+            self.logger.warning(f"Could not write progress feed {self.feed_path}: {e}")
+
+
+def stage_summary(stage: Dict) -> str:
+    """Format one stage for the status line, e.g. 'push: Writing objects 45% (41/92), 2.1 MiB/s'."""
+    text = f"{stage['phase']}: {stage['stage']}"
+    if stage['total']:
+        text += f" {100 * stage['done'] // stage['total']}% ({stage['done']}/{stage['total']})"
+    else:
+        text += f" {stage['done']}"
+    if stage['bytes_per_second']:
+        text += f", {format_rate(stage['bytes_per_second'])}"
+    if stage['eta_seconds'] is not None:
+        text += f", {format_duration(stage['eta_seconds'])} left"
+    return text
+
+
+def status_line(snapshot: Dict) -> str:
+    """Format the status of a run as one line."""
+    parts = [f"Progress: {snapshot['targets_done']}/{snapshot['targets_total']} targets, "
+             f"{100 * snapshot['fraction']:.0f}%, ETA {format_duration(snapshot['eta_seconds'])}"]
+    if snapshot['source'] and not snapshot['targets_total']:
+        parts.append(f"source {stage_summary(snapshot['source'])}")
+    for name, target in snapshot['targets'].items():
+        if target['state'] == 'running':
+            parts.append(f"{name} {stage_summary(target['stage'])}" if target['stage'] else f"{name} running")
+    return ' | '.join(parts)
+
+
+def main():
+    """Main entry point."""
+    parser = argparse.ArgumentParser(description="Show the status of a split from its progress feed")
+    parser.add_argument('feed', nargs='?', default=DEFAULT_PROGRESS_FILE, help='Progress feed written by the splitter')
+    parser.add_argument('--watch', type=float, help='Print the status again every N seconds until the run finishes')
+    args = parser.parse_args()
+
+    while True:
+        try:
+            with open(args.feed) as f:
+                snapshot = json.load(f)
+        except (OSError, ValueError) as e:
+            print(f"Error: {e}")
+            sys.exit(1)
+        print(status_line(snapshot))
+        if not args.watch or snapshot.get('finished'):
+            return
+        time.sleep(args.watch)
+
+
+if __name__ == "__main__":
+    main()
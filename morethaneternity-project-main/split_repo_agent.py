@@ -10,7 +10,8 @@ Supports two modes:
 2. Project-based splitting (new functionality for same-branch projects with shared libraries)
 
 Usage:
-    python split_repo_agent.py [--dry-run] [--mode branch|project]
+    python split_repo_agent.py [--dry-run] [--mode branch|project] [--sync]
+    python split_repo_agent.py --doctor [--refresh-preflight]
 
 Requirements:
     - git-filter-repo installed and available in PATH
@@ -26,14 +27,41 @@ import argparse
 import subprocess
 import tempfile
 import shutil
+import time
+import re
+import hashlib
+import signal
+import threading
+from functools import partial
+from fnmatch import fnmatchcase
+from concurrent.futures import ThreadPoolExecutor, as_completed
 from pathlib import Path
-from typing import List, Dict, Optional, Union
+from typing import List, Dict, Optional, Union, Callable, Tuple
 from dataclasses import dataclass
 from datetime import datetime
 
-import requests
 from dotenv import load_dotenv
-from github import Github, GithubException
+
+from history_rewrite import HistoryRewriter, pruned_as_none
+from reverse_sync import ReverseSync, SyncConflict, SyncResult
+from dependency_closure import DependencyClosure, trim_callback
+from submodule_wiring import SubmoduleWiring, pin_commits, read_filter_repo_map
+from blob_transforms import BlobTransforms, build_transforms
+from commit_index import CommitIndex, DEFAULT_INDEX_PATH
+from cross_references import CrossReferenceRewriter
+from split_scheduler import SplitTarget, CostModel, TargetScheduler, DEFAULT_HISTORY_PATH
+from git_runner import GitRunner, TargetCancelled, stop_process_group, install_runner
+from lfs_transfer import LfsTransfer, scan_pointers, lfs_endpoint, local_lfs_store, DEFAULT_CACHE_PATH
+from split_logging import (TargetLogs, setup_logging, current_target, target_context, run_in_target, DEFAULT_LOG_FILE,
+                           DEFAULT_LOG_DIR, DEFAULT_MAX_BYTES, DEFAULT_BACKUPS)
+from split_progress import ProgressTracker, DEFAULT_PROGRESS_FILE, DEFAULT_PROGRESS_INTERVAL
+from split_metrics import MetricsRegistry, MetricsServer
+from target_discovery import TargetDiscovery, DiscoveryRules, parse_names, wants_discovery, DEFAULT_MANIFEST_PATH
+from preflight import PreflightSettings, doctor, DEFAULT_PREFLIGHT_CACHE, DEFAULT_PREFLIGHT_TTL
+from github_cache import GitHubCache, GitHubApiError, DEFAULT_GITHUB_CACHE, DEFAULT_MAX_AGE
+
+
+DEFAULT_GITHUB_API_URL = "https://api.github.com"
 
 
 @dataclass
@@ -46,113 +74,538 @@ class RepoSplitterConfig:
     common_path: Optional[str] = None
     org: str = ""
     github_token: str = ""
+    github_api_url: str = DEFAULT_GITHUB_API_URL  # e.g. a GitHub Enterprise or local_remote.py API
+    github_cache: str = DEFAULT_GITHUB_CACHE  # repository and account lookups shared by runs; empty disables it
+    github_cache_max_age: int = DEFAULT_MAX_AGE  # seconds a cached lookup is used before it is revalidated
     dry_run: bool = False
+    repack: bool = False
+    pack_threads: int = 0  # 0 lets git use one thread per CPU
+    pack_window: int = 250
+    pack_depth: int = 50
+    output_mode: str = "push"  # 'push' or 'bundle'
+    bundle_dir: str = "bundles"
+    rewrite_shards: int = 0  # 0 uses git filter-repo, N > 0 the sharded plumbing rewriter
+    verify_shards: bool = False
+    since: Optional[str] = None  # keep only first-parent history since this date
+    max_commits: int = 0  # keep only the last N first-parent commits; 0 keeps all
+    composite: bool = False  # put common_path inside each project repo
+    common_subdir: str = ""  # where common_path lands in composite repos; defaults to its basename
+    rewrite_common_refs: bool = False  # rewrite '../<common_path>' in Makefile variables
+    common_closure: bool = False  # composite repos keep only the common files each project needs
+    wire_submodule: bool = False  # pin common-libs as a submodule throughout each project's history
+    submodule_url: str = "../common-libs.git"  # relative URLs resolve against the project's remote
+    commit_index: str = DEFAULT_INDEX_PATH  # SQLite store of every run's commit maps; empty disables it
+    rewrite_cross_refs: bool = False  # rewrite monorepo SHAs in commit messages to target SHAs
+    refs_include: Optional[List[str]] = None  # ref globs to publish; None publishes refs/heads/main only
+    refs_exclude: Optional[List[str]] = None
+    split_workers: int = 1  # targets rewritten at the same time, longest first
+    push_workers: int = 2  # pushes running at the same time, separate from the rewrites
+    history_file: str = DEFAULT_HISTORY_PATH  # timings of earlier runs for the cost estimates; empty disables it
+    lfs: bool = False  # carry the LFS objects each target references
+    lfs_cache: str = DEFAULT_CACHE_PATH  # LFS objects shared by all targets and runs
+    lfs_workers: int = 8  # parallel LFS transfers per target
+    source_lfs_url: str = ""  # LFS server of the source; derived from source_repo_url if empty
+    clone_timeout: int = 0  # seconds per git command of each phase; 0 waits forever
+    rewrite_timeout: int = 0
+    push_timeout: int = 0
+    failure_policy: str = "fail-fast"  # 'fail-fast' cancels the other targets, 'continue' lets them finish
+    log_dir: str = DEFAULT_LOG_DIR  # one JSON-lines log per target and run, git stderr included; empty disables it
+    log_max_bytes: int = DEFAULT_MAX_BYTES  # repo_splitter.log rotates at this size
+    log_backups: int = DEFAULT_BACKUPS  # rotated repo_splitter.log files kept
+    progress_file: str = DEFAULT_PROGRESS_FILE  # JSON progress feed of the run; empty disables it
+    progress_interval: int = DEFAULT_PROGRESS_INTERVAL  # seconds between status lines and feed updates; 0 disables them
+    metrics_file: str = ""  # Prometheus textfile rewritten during the run, e.g. for node_exporter; empty disables it
+    metrics_port: int = 0  # serve the metrics on this local port while the run lasts; 0 disables it
+    sync_cache: str = "sync_cache"  # bare monorepo clone that reverse syncs keep and fetch into
+    discover: bool = False  # find the projects (or branches) in the mirror instead of listing them
+    discover_patterns: Optional[List[str]] = None  # directory (or branch) globs; None means every top-level one
+    discover_markers: Optional[List[str]] = None  # files a project directory must contain; None means any
+    discover_exclude: Optional[List[str]] = None
+    target_manifest: str = DEFAULT_MANIFEST_PATH  # discovered targets per monorepo state; empty disables it
+    transform_drop: Optional[List[str]] = None  # globs of files dropped from every target's history, e.g. obj/*.o
+    transform_eol: Optional[List[str]] = None  # globs of files whose CRLF line endings become LF
+    transform_replace: str = ""  # file of '<glob> <regex>==><replacement>' rules applied to file contents
+    transform_workers: int = 0  # processes transforming blobs; 0 uses one per CPU
+    preflight_cache: str = DEFAULT_PREFLIGHT_CACHE  # passing --doctor results, reused for preflight_ttl; empty disables it
+    preflight_ttl: int = DEFAULT_PREFLIGHT_TTL  # seconds
+
+
+FAILURE_POLICIES = ('fail-fast', 'continue')
+
+# Matches the final "Writing objects" line that git push prints with --progress
+PUSH_SIZE_PATTERN = re.compile(r'Writing objects:\s+100% \(\d+/\d+\), ([\d.]+) (\w+)')
+SIZE_UNITS = {'byte': 1, 'bytes': 1, 'KiB': 1024, 'MiB': 1024 ** 2, 'GiB': 1024 ** 3}
+# split_github_api_calls_total operation of each kind of metadata lookup
+LOOKUP_OPERATIONS = {'repo': 'get_repo', 'user': 'get_user', 'organization': 'get_organization'}
+
+
+def load_github_options() -> Dict[str, Union[int, str]]:
+    """Load the GitHub API options from environment variables."""
+    return {
+        'github_api_url': os.getenv('GITHUB_API_URL') or DEFAULT_GITHUB_API_URL,
+        'github_cache': os.getenv('GITHUB_CACHE', DEFAULT_GITHUB_CACHE),
+        'github_cache_max_age': int(os.getenv('GITHUB_CACHE_MAX_AGE', DEFAULT_MAX_AGE)),
+    }
+
+
+def load_pack_options() -> Dict[str, Union[bool, int]]:
+    """Load the pre-push repacking options from environment variables."""
+    return {
+        'repack': os.getenv('REPACK_BEFORE_PUSH', 'false').lower() in ('1', 'true', 'yes'),
+        'pack_threads': int(os.getenv('PACK_THREADS', '0')),
+        'pack_window': int(os.getenv('PACK_WINDOW', '250')),
+        'pack_depth': int(os.getenv('PACK_DEPTH', '50')),
+    }
+
+
+def load_output_options() -> Dict[str, str]:
+    """Load the output mode options from environment variables."""
+    output_mode = os.getenv('OUTPUT_MODE', 'push').lower()
+    if output_mode not in ('push', 'bundle'):
+        raise ValueError("OUTPUT_MODE must be either 'push' or 'bundle'")
+    return {
+        'output_mode': output_mode,
+        'bundle_dir': os.getenv('BUNDLE_DIR', 'bundles'),
+    }
+
+
+def load_rewrite_options() -> Dict[str, Union[bool, int, str, None]]:
+    """Load the history rewrite options from environment variables."""
+    return {
+        'rewrite_shards': int(os.getenv('REWRITE_SHARDS', '0')),
+        'verify_shards': os.getenv('VERIFY_SHARDS', 'false').lower() in ('1', 'true', 'yes'),
+        'since': os.getenv('SINCE') or None,
+        'max_commits': int(os.getenv('MAX_COMMITS', '0')),
+    }
+
+
+def load_composite_options() -> Dict[str, Union[bool, str]]:
+    """Load the composite target options from environment variables."""
+    return {
+        'composite': os.getenv('COMPOSITE_TARGETS', 'false').lower() in ('1', 'true', 'yes'),
+        'common_subdir': os.getenv('COMMON_SUBDIR', ''),
+        'rewrite_common_refs': os.getenv('REWRITE_COMMON_REFS', 'false').lower() in ('1', 'true', 'yes'),
+        'common_closure': os.getenv('COMMON_CLOSURE', 'false').lower() in ('1', 'true', 'yes'),
+    }
+
+
+def load_submodule_options() -> Dict[str, Union[bool, str]]:
+    """Load the submodule wiring options from environment variables."""
+    return {
+        'wire_submodule': os.getenv('WIRE_SUBMODULE', 'false').lower() in ('1', 'true', 'yes'),
+        'submodule_url': os.getenv('SUBMODULE_URL', '../common-libs.git'),
+    }
+
+
+def load_index_options() -> Dict[str, Union[bool, str]]:
+    """Load the commit index options from environment variables."""
+    return {
+        'commit_index': os.getenv('COMMIT_INDEX', DEFAULT_INDEX_PATH),
+        'rewrite_cross_refs': os.getenv('REWRITE_CROSS_REFS', 'false').lower() in ('1', 'true', 'yes'),
+    }
+
+
+def load_ref_options() -> Dict[str, Optional[List[str]]]:
+    """Load the ref selection globs from environment variables."""
+    options = {}
+    for key, variable in [('refs_include', 'REFS_INCLUDE'), ('refs_exclude', 'REFS_EXCLUDE')]:
+        patterns = [pattern.strip() for pattern in os.getenv(variable, '').split(',') if pattern.strip()]
+        options[key] = patterns or None
+    return options
+
+
+def load_schedule_options() -> Dict[str, Union[int, str]]:
+    """Load the target scheduling options from environment variables."""
+    return {
+        'split_workers': int(os.getenv('SPLIT_WORKERS', '1')),
+        'push_workers': int(os.getenv('PUSH_WORKERS', '2')),
+        'history_file': os.getenv('HISTORY_FILE', DEFAULT_HISTORY_PATH),
+    }
+
+
+def load_lfs_options() -> Dict[str, Union[bool, int, str]]:
+    """Load the Git LFS options from environment variables."""
+    return {
+        'lfs': os.getenv('LFS', 'false').lower() in ('1', 'true', 'yes'),
+        'lfs_cache': os.getenv('LFS_CACHE', DEFAULT_CACHE_PATH),
+        'lfs_workers': int(os.getenv('LFS_WORKERS', '8')),
+        'source_lfs_url': os.getenv('SOURCE_LFS_URL', ''),
+    }
+
+
+def load_failure_options() -> Dict[str, Union[int, str]]:
+    """Load the timeout and failure policy options from environment variables."""
+    failure_policy = os.getenv('FAILURE_POLICY', 'fail-fast').lower()
+    if failure_policy not in FAILURE_POLICIES:
+        raise ValueError("FAILURE_POLICY must be either 'fail-fast' or 'continue'")
+    return {
+        'clone_timeout': int(os.getenv('CLONE_TIMEOUT', '0')),
+        'rewrite_timeout': int(os.getenv('REWRITE_TIMEOUT', '0')),
+        'push_timeout': int(os.getenv('PUSH_TIMEOUT', '0')),
+        'failure_policy': failure_policy,
+    }
+
+
+def load_log_options() -> Dict[str, Union[int, str]]:
+    """Load the logging options from environment variables."""
+    return {
+        'log_dir': os.getenv('LOG_DIR', DEFAULT_LOG_DIR),
+        'log_max_bytes': int(os.getenv('LOG_MAX_BYTES', str(DEFAULT_MAX_BYTES))),
+        'log_backups': int(os.getenv('LOG_BACKUPS', str(DEFAULT_BACKUPS))),
+    }
+
+
+def load_progress_options() -> Dict[str, Union[int, str]]:
+    """Load the progress reporting options from environment variables."""
+    return {
+        'progress_file': os.getenv('PROGRESS_FILE', DEFAULT_PROGRESS_FILE),
+        'progress_interval': int(os.getenv('PROGRESS_INTERVAL', str(DEFAULT_PROGRESS_INTERVAL))),
+    }
+
+
+def load_metrics_options() -> Dict[str, Union[int, str]]:
+    """Load the metrics export options from environment variables."""
+    return {
+        'metrics_file': os.getenv('METRICS_FILE', ''),
+        'metrics_port': int(os.getenv('METRICS_PORT', '0')),
+    }
+
+
+def load_sync_options() -> Dict[str, str]:
+    """Load the reverse sync options from environment variables."""
+    return {
+        'sync_cache': os.getenv('SYNC_CACHE', 'sync_cache'),
+    }
+
+
+def load_target_options(mode: str) -> Dict[str, Union[bool, str, List[str], None]]:
+    """Load the targets of a mode from environment variables; PROJECTS=auto (or BRANCHES=auto) discovers them."""
+    variable = 'BRANCHES' if mode == 'branch' else 'PROJECTS'
+    discover = wants_discovery(os.getenv(variable))
+    return {
+        'branches' if mode == 'branch' else 'projects': [] if discover else parse_names(os.getenv(variable)),
+        'common_path': os.getenv('COMMON_PATH'),
+        'discover': discover,
+    }
+
+
+def load_discovery_options() -> Dict[str, Union[str, List[str], None]]:
+    """Load the target discovery rules from environment variables."""
+    return {
+        'discover_patterns': parse_names(os.getenv('DISCOVER_PATTERNS')) or None,
+        'discover_markers': parse_names(os.getenv('DISCOVER_MARKERS')) or None,
+        'discover_exclude': parse_names(os.getenv('DISCOVER_EXCLUDE')) or None,
+        'target_manifest': os.getenv('TARGET_MANIFEST', DEFAULT_MANIFEST_PATH),
+    }
+
+
+def load_transform_options() -> Dict[str, Union[int, str, List[str], None]]:
+    """Load the blob transform options from environment variables."""
+    return {
+        'transform_drop': parse_names(os.getenv('TRANSFORM_DROP')) or None,
+        'transform_eol': parse_names(os.getenv('TRANSFORM_EOL')) or None,
+        'transform_replace': os.getenv('TRANSFORM_REPLACE', ''),
+        'transform_workers': int(os.getenv('TRANSFORM_WORKERS', '0')),
+    }
+
+
+def load_preflight_options() -> Dict[str, Union[int, str]]:
+    """Load the preflight check options from environment variables."""
+    return {
+        'preflight_cache': os.getenv('PREFLIGHT_CACHE', DEFAULT_PREFLIGHT_CACHE),
+        'preflight_ttl': int(os.getenv('PREFLIGHT_TTL', DEFAULT_PREFLIGHT_TTL)),
+    }
+
+
+def load_env_options() -> Dict[str, Union[bool, int, str, None]]:
+    """Load all optional tuning settings from environment variables."""
+    return {**load_github_options(), **load_pack_options(), **load_output_options(), **load_rewrite_options(), **load_composite_options(),
+            **load_submodule_options(), **load_index_options(), **load_ref_options(), **load_schedule_options(),
+            **load_lfs_options(), **load_failure_options(), **load_log_options(),
+            **load_progress_options(), **load_metrics_options(), **load_sync_options(), **load_discovery_options(),
+            **load_transform_options(), **load_preflight_options()}
+
+
+def full_ref_pattern(pattern: str) -> str:
+    """Expand a ref glob; patterns without a refs/ prefix name branches."""
+    return pattern if pattern.startswith('refs/') else f'refs/heads/{pattern}'
+
+
+def stream_lines(stream, chunks: List[bytes], emit: Callable[[str], None],
+                 progress: Optional[Callable[[str], None]] = None):
+    """Collect the output of a pipe, passing each line to emit as soon as it is complete.
+    
+    Progress meters redraw their line with carriage returns; only the last
+    state of such a line is emitted. progress gets the latest state of a
+    meter whenever one is redrawn, and every emitted line.
+    """
+    def emit_line(line: bytes):
+        text = line.rstrip(b'\r').rsplit(b'\r', 1)[-1].decode('utf-8', errors='replace').rstrip()
+        if text:
+            emit(text)
+            if progress:
+                progress(text)
+    
+    pending = b''
+    for chunk in iter(lambda: stream.read1(65536), b''):
+        chunks.append(chunk)
+        *lines, pending = (pending + chunk).split(b'\n')
+        for line in lines:
+            emit_line(line)
+        if progress and b'\r' in pending:
+            # The last state that has been drawn completely
+            progress(pending.split(b'\r')[-2].decode('utf-8', errors='replace').strip())
+        # Drop redrawn progress states; the one before a trailing '\r' may still end the line
+        redraw = pending.rfind(b'\r', 0, len(pending) - 1)
+        if redraw >= 0:
+            pending = pending[redraw + 1:]
+    emit_line(pending)
+
+
+def write_input(stream, data: bytes):
+    """Feed a command's stdin; a command that exits early just stops reading."""
+    try:
+        stream.write(data)
+        stream.close()
+    except BrokenPipeError:
+        pass
+
+
+def raise_interrupt(signum, frame):
+    """Handle SIGTERM like Ctrl-C, so running commands are stopped and temp files removed."""
+    raise KeyboardInterrupt()
+
+
+def file_sha256(path: str) -> str:
+    """Return the hex SHA-256 checksum of a file."""
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(1024 * 1024), b''):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def parse_push_bytes(output: str) -> int:
+    """Return the number of bytes git push sent, parsed from its progress output."""
+    matches = PUSH_SIZE_PATTERN.findall(output)
+    if not matches:
+        return 0
+    value, unit = matches[-1]
+    return int(float(value) * SIZE_UNITS.get(unit, 1))
+
+
+def format_size(num_bytes: float) -> str:
+    """Format a byte count for the run summary."""
+    for unit in ['B', 'KiB', 'MiB']:
+        if num_bytes < 1024:
+            return f"{num_bytes:.1f} {unit}"
+        num_bytes /= 1024
+    return f"{num_bytes:.1f} GiB"
 
 
 class RepoSplitter:
     """Main class for splitting GitHub monorepos into multiple repositories."""
     
-    def __init__(self, config: RepoSplitterConfig):
+    def __init__(self, config: RepoSplitterConfig, logger: Optional[logging.Logger] = None):
         self.config = config
-        self.github = Github(config.github_token)
+        # Created on first use; dry runs and bundle mode never talk to GitHub
+        self._github = None
+        self._github_metadata = None
         self.temp_dir = None
         self.source_repo_path = None
         self.created_repos = []
+        self.push_stats = {}
+        self.pending_bundles = []
+        self.bundle_descriptions = {}
+        # Relative output paths resolve against the directory the splitter started in
+        self.working_dir = os.getcwd()
+        # Called with (targets_done, targets_total) after each target is processed
+        self.progress_callback: Optional[Callable[[int, int], None]] = None
+        # Built from the mirror on first use by composite targets with common_closure
+        self.dependency_graph: Optional[DependencyClosure] = None
+        # Old -> new commit map of every extracted repository, keyed by its path; None for pruned commits
+        self.commit_maps: Dict[str, Dict[str, Optional[str]]] = {}
+        self.submodule_pins: Optional[Dict[str, Optional[str]]] = None
+        self.commit_index: Optional[CommitIndex] = None
+        self.index_run_id: Optional[int] = None
+        self.target_repos: Dict[str, str] = {}  # repo name -> extracted repository path
+        # Pushes wait until the cross-reference pass has rewritten all targets
+        self.defer_publishing = False
+        self.pending_publishes = []
+        # Set while targets run concurrently; pushes then go to its network pool
+        self.scheduler: Optional[TargetScheduler] = None
+        # Fetches each LFS object once into the shared cache and uploads it per target
+        self.lfs: Optional[LfsTransfer] = None
+        # Path and blob transforms of every extracted repository; more can be registered before the run
+        self.transforms: BlobTransforms = self.configured_transforms(logger)
+        # Guards the state that concurrent targets build lazily and share
+        self.lock = threading.Lock()
+        # Runs every git command of the run, including those of the rewrite modules, in its own
+        # process group with the timeout of its phase; cancel() stops all of them
+        self.git_runner = GitRunner({'clone': config.clone_timeout, 'rewrite': config.rewrite_timeout,
+                                     'push': config.push_timeout})
+        self.cancelled = self.git_runner.cancelled
+        self.previous_runner: Optional[GitRunner] = None
+        self.failed_targets: Dict[str, str] = {}  # target -> error, with the 'continue' policy
+        self.target_logs: Optional[TargetLogs] = None
+        self.progress: Optional[ProgressTracker] = None
+        # Updated as the run goes; exported by flush_metrics() and metrics_port
+        self.metrics = MetricsRegistry()
+        self.metrics_server: Optional[MetricsServer] = None
+        self.rate_limit_known = True  # False once the API turned out not to report rate limits
         
-        # Setup logging
-        logging.basicConfig(
-            level=logging.INFO,
-            format='%(asctime)s - %(levelname)s - %(message)s',
-            handlers=[
-                logging.StreamHandler(sys.stdout),
-                logging.FileHandler('repo_splitter.log')
-            ]
-        )
+        if logger is not None:
+            # Caller-provided logger, e.g. one per job in the split service
+            self.logger = logger
+            return
+        
+        # Setup logging; workers only queue records, a listener thread writes them
+        setup_logging(os.path.join(self.working_dir, DEFAULT_LOG_FILE), config.log_max_bytes, config.log_backups)
         self.logger = logging.getLogger(__name__)
     
     def __enter__(self):
-        """Context manager entry."""
+        """Context manager entry - route the git commands of every module through this run's runner."""
+        self.previous_runner = install_runner(self.git_runner)
         return self
     
     def __exit__(self, exc_type, exc_val, exc_tb):
         """Context manager exit - cleanup temp files."""
         self.cleanup()
+        if self.previous_runner is not None:
+            install_runner(self.previous_runner)
+            self.previous_runner = None
     
     def cleanup(self):
         """Clean up temporary files and directories."""
+        # Commands still running would keep writing into the temp dir
+        if self.git_runner.processes:
+            self.cancel("cleaning up")
+        self.transforms.close()
         if self.temp_dir and os.path.exists(self.temp_dir):
             self.logger.info(f"Cleaning up temporary directory: {self.temp_dir}")
             shutil.rmtree(self.temp_dir, ignore_errors=True)
     
+    def configured_transforms(self, logger: Optional[logging.Logger] = None) -> BlobTransforms:
+        """Build the transforms the configuration asks for."""
+        return build_transforms(self.config.transform_drop or (), self.config.transform_eol or (),
+                                self.config.transform_replace, self.config.transform_workers, logger)
+    
     def load_config(self) -> RepoSplitterConfig:
         """Load configuration from environment variables."""
         load_dotenv()
         
         mode = os.getenv('MODE', 'branch').lower()
-        
-        if mode == 'branch':
-            branches = os.getenv('BRANCHES', '').split(',')
-            branches = [branch.strip() for branch in branches if branch.strip()]
-            config = RepoSplitterConfig(
-                source_repo_url=os.getenv('SOURCE_REPO_URL', ''),
-                mode=mode,
-                branches=branches,
-                common_path=os.getenv('COMMON_PATH'),
-                org=os.getenv('ORG', ''),
-                github_token=os.getenv('GITHUB_TOKEN', ''),
-                dry_run=False
-            )
-        elif mode == 'project':
-            projects = os.getenv('PROJECTS', '').split(',')
-            projects = [project.strip() for project in projects if project.strip()]
-            config = RepoSplitterConfig(
-                source_repo_url=os.getenv('SOURCE_REPO_URL', ''),
-                mode=mode,
-                projects=projects,
-                common_path=os.getenv('COMMON_PATH'),
-                org=os.getenv('ORG', ''),
-                github_token=os.getenv('GITHUB_TOKEN', ''),
-                dry_run=False
-            )
-        else:
+        if mode not in ('branch', 'project'):
             raise ValueError("MODE must be either 'branch' or 'project'")
         
+        config = RepoSplitterConfig(
+            source_repo_url=os.getenv('SOURCE_REPO_URL', ''),
+            mode=mode,
+            org=os.getenv('ORG', ''),
+            github_token=os.getenv('GITHUB_TOKEN', ''),
+            dry_run=False,
+            **load_target_options(mode),
+            **load_env_options()
+        )
+        
         # Validate required fields
         if not config.source_repo_url:
             raise ValueError("SOURCE_REPO_URL is required")
-        if not config.org:
+        if config.output_mode == 'push' and not config.org:
             raise ValueError("ORG is required")
-        if not config.github_token:
+        if config.output_mode == 'push' and not config.github_token:
             raise ValueError("GITHUB_TOKEN is required")
         
-        if mode == 'branch' and not config.branches:
-            raise ValueError("BRANCHES is required for branch mode")
-        elif mode == 'project' and not config.projects:
-            raise ValueError("PROJECTS is required for project mode")
+        if mode == 'branch' and not config.branches and not config.discover:
+            raise ValueError("BRANCHES is required for branch mode (or BRANCHES=auto)")
+        elif mode == 'project' and not config.projects and not config.discover:
+            raise ValueError("PROJECTS is required for project mode (or PROJECTS=auto)")
+        if config.wire_submodule and config.composite:
+            raise ValueError("WIRE_SUBMODULE and COMPOSITE_TARGETS cannot be combined")
+        if config.rewrite_cross_refs and not config.commit_index:
+            raise ValueError("REWRITE_CROSS_REFS needs COMMIT_INDEX")
         
         self.logger.info(f"Configuration loaded: mode={mode}, org={config.org}")
-        if mode == 'branch':
+        if config.discover:
+            self.logger.info(f"{'Branches' if mode == 'branch' else 'Projects'}: discovered in the mirror")
+        elif mode == 'branch':
             self.logger.info(f"Branches: {len(config.branches)}")
         else:
             self.logger.info(f"Projects: {len(config.projects)}")
         
         return config
     
-    def run_git_command(self, command: List[str], cwd: str = None, check: bool = True) -> subprocess.CompletedProcess:
-        """Run a git command and return the result."""
+    def run_git_command(self, command: List[str], cwd: str = None, check: bool = True,
+                        input: Optional[str] = None, phase: Optional[str] = None) -> subprocess.CompletedProcess:
+        """Run a git command and return the result.
+        
+        The command runs in its own process group, so a timeout or cancel() stops
+        it together with its children. phase ('clone', 'rewrite' or 'push') selects
+        the configured timeout. Its stderr goes to the target log line by line
+        while it runs.
+        """
+        timeout = self.git_runner.timeout(phase)
+        process = self.git_runner.start(command, cwd, stdin=input is not None)
+        
+        stdout_chunks: List[bytes] = []
+        stderr_chunks: List[bytes] = []
+        # The reader threads log and report progress for the target of this thread
+        label = ' '.join(command[:2])
+        extra = {'git_output': True, 'command': label, 'target': current_target()}
+        log_line = partial(self.logger.info, extra=extra)
+        progress = partial(self.progress.update, current_target(), label) if self.progress else None
+        name = threading.current_thread().name
+        pipes = [threading.Thread(target=stream_lines, args=(process.stderr, stderr_chunks, log_line, progress),
+                                  name=f'{name}-stderr', daemon=True)]
+        if command[:2] == ['git', 'filter-repo']:
+            # git filter-repo reports its progress on stdout
+            pipes.append(threading.Thread(target=stream_lines, args=(process.stdout, stdout_chunks, log_line, progress),
+                                          name=f'{name}-stdout', daemon=True))
+        else:
+            pipes.append(threading.Thread(target=lambda: stdout_chunks.append(process.stdout.read()), daemon=True))
+        if input is not None:
+            pipes.append(threading.Thread(target=write_input, args=(process.stdin, input.encode()), daemon=True))
+        for pipe in pipes:
+            pipe.start()
+        
+        timed_out = False
+        start = time.monotonic()
         try:
-            result = subprocess.run(
-                command,
-                cwd=cwd,
-                capture_output=True,
-                text=True,
-                check=check
-            )
-            return result
-        except subprocess.CalledProcessError as e:
-            self.logger.error(f"Git command failed: {' '.join(command)}")
-            self.logger.error(f"Error: {e.stderr}")
+            process.wait(timeout=timeout or None)
+        except subprocess.TimeoutExpired:
+            stop_process_group(process)
+            timed_out = True
+        except BaseException:
+            # Ctrl-C while waiting; the command is in its own group and did not get the signal
+            stop_process_group(process)
             raise
+        finally:
+            for pipe in pipes:
+                pipe.join()
+            self.git_runner.finish(process)
+        
+        stdout = b''.join(stdout_chunks).decode('utf-8', errors='replace')
+        stderr = b''.join(stderr_chunks).decode('utf-8', errors='replace')
+        result_label = 'timeout' if timed_out else 'ok' if process.returncode == 0 else 'failed'
+        self.metrics.inc('split_git_commands_total', phase=phase or 'other', result=result_label)
+        self.metrics.inc('split_git_seconds_total', time.monotonic() - start, phase=phase or 'other')
+        if timed_out:
+            self.logger.error(f"Git command timed out after {timeout}s: {' '.join(command)}")
+            raise subprocess.TimeoutExpired(command, timeout, stdout, stderr)
+        
+        self.git_runner.check_cancelled(command, process.returncode)
+        result = subprocess.CompletedProcess(command, process.returncode, stdout, stderr)
+        if check and result.returncode != 0:
+            self.logger.error(f"Git command failed: {' '.join(command)}")
+            self.logger.error(f"Error: {stderr}")
+            raise subprocess.CalledProcessError(result.returncode, command, stdout, stderr)
+        return result
+    
+    def cancel(self, reason: str):
+        """Stop every running git command; targets stop at their next command."""
+        stopped = self.git_runner.cancel()
+        if stopped:
+            self.logger.warning(f"Cancelled {stopped} running git commands: {reason}")
     
     def clone_source_repo(self) -> str:
         """Clone the source repository to a temporary directory."""
@@ -164,11 +617,266 @@ class RepoSplitter:
         
         if not self.config.dry_run:
             self.run_git_command([
-                'git', 'clone', '--mirror', self.config.source_repo_url, self.source_repo_path
-            ])
+                'git', 'clone', '--mirror', '--progress', self.config.source_repo_url, self.source_repo_path
+            ], phase='clone')
+            
+            if self.config.repack:
+                # Compute good deltas once in the mirror; every target clone
+                # hardlinks these packs and reuses the deltas when repacking
+                self.repack_repository(self.source_repo_path, recompute_deltas=True)
+        elif self.config.discover:
+            # A dry run still has to discover its targets, but only needs the trees of the tips
+            self.run_git_command([
+                'git', 'clone', '--bare', '--depth', '1', '--no-single-branch', '--filter=blob:none',
+                self.config.source_repo_url, self.source_repo_path
+            ], phase='clone')
         
         return self.source_repo_path
     
+    def repack_repository(self, repo_path: str, recompute_deltas: bool = False):
+        """Fully repack a repository with a bitmap index using the configured delta settings."""
+        self.logger.info(f"Repacking {repo_path}")
+        start = time.monotonic()
+        
+        command = [
+            'git', '-c', f'pack.threads={self.config.pack_threads}',
+            'repack', '-a', '-d', '--write-bitmap-index',
+            f'--window={self.config.pack_window}', f'--depth={self.config.pack_depth}'
+        ]
+        if recompute_deltas:
+            command.append('-f')
+        self.run_git_command(command, cwd=repo_path, phase='rewrite')
+        
+        self.logger.info(f"Repacked {repo_path} in {time.monotonic() - start:.1f}s")
+    
+    def select_refs(self, repo_path: str) -> List[str]:
+        """Return the branches and tags of repo_path to publish, main first.
+        
+        Branches and tags must match refs_include and not refs_exclude. Tags are
+        only kept if the commit they point at is reachable from a selected branch.
+        """
+        include = [full_ref_pattern(pattern) for pattern in self.config.refs_include or ['main']]
+        exclude = [full_ref_pattern(pattern) for pattern in self.config.refs_exclude or []]
+        
+        result = self.run_git_command(['git', 'for-each-ref', '--format=%(refname) %(objectname) %(*objectname)',
+                                       'refs/heads', 'refs/tags'], cwd=repo_path)
+        branches = []
+        tags = {}
+        for line in result.stdout.splitlines():
+            ref, *objects = line.split()
+            if not any(fnmatchcase(ref, pattern) for pattern in include):
+                continue
+            if any(fnmatchcase(ref, pattern) for pattern in exclude):
+                continue
+            if ref.startswith('refs/heads/'):
+                branches.append(ref)
+            else:
+                tags[ref] = objects[-1]  # the peeled commit for annotated tags
+        
+        if tags and branches:
+            reachable = set(self.run_git_command(['git', 'rev-list', *branches], cwd=repo_path).stdout.split())
+            dropped = [tag for tag, commit in tags.items() if commit not in reachable]
+            if dropped:
+                self.logger.info(f"Skipping {len(dropped)} tags not reachable from the selected branches")
+            tags = {tag: commit for tag, commit in tags.items() if commit in reachable}
+        elif tags:
+            tags = {}
+        
+        branches.sort(key=lambda ref: ref != 'refs/heads/main')
+        return branches + sorted(tags)
+    
+    def publish_repository(self, repo_path: str, repo_name: str, repo_url: str, force: bool = False):
+        """Point origin at the new repository, optionally repack, and push the selected refs.
+        
+        In bundle mode repo_url is the bundle path and the repository is queued
+        for export_bundles() instead of being pushed.
+        """
+        if self.defer_publishing:
+            self.pending_publishes.append((repo_path, repo_name, repo_url, force))
+            return
+        
+        if self.config.output_mode == 'bundle':
+            if self.config.repack:
+                self.repack_repository(repo_path)
+            self.pending_bundles.append((repo_path, repo_name, repo_url))
+            return
+        
+        if self.scheduler and self.scheduler.active():
+            # Free the rewrite slot; the push runs on the scheduler's network pool
+            self.scheduler.submit_network(self.push_repository, repo_path, repo_name, repo_url, force)
+            return
+        self.push_repository(repo_path, repo_name, repo_url, force)
+    
+    def push_repository(self, repo_path: str, repo_name: str, repo_url: str, force: bool = False):
+        """Point origin at repo_url, optionally repack, and push the selected refs in one push."""
+        # Remove remote origin if it exists
+        self.run_git_command(['git', 'remote', 'remove', 'origin'], cwd=repo_path, check=False)
+        
+        # Add new remote
+        self.run_git_command(['git', 'remote', 'add', 'origin', repo_url], cwd=repo_path)
+        
+        if self.config.repack:
+            self.repack_repository(repo_path)
+        
+        refs = self.select_refs(repo_path)
+        if not refs:
+            self.logger.error(f"No refs of '{repo_name}' match the ref selection, nothing to push")
+            return
+        
+        # LFS objects go first, so the pushed pointers never point at missing content
+        lfs_uploaded = 0
+        if self.lfs:
+            objects = self.lfs_objects(repo_path, repo_name, refs)
+            if objects:
+                lfs_uploaded = self.lfs.push(objects, repo_url)
+                self.logger.info(f"Uploaded {lfs_uploaded} of {len(objects)} LFS objects for '{repo_name}'")
+        
+        # One push with explicit refspecs, so the pack for all refs is negotiated once;
+        # --progress makes git report bytes written
+        start = time.monotonic()
+        push_command = ['git', 'push', '--progress', '-u', 'origin', *[f'{ref}:{ref}' for ref in refs]]
+        if force:
+            push_command.insert(2, '-f')
+        result = self.run_git_command(push_command, cwd=repo_path, phase='push')
+        
+        self.push_stats[repo_name] = {
+            'seconds': time.monotonic() - start,
+            'bytes': parse_push_bytes(result.stderr),
+            'refs': len(refs),
+            'lfs_objects': lfs_uploaded,
+        }
+        self.metrics.inc('split_pushed_bytes_total', self.push_stats[repo_name]['bytes'], target=repo_name)
+        self.metrics.inc('split_lfs_objects_uploaded_total', lfs_uploaded, target=repo_name)
+    
+    def lfs_objects(self, repo_path: str, repo_name: str, refs: List[str]) -> Dict[str, int]:
+        """Return the LFS objects reachable from the refs of a target, making sure they are cached."""
+        objects = scan_pointers(repo_path, refs)
+        if not objects:
+            return {}
+        self.logger.info(f"'{repo_name}' references {len(objects)} LFS objects "
+                         f"({format_size(sum(objects.values()))})")
+        self.lfs.fetch(objects)
+        
+        attributes = self.run_git_command(['git', 'ls-tree', '--name-only', refs[0], '.gitattributes'], cwd=repo_path)
+        if not attributes.stdout.strip():
+            self.logger.warning(f"'{repo_name}' has LFS pointers but no .gitattributes at its root; "
+                                f"checkouts will show the pointer files")
+        return objects
+    
+    def setup_lfs(self):
+        """Set up the shared LFS cache and where missing objects are fetched from."""
+        source_store = local_lfs_store(self.config.source_repo_url)
+        source_lfs_url = self.config.source_lfs_url
+        if not source_lfs_url and not source_store and not os.path.isdir(self.config.source_repo_url):
+            source_lfs_url = lfs_endpoint(self.config.source_repo_url)
+        
+        token = self.config.github_token
+        self.lfs = LfsTransfer(
+            os.path.join(self.working_dir, self.config.lfs_cache),
+            source_store=source_store,
+            source_lfs_url=source_lfs_url or None,
+            auth=('x-access-token', token) if token else None,
+            workers=self.config.lfs_workers,
+            logger=self.logger,
+        )
+        if source_store or source_lfs_url:
+            self.logger.info(f"LFS objects are fetched from {source_store or source_lfs_url} "
+                             f"into {self.config.lfs_cache}")
+        else:
+            self.logger.warning(f"The source has no LFS storage; only objects already in "
+                                f"{self.config.lfs_cache} can be published")
+    
+    def create_bundle(self, repo_path: str, repo_name: str, bundle_path: str) -> Dict[str, Union[str, int]]:
+        """Write a git bundle of the selected refs of one target and return its manifest entry."""
+        self.logger.info(f"Creating bundle for '{repo_name}': {bundle_path}")
+        
+        refs = self.select_refs(repo_path)
+        self.run_git_command(['git', 'bundle', 'create', bundle_path, 'HEAD', *refs], cwd=repo_path)
+        self.run_git_command(['git', 'bundle', 'verify', bundle_path], cwd=repo_path)
+        
+        # Bundles carry no LFS content; the objects go next to them in the cache layout
+        objects = self.lfs_objects(repo_path, repo_name, refs) if self.lfs else {}
+        if objects:
+            self.lfs.export(objects, os.path.join(os.path.dirname(bundle_path), 'lfs'))
+        
+        return {
+            'repo_name': repo_name,
+            'description': self.bundle_descriptions.get(repo_name, ""),
+            'bundle': os.path.basename(bundle_path),
+            'sha256': file_sha256(bundle_path),
+            'size': os.path.getsize(bundle_path),
+            'refs': refs,
+            'lfs_objects': len(objects),
+        }
+    
+    def export_bundles(self) -> List[Dict[str, Union[str, int]]]:
+        """Create all queued bundles in parallel and write a checksummed manifest."""
+        if not self.pending_bundles:
+            return []
+        
+        bundle_dir = os.path.join(self.working_dir, self.config.bundle_dir)
+        os.makedirs(bundle_dir, exist_ok=True)
+        entries = []
+        
+        with ThreadPoolExecutor(max_workers=os.cpu_count()) as executor:
+            futures = {
+                executor.submit(run_in_target, repo_name, self.create_bundle, repo_path, repo_name, bundle_path): repo_name
+                for repo_path, repo_name, bundle_path in self.pending_bundles
+            }
+            for future in as_completed(futures):
+                entries.append(future.result())
+        
+        entries.sort(key=lambda entry: entry['repo_name'])
+        manifest_path = os.path.join(bundle_dir, 'manifest.json')
+        with open(manifest_path, 'w') as f:
+            json.dump({
+                'source_repo_url': self.config.source_repo_url,
+                'created_at': datetime.now().isoformat(),
+                'bundles': entries,
+            }, f, indent=2)
+        
+        self.logger.info(f"Wrote {len(entries)} bundles and manifest to {manifest_path}")
+        return entries
+    
+    def provision_target(self, repo_name: str, description: str = "") -> Optional[str]:
+        """Return where a target is delivered: a new GitHub repo, or a bundle path in bundle mode."""
+        if self.config.output_mode == 'bundle':
+            self.bundle_descriptions[repo_name] = description
+            return os.path.join(self.working_dir, self.config.bundle_dir, f"{repo_name}.bundle")
+        return self.create_github_repo(repo_name, description)
+    
+    @property
+    def github(self):
+        """PyGithub client; PyGithub is only imported when the run talks to GitHub."""
+        # Concurrent targets share one client
+        with self.lock:
+            if self._github is None:
+                from github import Github
+                # Bundle mode runs without a token; PyGithub rejects an empty one
+                if self.config.github_token:
+                    self._github = Github(self.config.github_token, base_url=self.config.github_api_url)
+                else:
+                    self._github = Github(base_url=self.config.github_api_url)
+        return self._github
+    
+    @property
+    def github_metadata(self) -> GitHubCache:
+        """Cached, ETag-revalidated repository and account lookups; PyGithub is only needed to create repos."""
+        # Concurrent targets share one cache, so its entries and lookup counts cover the whole run
+        with self.lock:
+            if self._github_metadata is None:
+                cache_path = os.path.join(self.working_dir, self.config.github_cache) if self.config.github_cache else ''
+                self._github_metadata = GitHubCache(self.config.github_api_url, self.config.github_token, cache_path,
+                                                    self.config.github_cache_max_age, self.logger,
+                                                    self.record_github_lookup)
+        return self._github_metadata
+    
+    def record_github_lookup(self, kind: str, result: str):
+        """Count a metadata lookup, and an API call unless the cache answered it without asking."""
+        self.metrics.inc('split_github_cache_lookups_total', kind=kind, result=result)
+        if result != 'fresh':
+            self.metrics.inc('split_github_api_calls_total', operation=LOOKUP_OPERATIONS[kind])
+    
     def create_github_repo(self, repo_name: str, description: str = "") -> Optional[str]:
         """Create a new GitHub repository via API."""
         if self.config.dry_run:
@@ -178,39 +886,76 @@ class RepoSplitter:
         try:
             # Check if repo already exists
             try:
-                existing_repo = self.github.get_repo(f"{self.config.org}/{repo_name}")
+                existing_repo = self.github_metadata.repo(self.config.org, repo_name)
+            except GitHubApiError as e:
+                self.logger.warning(f"Could not look up repository {repo_name}, trying to create it: {e}")
+                existing_repo = None
+            if existing_repo:
                 self.logger.warning(f"Repository {repo_name} already exists, skipping creation")
-                return existing_repo.clone_url
-            except GithubException:
-                pass
-            
-            # Create new repository
-            if '/' in self.config.org:
-                # Organization
-                org = self.github.get_organization(self.config.org)
-                repo = org.create_repo(
-                    name=repo_name,
-                    description=description,
-                    private=False,
-                    auto_init=False
-                )
-            else:
-                # User
-                user = self.github.get_user()
-                repo = user.create_repo(
-                    name=repo_name,
-                    description=description,
-                    private=False,
-                    auto_init=False
-                )
-            
-            self.logger.info(f"Created repository: {repo_name}")
-            self.created_repos.append(repo_name)
-            return repo.clone_url
-            
-        except GithubException as e:
-            self.logger.error(f"Failed to create repository {repo_name}: {e}")
-            return None
+                return existing_repo['clone_url']
+            
+            # Imported only now: dry runs and runs whose repositories all exist never load PyGithub
+            from github import GithubException
+            
+            try:
+                # Create new repository
+                self.metrics.inc('split_github_api_calls_total', operation='create_repo')
+                if '/' in self.config.org:
+                    # Organization
+                    self.metrics.inc('split_github_api_calls_total', operation='get_organization')
+                    org = self.github.get_organization(self.config.org)
+                    repo = org.create_repo(
+                        name=repo_name,
+                        description=description,
+                        private=False,
+                        auto_init=False
+                    )
+                else:
+                    # User
+                    user = self.github.get_user()
+                    repo = user.create_repo(
+                        name=repo_name,
+                        description=description,
+                        private=False,
+                        auto_init=False
+                    )
+                
+                self.logger.info(f"Created repository: {repo_name}")
+                self.created_repos.append(repo_name)
+                # The next run finds it in the cache instead of asking again
+                self.github_metadata.store_repo(*repo.full_name.split('/', 1), repo.raw_data)
+                return repo.clone_url
+                
+            except GithubException as e:
+                self.logger.error(f"Failed to create repository {repo_name}: {e}")
+                return None
+        finally:
+            self.record_rate_limit()
+    
+    def record_rate_limit(self):
+        """Export the rate-limit headroom reported by the last GitHub API response."""
+        if not self.rate_limit_known:
+            return
+        if self._github is None:
+            # Only the metadata cache has talked to GitHub, if anything has; asking PyGithub would cost a request
+            if not (self._github_metadata and self._github_metadata.rate_limit):
+                return
+            remaining, limit, reset = self._github_metadata.rate_limit
+        else:
+            from github import GithubException
+            import requests
+            
+            try:
+                # Read from the response headers; only fetched from /rate_limit when there were none
+                remaining, limit = self.github.rate_limiting
+                reset = self.github.rate_limiting_resettime
+            except (GithubException, requests.RequestException):
+                # e.g. GitHub Enterprise with rate limiting turned off
+                self.rate_limit_known = False
+                return
+        self.metrics.set('split_github_rate_limit', limit)
+        self.metrics.set('split_github_rate_limit_remaining', remaining)
+        self.metrics.set('split_github_rate_limit_reset_timestamp_seconds', reset)
     
     def extract_branch_to_repo(self, branch_name: str, repo_name: str, repo_url: str):
         """Extract a single branch to a new repository."""
@@ -218,46 +963,201 @@ class RepoSplitter:
         
         self.logger.info(f"Extracting branch '{branch_name}' to repository '{repo_name}'")
         
-        if not self.config.dry_run:
+        if not self.config.dry_run and self.history_limited():
+            # Rewrite only the recent history of the branch into main
+            self.rewrite_sharded(branch_repo_path, None, ref=f'refs/heads/{branch_name}')
+            self.transform_target(branch_repo_path, '')
+            self.record_target(repo_name, branch_repo_path)
+            self.publish_repository(branch_repo_path, repo_name, repo_url)
+            self.logger.info(f"Successfully extracted branch '{branch_name}' to '{repo_name}'")
+        
+        elif not self.config.dry_run:
             # Clone the mirror repo
-            self.run_git_command(['git', 'clone', self.source_repo_path, branch_repo_path])
-            
-            # Change to the branch repository directory
-            os.chdir(branch_repo_path)
+            self.run_git_command(['git', 'clone', self.source_repo_path, branch_repo_path], phase='rewrite')
             
             # Fetch all branches
-            self.run_git_command(['git', 'fetch', 'origin'])
+            self.run_git_command(['git', 'fetch', 'origin'], cwd=branch_repo_path)
             
             # Checkout the specific branch
-            self.run_git_command(['git', 'checkout', branch_name])
+            self.run_git_command(['git', 'checkout', branch_name], cwd=branch_repo_path)
             
             # Create a new branch from the current state
-            self.run_git_command(['git', 'checkout', '-b', 'temp_branch'])
+            self.run_git_command(['git', 'checkout', '-b', 'temp_branch'], cwd=branch_repo_path)
             
             # Remove all other branches except the current one
-            self.run_git_command(['git', 'branch', '-D', branch_name])
+            self.run_git_command(['git', 'branch', '-D', branch_name], cwd=branch_repo_path)
             
             # Check if main branch exists and handle it
             try:
                 # Try to rename temp_branch to main
-                self.run_git_command(['git', 'branch', '-m', 'temp_branch', 'main'])
+                self.run_git_command(['git', 'branch', '-m', 'temp_branch', 'main'], cwd=branch_repo_path)
             except subprocess.CalledProcessError:
                 # If main already exists, delete it first
                 self.logger.info("Main branch already exists, removing it first")
-                self.run_git_command(['git', 'branch', '-D', 'main'])
-                self.run_git_command(['git', 'branch', '-m', 'temp_branch', 'main'])
-            
-            # Remove remote origin
-            self.run_git_command(['git', 'remote', 'remove', 'origin'])
+                self.run_git_command(['git', 'branch', '-D', 'main'], cwd=branch_repo_path)
+                self.run_git_command(['git', 'branch', '-m', 'temp_branch', 'main'], cwd=branch_repo_path)
             
-            # Add new remote
-            self.run_git_command(['git', 'remote', 'add', 'origin', repo_url])
+            # History is kept as is, so every commit maps to itself
+            revs = self.run_git_command(['git', 'rev-list', 'main'], cwd=branch_repo_path)
+            self.commit_maps[branch_repo_path] = {sha: sha for sha in revs.stdout.split()}
+            self.transform_target(branch_repo_path, '')
+            self.record_target(repo_name, branch_repo_path)
             
             # Push to the new repository
-            self.run_git_command(['git', 'push', '-u', 'origin', 'main'])
+            self.publish_repository(branch_repo_path, repo_name, repo_url)
             
             self.logger.info(f"Successfully extracted branch '{branch_name}' to '{repo_name}'")
     
+    def extract_subdirectory(self, repo_path: str, subdirectory: str) -> bool:
+        """Create repo_path from the mirror with subdirectory as the root of main.
+        
+        Returns False if the subdirectory does not exist.
+        """
+        if self.config.rewrite_shards or self.history_limited():
+            return self.rewrite_sharded(repo_path, subdirectory)
+        return self.filter_subdirectory(repo_path, subdirectory)
+    
+    def history_limited(self) -> bool:
+        """Return True if only recent history should be kept (--since / --max-commits)."""
+        return bool(self.config.since or self.config.max_commits)
+    
+    def filter_subdirectory(self, repo_path: str, subdirectory: str, filter_args: List[str] = ()) -> bool:
+        """Clone the mirror and rewrite it to subdirectory with git filter-repo.
+        
+        filter_args are passed on to git filter-repo, e.g. to keep more paths.
+        """
+        # Clone the mirror repo
+        self.run_git_command(['git', 'clone', self.source_repo_path, repo_path], phase='rewrite')
+        
+        # Check if the directory exists in the repository
+        if not os.path.exists(os.path.join(repo_path, subdirectory)):
+            return False
+        
+        # Use git filter-repo to extract only the subdirectory
+        # Move everything from subdirectory/ to the root
+        self.run_git_command([
+            'git', 'filter-repo',
+            '--path', f'{subdirectory}/',
+            '--path-rename', f'{subdirectory}/:',
+            *filter_args,
+            '--force'
+        ], cwd=repo_path, phase='rewrite')
+        self.commit_maps[repo_path] = read_filter_repo_map(repo_path)
+        
+        # Check if main branch exists after filtering
+        result = self.run_git_command(['git', 'branch', '--list', 'main'], cwd=repo_path, check=False)
+        if not result.stdout.strip():
+            # No main branch: the checked out branch becomes main instead of being copied to it
+            self.logger.info("No main branch found after filtering, renaming the current branch to main")
+            self.run_git_command(['git', 'branch', '-m', 'main'], cwd=repo_path)
+        
+        return True
+    
+    def rewrite_sharded(self, repo_path: str, subdirectory: Optional[str], ref: str = 'HEAD') -> bool:
+        """Bare-clone the mirror and rewrite its branches and tags with the sharded rewriter.
+        
+        subdirectory becomes the root, or the whole tree is kept when it is None.
+        As after filter-repo, every branch and tag is rewritten and the ones left
+        without commits are deleted. ref is the branch that becomes main; for a
+        branch target (ref given) the other branches are dropped. Each ref only
+        keeps its history after its own --since / --max-commits cutoff.
+        """
+        self.run_git_command(['git', 'clone', '--bare', self.source_repo_path, repo_path], phase='rewrite')
+        
+        listing = self.run_git_command(['git', 'for-each-ref', '--format=%(refname) %(objecttype) %(*objecttype)',
+                                        'refs/heads', 'refs/tags'], cwd=repo_path)
+        refs = {}
+        for line in listing.stdout.splitlines():
+            name, *kinds = line.split()
+            refs[name] = kinds[-1] == 'commit'  # tags of trees or blobs have no history to rewrite
+        if ref == 'HEAD':
+            # Like filter_subdirectory: main stays main, otherwise the checked out branch becomes main
+            head = self.run_git_command(['git', 'symbolic-ref', 'HEAD'], cwd=repo_path).stdout.strip()
+            main_ref = 'refs/heads/main' if 'refs/heads/main' in refs else head
+        else:
+            main_ref = ref
+        selected = [main_ref] + [
+            name for name, is_commit in refs.items()
+            if is_commit and name != main_ref and (ref == 'HEAD' or name.startswith('refs/tags/'))
+        ]
+        dropped = [name for name in refs if name not in selected]
+        if dropped:
+            self.run_git_command(['git', 'update-ref', '--stdin'], cwd=repo_path,
+                                 input=''.join(f'delete {name}\n' for name in dropped))
+        
+        rewriter = HistoryRewriter(repo_path, subdirectory, self.logger)
+        cutoffs = rewriter.find_cutoffs(selected, self.config.since, self.config.max_commits)
+        if any(cutoffs.values()):
+            self.logger.info(f"Squashing history before the cutoff of {sum(map(bool, cutoffs.values()))} "
+                             f"refs into new root commits")
+        result = rewriter.rewrite_refs(cutoffs, shards=max(self.config.rewrite_shards, 1))
+        if self.config.verify_shards:
+            rewriter.verify(result)
+        if result.tip is None:
+            return False
+        
+        empty = [name for name, tip in result.tips.items() if tip is None]
+        if empty:
+            self.logger.info(f"Deleting {len(empty)} refs left without commits: {', '.join(empty[:5])}")
+        rewriter.write(result, main_ref)
+        self.commit_maps[repo_path] = pruned_as_none(result.commit_map)
+        return True
+    
+    def common_closure(self, project_name: str) -> List[str]:
+        """Return the common_path files a project needs, read from the mirror without a checkout."""
+        with self.lock:
+            if self.dependency_graph is None:
+                self.dependency_graph = DependencyClosure(self.source_repo_path, self.config.common_path,
+                                                          logger=self.logger)
+                self.dependency_graph.load(self.config.projects)
+        
+        files = self.dependency_graph.closure(project_name)
+        common_files = [path for path in self.dependency_graph.files if self.dependency_graph.in_common(path)]
+        self.logger.info(f"Project '{project_name}' needs {len(files)} of {len(common_files)} common files")
+        return files
+    
+    def composite_filter_args(self, project_name: str) -> List[str]:
+        """Return the filter-repo arguments that add common_path to a project in the same pass."""
+        common_path = self.config.common_path.strip('/')
+        common_subdir = (self.config.common_subdir or os.path.basename(common_path)).strip('/')
+        trims = {}
+        if self.config.common_closure:
+            files = self.common_closure(project_name)
+            args = [arg for path in files for arg in ('--path', path)]
+            # The common Makefile must not name the sources the closure leaves out
+            trims = {
+                f'{common_subdir}{makefile[len(common_path):]}': sources
+                for makefile, sources in self.dependency_graph.missing_sources(files).items()
+            }
+        else:
+            args = ['--path', f'{common_path}/']
+        args += ['--path-rename', f'{common_path}/:{common_subdir}/']
+        
+        if self.config.rewrite_common_refs:
+            args += self.common_refs_filter_args(project_name)
+        if trims:
+            self.logger.info(f"Trimming {sum(map(len, trims.values()))} left-out sources from "
+                             f"{', '.join(trims)}")
+            callback_path = os.path.join(self.temp_dir, f"trim_sources_{project_name}.py")
+            with open(callback_path, 'w') as f:
+                f.write(trim_callback(trims, replace_text=self.config.rewrite_common_refs))
+            args += ['--file-info-callback', callback_path]
+        
+        return args
+    
+    def common_refs_filter_args(self, project_name: str) -> List[str]:
+        """Return the filter-repo arguments that point '../<common_path>' at common_subdir inside the project."""
+        common_path = self.config.common_path.strip('/')
+        common_subdir = (self.config.common_subdir or os.path.basename(common_path)).strip('/')
+        
+        # Only Makefile-style assignments such as 'LIBFT_PATH = ../libft' are rewritten;
+        # relative #include paths still resolve because common_subdir sits inside the project
+        expressions_path = os.path.join(self.temp_dir, f"replace_refs_{project_name}.txt")
+        pattern = rf'(?m)^(\s*[A-Za-z_][A-Za-z0-9_]*\s*[:?+]?=\s*)\.\./{re.escape(common_path)}\b'
+        with open(expressions_path, 'w') as f:
+            f.write(f'regex:{pattern}==>\\1{common_subdir}\n')
+        return ['--replace-text', expressions_path]
+    
     def extract_project_to_repo(self, project_name: str, repo_name: str, repo_url: str):
         """Extract a single project to a new repository using git filter-repo."""
         project_repo_path = os.path.join(self.temp_dir, f"project_{project_name}")
@@ -265,48 +1165,121 @@ class RepoSplitter:
         self.logger.info(f"Extracting project '{project_name}' to repository '{repo_name}'")
         
         if not self.config.dry_run:
-            # Clone the mirror repo
-            self.run_git_command(['git', 'clone', self.source_repo_path, project_repo_path])
-            
-            # Change to the project repo directory
-            os.chdir(project_repo_path)
+            if self.config.composite and self.config.common_path:
+                # Project and common library are rewritten together in one filter-repo pass
+                if self.config.rewrite_shards or self.history_limited():
+                    self.logger.warning("Composite targets use git filter-repo; "
+                                        "sharding and --since/--max-commits are ignored for them")
+                extracted = self.filter_subdirectory(project_repo_path, project_name,
+                                                     self.composite_filter_args(project_name))
+            elif self.config.wire_submodule and self.config.rewrite_common_refs and self.config.common_path:
+                # The submodule sits inside the project, so '../<common_path>' has to follow it
+                if self.config.rewrite_shards or self.history_limited():
+                    self.logger.warning("Rewriting common references uses git filter-repo; "
+                                        "sharding and --since/--max-commits are ignored")
+                extracted = self.filter_subdirectory(project_repo_path, project_name,
+                                                     self.common_refs_filter_args(project_name))
+            else:
+                extracted = self.extract_subdirectory(project_repo_path, project_name)
             
-            # Check if the project directory exists in the repository
-            if not os.path.exists(project_name):
+            if not extracted:
                 self.logger.warning(f"Project directory '{project_name}' not found in repository")
                 return
             
-            # Use git filter-repo to extract only the project path
-            # Move everything from project_name/ to the root
-            self.run_git_command([
-                'git', 'filter-repo',
-                '--path', f'{project_name}/',
-                '--path-rename', f'{project_name}/:',
-                '--force'
-            ])
-            
-            # Check if main branch exists after filtering
-            result = self.run_git_command(['git', 'branch', '--list', 'main'], check=False)
-            if not result.stdout.strip():
-                # No main branch, create one from the current HEAD
-                self.logger.info("No main branch found after filtering, creating one")
-                self.run_git_command(['git', 'checkout', '-b', 'main'])
-            
-            # Remove remote origin if it exists
-            try:
-                self.run_git_command(['git', 'remote', 'remove', 'origin'])
-            except subprocess.CalledProcessError:
-                # Remote doesn't exist, which is fine
-                pass
-            
-            # Add new remote
-            self.run_git_command(['git', 'remote', 'add', 'origin', repo_url])
+            self.transform_target(project_repo_path, project_name)
+            if self.config.wire_submodule and self.config.common_path:
+                self.wire_common_submodule(project_repo_path)
+            self.record_target(repo_name, project_repo_path)
             
             # Push to the new repository
-            self.run_git_command(['git', 'push', '-u', 'origin', 'main'])
+            self.publish_repository(project_repo_path, repo_name, repo_url)
             
             self.logger.info(f"Successfully extracted project '{project_name}' to '{repo_name}'")
     
+    def transform_target(self, repo_path: str, prefix: str):
+        """Apply the registered path and blob transforms to every branch and tag of an extracted repository.
+        
+        prefix is where the repository root lives in the monorepo; the transforms match monorepo paths.
+        """
+        if not self.transforms.active:
+            return
+        transform_map = self.transforms.transform_history(repo_path, prefix)
+        if repo_path in self.commit_maps:
+            # Keep the map from source commits to the commits that actually get published
+            self.commit_maps[repo_path] = {
+                old: transform_map.get(new, new) if new else None for old, new in self.commit_maps[repo_path].items()
+            }
+    
+    def record_target(self, repo_name: str, repo_path: str):
+        """Remember an extracted target and store its commit map in the commit index."""
+        self.target_repos[repo_name] = repo_path
+        if repo_path in self.commit_maps:
+            rewritten = {new for new in self.commit_maps[repo_path].values() if new}
+            self.metrics.set('split_commits_rewritten', len(rewritten), target=repo_name)
+        if self.commit_index and repo_path in self.commit_maps:
+            self.commit_index.record(self.index_run_id, repo_name, self.commit_maps[repo_path])
+    
+    def rewrite_cross_references(self):
+        """Rewrite monorepo SHAs in the commit messages of all targets and re-index the final commits."""
+        targets = {
+            repo_name: (repo_path, self.commit_maps[repo_path])
+            for repo_name, repo_path in self.target_repos.items() if repo_path in self.commit_maps
+        }
+        # Wired project commits pin common-libs commits, which this pass rewrites too
+        submodule_path = None
+        if self.config.wire_submodule and self.config.common_path:
+            submodule_path = self.config.common_subdir or os.path.basename(self.config.common_path.strip('/'))
+        rewriter = CrossReferenceRewriter(self.source_repo_path, self.commit_index, self.index_run_id, self.logger,
+                                          submodule_path)
+        final = rewriter.rewrite(targets)
+        
+        for repo_name, (repo_path, commit_map) in targets.items():
+            self.commit_maps[repo_path] = {
+                old: final[repo_name].get(new, new) if new else None for old, new in commit_map.items()
+            }
+            self.commit_index.record(self.index_run_id, repo_name, self.commit_maps[repo_path])
+    
+    def publish_deferred(self):
+        """Publish the targets whose push waited for the cross-reference pass."""
+        self.defer_publishing = False
+        with ThreadPoolExecutor(max_workers=max(self.config.push_workers, 1)) as executor:
+            futures = {executor.submit(run_in_target, publish[1], self.publish_repository, *publish): publish[1]
+                       for publish in self.pending_publishes}
+            try:
+                for future in as_completed(futures):
+                    try:
+                        future.result()
+                    except TargetCancelled:
+                        pass
+                    except Exception as e:
+                        self.target_failed(futures[future], e)
+            except BaseException as e:
+                for future in futures:
+                    future.cancel()
+                self.cancel(f"{type(e).__name__}: {e}")
+                raise
+        self.pending_publishes = []
+    
+    def wire_common_submodule(self, project_repo_path: str):
+        """Pin common-libs as a submodule in every commit of an extracted project repository."""
+        common_map = self.commit_maps.get(os.path.join(self.temp_dir, "common_libs"))
+        if common_map is None:
+            self.logger.warning("Common libraries were not extracted, skipping submodule wiring")
+            return
+        with self.lock:
+            if self.submodule_pins is None:
+                self.submodule_pins = pin_commits(self.source_repo_path, common_map)
+        
+        common_path = self.config.common_path.strip('/')
+        submodule_path = self.config.common_subdir or os.path.basename(common_path)
+        wiring = SubmoduleWiring(project_repo_path, submodule_path, self.config.submodule_url, self.logger)
+        wired = wiring.wire(self.commit_maps[project_repo_path], self.submodule_pins)
+        
+        # Keep the map from source commits to the commits that actually get published
+        self.commit_maps[project_repo_path] = {
+            old: wired.get(new) if new else None for old, new in self.commit_maps[project_repo_path].items()
+        }
+    
     def extract_common_libs(self, repo_name: str, repo_url: str):
         """Extract common libraries to a separate repository using git filter-repo."""
         if not self.config.common_path:
@@ -318,39 +1291,14 @@ class RepoSplitter:
         self.logger.info(f"Extracting common libraries from '{self.config.common_path}' to '{repo_name}'")
         
         if not self.config.dry_run:
-            # Clone the mirror repo
-            self.run_git_command(['git', 'clone', self.source_repo_path, common_repo_path])
-            
-            # Change to the common repo directory
-            os.chdir(common_repo_path)
-            
-            # Use git filter-repo to extract only the common path
-            self.run_git_command([
-                'git', 'filter-repo',
-                '--path', f'{self.config.common_path}/',
-                '--path-rename', f'{self.config.common_path}/:',
-                '--force'
-            ])
-            
-            # Check if main branch exists after filtering
-            result = self.run_git_command(['git', 'branch', '--list', 'main'], check=False)
-            if not result.stdout.strip():
-                # No main branch, create one from the current HEAD
-                self.logger.info("No main branch found after filtering, creating one")
-                self.run_git_command(['git', 'checkout', '-b', 'main'])
-            
-            # Remove remote origin if it exists
-            try:
-                self.run_git_command(['git', 'remote', 'remove', 'origin'])
-            except subprocess.CalledProcessError:
-                # Remote doesn't exist, which is fine
-                pass
-            
-            # Add new remote
-            self.run_git_command(['git', 'remote', 'add', 'origin', repo_url])
+            if not self.extract_subdirectory(common_repo_path, self.config.common_path):
+                self.logger.warning(f"Common path '{self.config.common_path}' not found in repository")
+                return
+            self.transform_target(common_repo_path, self.config.common_path)
+            self.record_target(repo_name, common_repo_path)
             
             # Push to the new repository
-            self.run_git_command(['git', 'push', '-u', 'origin', 'main'])
+            self.publish_repository(common_repo_path, repo_name, repo_url)
             
             self.logger.info(f"Successfully extracted common libraries to '{repo_name}'")
     
@@ -363,28 +1311,29 @@ class RepoSplitter:
         if not self.config.dry_run:
             if self.config.mode == 'branch':
                 # Get all branches
-                os.chdir(self.source_repo_path)
-                result = self.run_git_command(['git', 'branch', '-r'])
+                result = self.run_git_command(['git', 'branch', '-r'], cwd=self.source_repo_path)
                 all_branches = [line.strip() for line in result.stdout.split('\n') if line.strip()]
                 
                 # For each branch, get the file tree
                 for branch in self.config.branches:
                     branch_ref = f"origin/{branch}"
                     if branch_ref in all_branches:
-                        result = self.run_git_command(['git', 'ls-tree', '-r', '--name-only', branch_ref])
+                        result = self.run_git_command(['git', 'ls-tree', '-r', '--name-only', branch_ref],
+                                                      cwd=self.source_repo_path)
                         files = [line.strip() for line in result.stdout.split('\n') if line.strip()]
                         common_files[branch] = files
             else:
-                # For project mode, analyze current directory structure
-                os.chdir(self.source_repo_path)
-                for project in self.config.projects:
-                    if os.path.exists(project):
-                        project_files = []
-                        for root, dirs, files in os.walk(project):
-                            for file in files:
-                                rel_path = os.path.relpath(os.path.join(root, file), '.')
-                                project_files.append(rel_path)
-                        common_files[project] = project_files
+                # For project mode, list the tree at HEAD of the mirror once for all projects
+                projects = set(self.config.projects)
+                result = self.run_git_command(['git', 'ls-tree', '-r', '--name-only', 'HEAD', '--',
+                                               *[f'{project}/' for project in self.config.projects]],
+                                              cwd=self.source_repo_path, check=False)
+                for path in result.stdout.splitlines():
+                    parts = path.split('/')
+                    owner = next(('/'.join(parts[:depth]) for depth in range(1, len(parts))
+                                  if '/'.join(parts[:depth]) in projects), None)
+                    if owner:
+                        common_files.setdefault(owner, []).append(path)
             
             # Find common files across branches/projects
             if len(common_files) > 1:
@@ -398,67 +1347,262 @@ class RepoSplitter:
         
         return common_files
     
+    def resolve_targets(self, repo_path: str):
+        """Fill in the projects (or branches) from the discovery rules when discovery is on."""
+        if not self.config.discover:
+            return
+        rules = DiscoveryRules(self.config.discover_patterns or ['*'], self.config.discover_markers or [],
+                               self.config.discover_exclude or [], self.config.common_path)
+        manifest_path = os.path.join(self.working_dir, self.config.target_manifest) if self.config.target_manifest else ''
+        discovery = TargetDiscovery(repo_path, rules, manifest_path, self.logger)
+        targets = discovery.discover(self.config.source_repo_url, self.config.mode)
+        if not targets:
+            raise ValueError(f"Discovery found no {'branches' if self.config.mode == 'branch' else 'projects'} "
+                             f"to split in {self.config.source_repo_url}")
+        if self.config.mode == 'branch':
+            self.config.branches = targets
+        else:
+            self.config.projects = targets
+        self.logger.info(f"Targets: {', '.join(targets[:20])}" + (f" and {len(targets) - 20} more" if len(targets) > 20 else ""))
+    
+    def report_progress(self, targets_done: int, targets_total: int):
+        """Notify the progress callback, if one is set, that a target was processed."""
+        self.metrics.set('split_targets', targets_total, state='total')
+        self.metrics.set('split_targets', targets_done - len(self.failed_targets), state='done')
+        self.metrics.set('split_targets', len(self.failed_targets), state='failed')
+        self.flush_metrics()
+        if self.progress_callback:
+            self.progress_callback(targets_done, targets_total)
+    
+    def split_common_libs(self):
+        """Create the common-libs repository and extract common_path into it."""
+        repo_name = "common-libs"
+        description = f"Common libraries extracted from {self.config.common_path}"
+        
+        self.logger.info(f"Processing common libraries from: {self.config.common_path}")
+        
+        # Create GitHub repository
+        repo_url = self.provision_target(repo_name, description)
+        if repo_url:
+            # Extract common libraries
+            self.extract_common_libs(repo_name, repo_url)
+            self.logger.info(f"Common libraries repository URL: {repo_url}")
+        else:
+            self.logger.error("Failed to create common libraries repository")
+    
+    def split_branch(self, branch: str):
+        """Create the repository of one branch and extract the branch into it."""
+        repo_name = f"{branch}-app"
+        description = f"Application extracted from {branch} branch of monorepo"
+        
+        self.logger.info(f"Processing branch: {branch}")
+        
+        # Create GitHub repository
+        repo_url = self.provision_target(repo_name, description)
+        if repo_url:
+            # Extract branch to new repository
+            self.extract_branch_to_repo(branch, repo_name, repo_url)
+            self.logger.info(f"Repository URL: {repo_url}")
+        else:
+            self.logger.error(f"Failed to create repository for branch: {branch}")
+    
+    def split_project(self, project: str):
+        """Create the repository of one project and extract the project into it."""
+        repo_name = f"{project}-app"
+        description = f"Application extracted from {project} project of monorepo"
+        
+        self.logger.info(f"Processing project: {project}")
+        
+        # Create GitHub repository
+        repo_url = self.provision_target(repo_name, description)
+        if repo_url:
+            # Extract project to new repository
+            self.extract_project_to_repo(project, repo_name, repo_url)
+            self.logger.info(f"Repository URL: {repo_url}")
+        else:
+            self.logger.error(f"Failed to create repository for project: {project}")
+    
+    def split_targets(self, include_common: bool) -> List[SplitTarget]:
+        """Return the targets of this run with the ref and paths their cost is estimated from."""
+        targets = []
+        if self.config.mode == 'branch':
+            for branch in self.config.branches:
+                targets.append(SplitTarget(f"{branch}-app", partial(self.split_branch, branch),
+                                           ref=f'refs/heads/{branch}'))
+        else:
+            for project in self.config.projects:
+                paths = [project]
+                if self.config.composite and self.config.common_path:
+                    paths.append(self.config.common_path)
+                targets.append(SplitTarget(f"{project}-app", partial(self.split_project, project), paths=paths))
+        if include_common and self.config.common_path:
+            targets.append(SplitTarget("common-libs", self.split_common_libs, paths=[self.config.common_path]))
+        return targets
+    
+    def target_failed(self, repo_name: str, error: Exception):
+        """Apply the failure policy to a target that failed outside the scheduler."""
+        if self.config.failure_policy == 'fail-fast':
+            raise error
+        self.logger.error(f"Target '{repo_name}' failed: {error}")
+        self.failed_targets[repo_name] = str(error)
+    
+    def run_targets(self, targets: List[SplitTarget], targets_done: int, targets_total: int) -> int:
+        """Run targets longest-first on split_workers rewrite slots, pushing on push_workers.
+        
+        Returns the number of targets processed so far, failed ones included.
+        """
+        cost_model = None
+        if not self.config.dry_run:
+            history_path = os.path.join(self.working_dir, self.config.history_file) if self.config.history_file else ''
+            cost_model = CostModel(self.source_repo_path, history_path, self.config.source_repo_url, self.logger)
+            cost_model.estimate_all(targets)
+        
+        if self.progress:
+            self.progress.add_targets(targets)
+        
+        def on_start(target: SplitTarget):
+            if self.progress:
+                self.progress.start(target.name)
+        
+        def on_done(target: SplitTarget):
+            nonlocal targets_done
+            timings = self.scheduler.timings(target)
+            self.metrics.set('split_phase_seconds', timings['rewrite_seconds'], target=target.name, phase='rewrite')
+            self.metrics.set('split_phase_seconds', timings['push_seconds'], target=target.name, phase='push')
+            if cost_model:
+                cost_model.record(target, **timings)
+            if self.progress:
+                self.progress.finish(target.name)
+            targets_done += 1
+            self.report_progress(targets_done, targets_total)
+        
+        self.scheduler = TargetScheduler(self.config.split_workers, self.config.push_workers, self.logger,
+                                         fail_fast=self.config.failure_policy == 'fail-fast', cancel=self.cancel)
+        try:
+            errors = self.scheduler.run(targets, on_done, on_start)
+        finally:
+            self.scheduler = None
+            if cost_model:
+                cost_model.save()
+        
+        for name, error in errors.items():
+            self.failed_targets[name] = str(error)
+            if self.progress:
+                self.progress.finish(name, failed=True)
+        if errors:
+            targets_done += len(errors)
+            self.report_progress(targets_done, targets_total)
+        return targets_done
+    
+    def start_target_logs(self):
+        """Open the per-target logs of this run in a directory of its own under log_dir."""
+        if not self.config.log_dir:
+            return
+        # The process id keeps service jobs that start in the same second apart
+        run_name = f"{datetime.now().strftime('%Y%m%d-%H%M%S')}-{os.getpid()}"
+        run_dir = os.path.join(self.working_dir, self.config.log_dir, run_name)
+        # Records of the other modules reach the root logger; a job logger of the service does not propagate
+        loggers = [logging.getLogger()]
+        if not self.logger.propagate:
+            loggers.append(self.logger)
+        self.target_logs = TargetLogs(loggers, run_dir)
+        self.target_logs.start()
+        self.logger.info(f"Per-target logs: {run_dir}")
+    
+    def start_progress(self):
+        """Aggregate git progress of the run into a status line and a JSON feed."""
+        if not self.config.progress_file and not self.config.progress_interval:
+            return
+        feed_path = os.path.join(self.working_dir, self.config.progress_file) if self.config.progress_file else ''
+        self.progress = ProgressTracker(feed_path, self.config.progress_interval, self.logger)
+        self.progress.start_reporting()
+    
+    def start_metrics(self, mode: Optional[str] = None):
+        """Label the metrics with the run and serve them on metrics_port if one is set."""
+        # Credentials in the source URL must not end up in the labels
+        source = re.sub(r'//[^/@]+@', '//', self.config.source_repo_url)
+        self.metrics.constant_labels.update(source=source, mode=mode or self.config.mode)
+        self.metrics.set('split_run_start_timestamp_seconds', time.time())
+        if self.config.metrics_port and not self.metrics_server:
+            self.metrics_server = MetricsServer(self.metrics, self.config.metrics_port)
+            self.metrics_server.start()
+            self.logger.info(f"Serving metrics at {self.metrics_server.url}")
+    
+    def flush_metrics(self):
+        """Update the run duration and rewrite the metrics textfile."""
+        started = self.metrics.get('split_run_start_timestamp_seconds')
+        if started is None:
+            return
+        self.metrics.set('split_run_duration_seconds', time.time() - started)
+        if not self.config.metrics_file:
+            return
+        try:
+            self.metrics.write(os.path.join(self.working_dir, self.config.metrics_file))
+        except OSError as e:
+            self.logger.warning(f"Could not write metrics to {self.config.metrics_file}: {e}")
+    
+    def stop_metrics(self):
+        """Write the final metrics of the run and stop serving them."""
+        if self.metrics.get('split_run_success') is None:
+            # The run raised before its summary
+            self.metrics.set('split_run_success', 0)
+        self.flush_metrics()
+        if self.metrics_server:
+            self.metrics_server.stop()
+            self.metrics_server = None
+    
     def split_repositories(self):
         """Main method to split the monorepo into multiple repositories."""
         try:
-            # Load configuration
-            self.config = self.load_config()
+            # Load configuration from the environment unless one was provided
+            if not self.config.source_repo_url:
+                self.config = self.load_config()
+                if not self.transforms.active:
+                    self.transforms = self.configured_transforms(self.logger)
+            
+            self.start_target_logs()
+            self.start_progress()
+            self.start_metrics()
             
             # Clone source repository
+            clone_start = time.monotonic()
             self.clone_source_repo()
+            self.metrics.set('split_phase_seconds', time.monotonic() - clone_start, target='source', phase='clone')
+            self.flush_metrics()
+            self.resolve_targets(self.source_repo_path)
+            if self.progress and not self.config.dry_run:
+                count = self.run_git_command(['git', 'rev-list', '--count', '--all'], cwd=self.source_repo_path)
+                self.progress.source_commits = int(count.stdout.strip() or 0)
+            
+            if self.config.commit_index and not self.config.dry_run:
+                self.commit_index = CommitIndex(os.path.join(self.working_dir, self.config.commit_index))
+                self.index_run_id = self.commit_index.start_run(self.config.source_repo_url, self.config.mode)
+                self.logger.info(f"Recording commit maps as run {self.index_run_id} in {self.config.commit_index}")
+            self.defer_publishing = self.config.rewrite_cross_refs and self.commit_index is not None
+            if self.config.lfs and not self.config.dry_run:
+                self.setup_lfs()
             
             # Analyze common files (optional AI extension)
             self.analyze_common_files()
             
-            if self.config.mode == 'branch':
-                # Process each branch
-                for branch in self.config.branches:
-                    repo_name = f"{branch}-app"
-                    description = f"Application extracted from {branch} branch of monorepo"
-                    
-                    self.logger.info(f"Processing branch: {branch}")
-                    
-                    # Create GitHub repository
-                    repo_url = self.create_github_repo(repo_name, description)
-                    if repo_url:
-                        # Extract branch to new repository
-                        self.extract_branch_to_repo(branch, repo_name, repo_url)
-                        self.logger.info(f"Repository URL: {repo_url}")
-                    else:
-                        self.logger.error(f"Failed to create repository for branch: {branch}")
-            
-            else:  # project mode
-                # Process each project
-                for project in self.config.projects:
-                    repo_name = f"{project}-app"
-                    description = f"Application extracted from {project} project of monorepo"
-                    
-                    self.logger.info(f"Processing project: {project}")
-                    
-                    # Create GitHub repository
-                    repo_url = self.create_github_repo(repo_name, description)
-                    if repo_url:
-                        # Extract project to new repository
-                        self.extract_project_to_repo(project, repo_name, repo_url)
-                        self.logger.info(f"Repository URL: {repo_url}")
-                    else:
-                        self.logger.error(f"Failed to create repository for project: {project}")
-            
-            # Process common libraries
-            if self.config.common_path:
-                repo_name = "common-libs"
-                description = f"Common libraries extracted from {self.config.common_path}"
-                
-                self.logger.info(f"Processing common libraries from: {self.config.common_path}")
-                
-                # Create GitHub repository
-                repo_url = self.create_github_repo(repo_name, description)
-                if repo_url:
-                    # Extract common libraries
-                    self.extract_common_libs(repo_name, repo_url)
-                    self.logger.info(f"Common libraries repository URL: {repo_url}")
-                else:
-                    self.logger.error("Failed to create common libraries repository")
+            targets = self.split_targets(include_common=True)
+            targets_total = len(targets)
+            targets_done = 0
+            
+            # Submodule wiring pins project commits to common-libs commits, so common-libs goes first
+            if self.config.wire_submodule and self.config.mode == 'project':
+                common_targets = [target for target in targets if target.name == "common-libs"]
+                targets = [target for target in targets if target.name != "common-libs"]
+                targets_done = self.run_targets(common_targets, targets_done, targets_total)
+            
+            targets_done = self.run_targets(targets, targets_done, targets_total)
+            
+            if self.defer_publishing:
+                self.rewrite_cross_references()
+                self.publish_deferred()
+            
+            # Write bundles for all targets at once, after the rewrites are done
+            bundles = self.export_bundles()
             
             # Summary
             self.logger.info("=" * 50)
@@ -468,12 +1612,216 @@ class RepoSplitter:
             for repo in self.created_repos:
                 self.logger.info(f"  - {repo}")
             
+            if bundles:
+                self.logger.info(f"Wrote {len(bundles)} bundles to {self.config.bundle_dir}:")
+                for bundle in bundles:
+                    self.logger.info(f"  - {bundle['bundle']}: {format_size(bundle['size'])} sha256={bundle['sha256']}")
+            
+            if self.push_stats:
+                total_seconds = sum(stats['seconds'] for stats in self.push_stats.values())
+                total_bytes = sum(stats['bytes'] for stats in self.push_stats.values())
+                self.logger.info(f"Pushed {len(self.push_stats)} repositories: "
+                                 f"{format_size(total_bytes)} in {total_seconds:.1f}s")
+                for repo, stats in self.push_stats.items():
+                    self.logger.info(f"  - {repo}: {stats['refs']} refs, {format_size(stats['bytes'])} "
+                                     f"in {stats['seconds']:.1f}s")
+            
+            if self.lfs:
+                self.logger.info(f"LFS: fetched {self.lfs.stats['fetched']} objects "
+                                 f"({format_size(self.lfs.stats['fetched_bytes'])}), "
+                                 f"uploaded {self.lfs.stats['uploaded']}")
+            
+            if self._github_metadata:
+                self.logger.info(self._github_metadata.summary())
+            
             if self.config.dry_run:
                 self.logger.info("This was a dry run - no actual changes were made")
             
+            self.metrics.set('split_run_success', 0 if self.failed_targets else 1)
+            if self.failed_targets:
+                self.logger.error(f"{len(self.failed_targets)} of {targets_total} targets failed:")
+                for repo, error in self.failed_targets.items():
+                    self.logger.error(f"  - {repo}: {error}")
+                raise RuntimeError(f"{len(self.failed_targets)} of {targets_total} targets failed: "
+                                   f"{', '.join(self.failed_targets)}")
+            
         except Exception as e:
             self.logger.error(f"Error during repository splitting: {e}")
             raise
+        finally:
+            self.stop_metrics()
+            if self.progress:
+                self.progress.stop_reporting()
+                self.progress = None
+            if self.target_logs:
+                self.target_logs.stop()
+                self.target_logs = None
+    
+    def sync_targets(self) -> List[Tuple[str, str, str]]:
+        """Return the (repository, monorepo branch, path) of every target; '' is the monorepo's default branch."""
+        if self.config.mode == 'branch':
+            targets = [(f"{branch}-app", branch, '') for branch in self.config.branches]
+        else:
+            targets = [(f"{project}-app", '', project.strip('/')) for project in self.config.projects]
+        if self.config.common_path:
+            targets.append(("common-libs", '', self.config.common_path.strip('/')))
+        return targets
+    
+    def target_clone_url(self, repo_name: str) -> str:
+        """Return the clone URL of an existing target repository."""
+        try:
+            repo = self.github_metadata.repo(self.config.org, repo_name)
+        finally:
+            self.record_rate_limit()
+        if repo is None:
+            raise GitHubApiError(f"Repository {self.config.org}/{repo_name} does not exist")
+        return repo['clone_url']
+    
+    def open_sync_cache(self) -> str:
+        """Clone the monorepo into the sync cache once, bring it up to date and return its path."""
+        cache_path = os.path.join(self.working_dir, self.config.sync_cache)
+        if os.path.exists(os.path.join(cache_path, 'HEAD')):
+            self.logger.info(f"Updating sync cache: {cache_path}")
+            self.run_git_command(['git', 'fetch', '--progress', '--prune', 'origin', '+refs/heads/*:refs/heads/*'],
+                                 cwd=cache_path, phase='clone')
+        else:
+            self.logger.info(f"Cloning source repository into sync cache: {cache_path}")
+            self.run_git_command(['git', 'clone', '--bare', '--progress', self.config.source_repo_url, cache_path],
+                                 phase='clone')
+        return cache_path
+    
+    def fetch_sync_target(self, cache_path: str, repo_name: str) -> str:
+        """Fetch the main branch of a target into refs/sync/<target> of the cache and return its commit."""
+        repo_url = self.target_clone_url(repo_name)
+        # Forced, since a target may have been force-updated since the last sync
+        self.run_git_command(['git', 'fetch', '--progress', repo_url, f'+refs/heads/main:refs/sync/{repo_name}'],
+                             cwd=cache_path, phase='clone')
+        result = self.run_git_command(['git', 'rev-parse', f'refs/sync/{repo_name}'], cwd=cache_path)
+        return result.stdout.strip()
+    
+    def sync_repositories(self):
+        """Replay the commits made in the split repositories since the last sync onto the monorepo.
+        
+        Targets are replayed one after another onto the branch tip, each onto the
+        result of the previous one, and every branch is pushed once, without force:
+        if the monorepo moved in the meantime the push is rejected and the next
+        sync starts over from the new tip.
+        """
+        try:
+            if not self.config.source_repo_url:
+                self.config = self.load_config()
+            if not self.config.commit_index:
+                raise ValueError("Reverse sync needs COMMIT_INDEX, where the split recorded its commit maps")
+            
+            self.start_target_logs()
+            self.start_metrics(mode='sync')
+            self.commit_index = CommitIndex(os.path.join(self.working_dir, self.config.commit_index))
+            
+            fetch_start = time.monotonic()
+            cache_path = self.open_sync_cache()
+            self.resolve_targets(cache_path)
+            targets = self.sync_targets()
+            tips = {}
+            with ThreadPoolExecutor(max_workers=max(self.config.push_workers, 1)) as executor:
+                futures = {executor.submit(run_in_target, repo_name, self.fetch_sync_target, cache_path, repo_name): repo_name
+                           for repo_name, _, _ in targets}
+                for future in as_completed(futures):
+                    try:
+                        tips[futures[future]] = future.result()
+                    except (GitHubApiError, subprocess.CalledProcessError, subprocess.TimeoutExpired) as e:
+                        self.target_failed(futures[future], e)
+            self.metrics.set('split_phase_seconds', time.monotonic() - fetch_start, target='source', phase='clone')
+            self.flush_metrics()
+            
+            default_branch = self.run_git_command(['git', 'symbolic-ref', '--short', 'HEAD'], cwd=cache_path).stdout.strip()
+            wired = None
+            if self.config.wire_submodule and self.config.common_path:
+                wired = self.config.common_subdir or os.path.basename(self.config.common_path.strip('/'))
+            sync = ReverseSync(cache_path, self.logger)
+            heads: Dict[str, List[str]] = {}  # branch -> [tip before the sync, tip after it]
+            results: Dict[str, List[SyncResult]] = {}
+            targets_done = 0
+            for repo_name, branch, prefix in targets:
+                if repo_name not in tips:
+                    continue
+                branch = branch or default_branch
+                if branch not in heads:
+                    tip = self.run_git_command(['git', 'rev-parse', f'refs/heads/{branch}'], cwd=cache_path).stdout.strip()
+                    heads[branch] = [tip, tip]
+                # The split added the submodule to project targets only; it never goes back into the monorepo
+                ignore = [wired, '.gitmodules'] if wired and repo_name != "common-libs" else []
+                start = time.monotonic()
+                with target_context(repo_name):
+                    try:
+                        boundary = self.commit_index.sync_boundary(self.config.source_repo_url, repo_name)
+                        result = sync.replay(repo_name, tips[repo_name], boundary, heads[branch][1], prefix, ignore)
+                    except (SyncConflict, ValueError, subprocess.CalledProcessError) as e:
+                        self.target_failed(repo_name, e)
+                        targets_done += 1
+                        self.report_progress(targets_done, len(targets))
+                        continue
+                heads[branch][1] = result.tip
+                results.setdefault(branch, []).append(result)
+                self.metrics.set('split_phase_seconds', time.monotonic() - start, target=repo_name, phase='rewrite')
+                self.metrics.inc('split_commits_synced_total', len(result.commit_map), target=repo_name)
+                targets_done += 1
+                self.report_progress(targets_done, len(targets))
+            
+            if not self.config.dry_run:
+                sync.write()
+            run_id = None
+            for branch, (old_tip, new_tip) in heads.items():
+                synced = [result for result in results.get(branch, []) if result.target_tip]
+                if self.config.dry_run:
+                    if new_tip != old_tip:
+                        self.logger.info(f"[DRY RUN] Would push {branch}: {old_tip[:12]} -> {new_tip[:12]}")
+                    continue
+                if new_tip != old_tip:
+                    push_start = time.monotonic()
+                    push = self.run_git_command(['git', 'push', '--progress', 'origin', f'{new_tip}:refs/heads/{branch}'],
+                                                cwd=cache_path, phase='push')
+                    self.run_git_command(['git', 'update-ref', f'refs/heads/{branch}', new_tip, old_tip], cwd=cache_path)
+                    self.metrics.set('split_phase_seconds', time.monotonic() - push_start, target='source', phase='push')
+                    self.metrics.inc('split_pushed_bytes_total', parse_push_bytes(push.stderr), target='source')
+                if synced and run_id is None:
+                    run_id = self.commit_index.start_run(self.config.source_repo_url, 'sync')
+                # Only once the branch is pushed, so a rejected push is retried by the next sync
+                for result in synced:
+                    self.commit_index.record(run_id, result.target, result.commit_map)
+                    self.commit_index.record_sync(self.config.source_repo_url, result.target, result.target_tip, run_id)
+            
+            # Summary
+            self.logger.info("=" * 50)
+            self.logger.info("REVERSE SYNC COMPLETED")
+            self.logger.info("=" * 50)
+            for branch, (old_tip, new_tip) in heads.items():
+                replayed = sum(len(result.commit_map) for result in results.get(branch, []))
+                self.logger.info(f"{branch}: {replayed} commits replayed ({old_tip[:12]} -> {new_tip[:12]})")
+                for result in results.get(branch, []):
+                    self.logger.info(f"  - {result.target}: {len(result.commit_map)} commits")
+            if run_id:
+                self.logger.info(f"Recorded as run {run_id} in {self.config.commit_index}")
+            if self._github_metadata:
+                self.logger.info(self._github_metadata.summary())
+            if self.config.dry_run:
+                self.logger.info("This was a dry run - nothing was pushed or recorded")
+            
+            self.metrics.set('split_run_success', 0 if self.failed_targets else 1)
+            if self.failed_targets:
+                self.logger.error(f"{len(self.failed_targets)} of {len(targets)} targets were not synced:")
+                for repo, error in self.failed_targets.items():
+                    self.logger.error(f"  - {repo}: {error}")
+                raise RuntimeError(f"{len(self.failed_targets)} of {len(targets)} targets were not synced: "
+                                   f"{', '.join(self.failed_targets)}")
+            
+        except Exception as e:
+            self.logger.error(f"Error during reverse sync: {e}")
+            raise
+        finally:
+            self.stop_metrics()
+            if self.target_logs:
+                self.target_logs.stop()
+                self.target_logs = None
 
 
 def main():
@@ -482,7 +1830,60 @@ def main():
     parser.add_argument('--dry-run', action='store_true', help='Perform a dry run without making changes')
     parser.add_argument('--mode', choices=['branch', 'project'], default='branch', 
                        help='Splitting mode: branch (different branches) or project (same branch, different projects)')
+    parser.add_argument('--repack', action='store_true',
+                       help='Repack each output repository with bitmaps before pushing')
+    parser.add_argument('--output-mode', choices=['push', 'bundle'],
+                       help='Push to GitHub (default) or write one git bundle per target')
+    parser.add_argument('--bundle-dir', help='Directory for bundles and manifest.json in bundle mode')
+    parser.add_argument('--shards', type=int,
+                       help='Rewrite each project history in N parallel shards instead of with git filter-repo')
+    parser.add_argument('--verify-shards', action='store_true',
+                       help='Check that the sharded rewrite matches git filter-repo')
+    parser.add_argument('--since', help='Only keep history since this date, e.g. 2024-01-01')
+    parser.add_argument('--max-commits', type=int, help='Only keep the last N commits of history')
+    parser.add_argument('--composite', action='store_true',
+                       help='Include COMMON_PATH in every project repository (project mode)')
+    parser.add_argument('--common-subdir', help='Directory for COMMON_PATH inside composite repositories')
+    parser.add_argument('--rewrite-common-refs', action='store_true',
+                       help='Rewrite ../COMMON_PATH references in Makefile variables of composite repositories')
+    parser.add_argument('--common-closure', action='store_true',
+                       help='Keep only the COMMON_PATH files each composite project needs')
+    parser.add_argument('--wire-submodule', action='store_true',
+                       help='Pin common-libs as a submodule throughout the history of each project repository')
+    parser.add_argument('--commit-index', help='SQLite file that stores the commit maps of every run')
+    parser.add_argument('--refs-include', help='Comma-separated ref globs to publish (default: main)')
+    parser.add_argument('--refs-exclude', help='Comma-separated ref globs not to publish')
+    parser.add_argument('--rewrite-cross-refs', action='store_true',
+                       help='Rewrite monorepo SHAs in commit messages to the SHAs of the split repositories')
+    parser.add_argument('--clone-timeout', type=int, help='Seconds each git command may take while cloning the source')
+    parser.add_argument('--rewrite-timeout', type=int, help='Seconds each git command may take while rewriting a target')
+    parser.add_argument('--push-timeout', type=int, help='Seconds each git push may take')
+    parser.add_argument('--failure-policy', choices=FAILURE_POLICIES,
+                       help="'fail-fast' cancels the other targets on the first failure, 'continue' lets them finish")
+    parser.add_argument('--lfs', action='store_true',
+                       help='Fetch and upload the Git LFS objects each target references')
+    parser.add_argument('--github-api-url', help='GitHub API base URL, e.g. of GitHub Enterprise or local_remote.py')
+    parser.add_argument('--workers', type=int, help='Number of targets rewritten at the same time')
+    parser.add_argument('--push-workers', type=int, help='Number of pushes running at the same time')
+    parser.add_argument('--log-dir', help="Directory for the per-target logs of each run ('' disables them)")
+    parser.add_argument('--progress-file', help="JSON progress feed of the run ('' disables it)")
+    parser.add_argument('--progress-interval', type=int, help='Seconds between progress status lines (0 disables them)')
+    parser.add_argument('--metrics-file', help='Prometheus textfile to write the run metrics to')
+    parser.add_argument('--metrics-port', type=int, help='Serve the run metrics on this local port while it runs')
+    parser.add_argument('--sync', action='store_true',
+                       help='Replay new commits of the split repositories onto the monorepo instead of splitting')
+    parser.add_argument('--sync-cache', help='Monorepo clone that reverse syncs keep between runs')
+    parser.add_argument('--discover', action='store_true',
+                       help='Find the projects (or branches) in the mirror instead of reading PROJECTS (or BRANCHES)')
+    parser.add_argument('--target-manifest', help="Manifest of discovered targets to reuse ('' disables it)")
+    parser.add_argument('--transform-drop', help="Comma-separated globs of files to drop from every target's history")
+    parser.add_argument('--transform-eol', help='Comma-separated globs of files to normalize to LF line endings')
+    parser.add_argument('--transform-replace', help="File of '<glob> <regex>==><replacement>' content rules")
+    parser.add_argument('--doctor', action='store_true',
+                        help='Check the tools, configuration, GitHub token and source repository, then exit')
+    parser.add_argument('--refresh-preflight', action='store_true', help='Run every --doctor check, ignoring cached results')
     args = parser.parse_args()
+    signal.signal(signal.SIGTERM, raise_interrupt)
     
     try:
         # Load configuration from environment first
@@ -493,46 +1894,122 @@ def main():
         if os.getenv('MODE'):
             mode = os.getenv('MODE').lower()
         
-        if mode == 'branch':
-            branches = os.getenv('BRANCHES', '').split(',')
-            branches = [branch.strip() for branch in branches if branch.strip()]
-            config = RepoSplitterConfig(
-                source_repo_url=os.getenv('SOURCE_REPO_URL', ''),
-                mode=mode,
-                branches=branches,
-                common_path=os.getenv('COMMON_PATH'),
-                org=os.getenv('ORG', ''),
-                github_token=os.getenv('GITHUB_TOKEN', ''),
-                dry_run=args.dry_run
-            )
-        else:  # project mode
-            projects = os.getenv('PROJECTS', '').split(',')
-            projects = [project.strip() for project in projects if project.strip()]
-            config = RepoSplitterConfig(
-                source_repo_url=os.getenv('SOURCE_REPO_URL', ''),
-                mode=mode,
-                projects=projects,
-                common_path=os.getenv('COMMON_PATH'),
-                org=os.getenv('ORG', ''),
-                github_token=os.getenv('GITHUB_TOKEN', ''),
-                dry_run=args.dry_run
-            )
+        config = RepoSplitterConfig(
+            source_repo_url=os.getenv('SOURCE_REPO_URL', ''),
+            mode=mode,
+            org=os.getenv('ORG', ''),
+            github_token=os.getenv('GITHUB_TOKEN', ''),
+            dry_run=args.dry_run,
+            **load_target_options(mode),
+            **load_env_options()
+        )
+        
+        # Command line options take precedence over the environment
+        if args.repack:
+            config.repack = True
+        if args.output_mode:
+            config.output_mode = args.output_mode
+        if args.bundle_dir:
+            config.bundle_dir = args.bundle_dir
+        if args.shards is not None:
+            config.rewrite_shards = args.shards
+        if args.verify_shards:
+            config.verify_shards = True
+        if args.since:
+            config.since = args.since
+        if args.max_commits is not None:
+            config.max_commits = args.max_commits
+        if args.composite:
+            config.composite = True
+        if args.common_subdir:
+            config.common_subdir = args.common_subdir
+        if args.rewrite_common_refs:
+            config.rewrite_common_refs = True
+        if args.common_closure:
+            config.common_closure = True
+        if args.wire_submodule:
+            config.wire_submodule = True
+        if args.commit_index:
+            config.commit_index = args.commit_index
+        if args.refs_include:
+            config.refs_include = [pattern.strip() for pattern in args.refs_include.split(',') if pattern.strip()]
+        if args.refs_exclude:
+            config.refs_exclude = [pattern.strip() for pattern in args.refs_exclude.split(',') if pattern.strip()]
+        if args.rewrite_cross_refs:
+            config.rewrite_cross_refs = True
+        if args.clone_timeout is not None:
+            config.clone_timeout = args.clone_timeout
+        if args.rewrite_timeout is not None:
+            config.rewrite_timeout = args.rewrite_timeout
+        if args.push_timeout is not None:
+            config.push_timeout = args.push_timeout
+        if args.failure_policy:
+            config.failure_policy = args.failure_policy
+        if args.lfs:
+            config.lfs = True
+        if args.github_api_url:
+            config.github_api_url = args.github_api_url
+        if args.workers is not None:
+            config.split_workers = args.workers
+        if args.push_workers is not None:
+            config.push_workers = args.push_workers
+        if args.log_dir is not None:
+            config.log_dir = args.log_dir
+        if args.progress_file is not None:
+            config.progress_file = args.progress_file
+        if args.progress_interval is not None:
+            config.progress_interval = args.progress_interval
+        if args.metrics_file is not None:
+            config.metrics_file = args.metrics_file
+        if args.metrics_port is not None:
+            config.metrics_port = args.metrics_port
+        if args.sync_cache:
+            config.sync_cache = args.sync_cache
+        if args.discover:
+            config.discover = True
+        if args.target_manifest is not None:
+            config.target_manifest = args.target_manifest
+        if args.transform_drop:
+            config.transform_drop = parse_names(args.transform_drop)
+        if args.transform_eol:
+            config.transform_eol = parse_names(args.transform_eol)
+        if args.transform_replace:
+            config.transform_replace = args.transform_replace
+        
+        if args.doctor:
+            settings = PreflightSettings(config.source_repo_url, mode,
+                                         None if config.discover else (config.branches if mode == 'branch' else config.projects),
+                                         config.org, config.github_token, config.github_api_url, config.output_mode,
+                                         config.github_cache)
+            healthy = doctor(settings, config.preflight_cache, config.preflight_ttl, args.refresh_preflight)
+            sys.exit(0 if healthy else 1)
         
         # Validate required fields
         if not config.source_repo_url:
             raise ValueError("SOURCE_REPO_URL is required")
-        if not config.org:
+        if config.output_mode == 'push' and not config.org:
             raise ValueError("ORG is required")
-        if not config.github_token:
+        if config.output_mode == 'push' and not config.github_token:
             raise ValueError("GITHUB_TOKEN is required")
         
-        if mode == 'branch' and not config.branches:
-            raise ValueError("BRANCHES is required for branch mode")
-        elif mode == 'project' and not config.projects:
-            raise ValueError("PROJECTS is required for project mode")
+        if mode == 'branch' and not config.branches and not config.discover:
+            raise ValueError("BRANCHES is required for branch mode (or --discover)")
+        elif mode == 'project' and not config.projects and not config.discover:
+            raise ValueError("PROJECTS is required for project mode (or --discover)")
+        if config.wire_submodule and config.composite:
+            raise ValueError("--wire-submodule and --composite cannot be combined")
+        if config.rewrite_cross_refs and not config.commit_index:
+            raise ValueError("--rewrite-cross-refs needs a commit index")
+        if args.sync and config.output_mode != 'push':
+            raise ValueError("--sync brings back pushed repositories and needs OUTPUT_MODE=push")
+        if args.sync and not config.commit_index:
+            raise ValueError("--sync needs the commit index of the split")
         
         with RepoSplitter(config) as splitter:
-            splitter.split_repositories()
+            if args.sync:
+                splitter.sync_repositories()
+            else:
+                splitter.split_repositories()
             
     except KeyboardInterrupt:
         print("\nOperation cancelled by user")
@@ -0,0 +1,330 @@
+#!/usr/bin/env python3
+"""
+Split Target Scheduler
+
+Runs the targets of a split concurrently so that the biggest one does not
+start last. Each target's cost is estimated from cheap statistics of the
+mirror (commits touching its paths and the size of its blobs at the ref),
+scaled by what the same target took in earlier runs when a history file has
+it. A target whose ref the mirror cannot resolve is logged and gets a
+default estimate: its own timing from the history, or the mean of the
+measured targets. Targets then start longest-first on a pool of CPU slots
+for the rewrites, while their pushes run on a separate network pool, so a
+slow upload never holds a rewrite slot.
+
+Usage:
+    python split_scheduler.py MIRROR --project fractol --project pushswap [--common libft]
+                                     [--history split_history.json]
+
+Prints the estimated cost of each target in the order it would be scheduled.
+"""
+
+import os
+import sys
+import json
+import time
+import logging
+import argparse
+import subprocess
+import threading
+from dataclasses import dataclass, field
+from concurrent.futures import ThreadPoolExecutor, Future, CancelledError, wait, FIRST_COMPLETED
+from typing import List, Dict, Set, Optional, Callable, Tuple
+
+from git_runner import TargetCancelled
+from history_rewrite import git
+from shared_files import locked, replace_json
+from split_logging import target_context
+
+
+DEFAULT_HISTORY_PATH = 'split_history.json'
+
+# Used until a target has timings of its own in the history file
+SECONDS_PER_COMMIT = 0.005
+SECONDS_PER_BYTE = 2e-8
+
+
+@dataclass
+class SplitTarget:
+    """One repository to produce: its source ref and paths, and the work that produces it."""
+    name: str
+    run: Callable[[], None]
+    ref: str = 'HEAD'
+    paths: List[str] = field(default_factory=list)  # empty means the whole tree
+    commits: int = 0
+    blob_bytes: int = 0
+    cost: float = 0.0
+
+
+class CostModel:
+    """Estimate target costs from mirror statistics and the timings of earlier runs."""
+
+    def __init__(self, repo_path: str, history_path: str, source_repo_url: str,
+                 logger: Optional[logging.Logger] = None):
+        self.repo_path = repo_path
+        self.history_path = history_path
+        self.source_repo_url = source_repo_url
+        self.logger = logger or logging.getLogger(__name__)
+        self.history = self.load_history()
+        self.recorded: Set[Tuple[str, str]] = set()
+        self.unmeasured: Set[str] = set()  # targets whose ref could not be read
+        self.lock = threading.Lock()
+
+    def load_history(self) -> Dict[str, Dict[str, Dict[str, float]]]:
+        """Read the history file; a missing or unreadable file means no history."""
+        if not self.history_path or not os.path.exists(self.history_path):
+            return {}
+        try:
+            with open(self.history_path) as f:
+                return json.load(f)
+        except (OSError, ValueError) as e:
+            self.logger.warning(f"Ignoring unreadable history file {self.history_path}: {e}")
+            return {}
+
+    def measure(self, target: SplitTarget):
+        """Fill in the commit count and blob bytes of a target from the mirror.
+
+        A ref the mirror cannot resolve, e.g. a branch missing from it, leaves
+        the target unmeasured; the target fails later, when it runs.
+        """
+        paths = [path.strip('/') for path in target.paths]
+        try:
+            count = git(self.repo_path, ['rev-list', '--count', target.ref, '--', *paths])
+            listing = git(self.repo_path, ['ls-tree', '-r', '-l', target.ref, '--', *[f'{path}/' for path in paths]])
+        except subprocess.CalledProcessError as e:
+            error = e.stderr.decode(errors='replace').strip() if e.stderr else str(e)
+            self.logger.warning(f"Cannot measure '{target.name}' at {target.ref}, using a default estimate: {error}")
+            with self.lock:
+                self.unmeasured.add(target.name)
+            return
+
+        target.commits = int(count.decode().strip() or 0)
+        target.blob_bytes = sum(
+            int(line.split(None, 4)[3]) for line in listing.decode().splitlines()
+            if line.split(None, 4)[3] != '-'  # submodules have no size
+        )
+
+    def estimate(self, target: SplitTarget, default: float = 0.0) -> float:
+        """Return the estimated seconds a target takes, rewrite and push together.
+
+        An unmeasured target gets its last recorded time, or default.
+        """
+        previous = self.history.get(self.source_repo_url, {}).get(target.name)
+        if target.name in self.unmeasured:
+            return previous.get('rewrite_seconds', 0) + previous.get('push_seconds', 0) if previous else default
+        if previous and previous.get('commits'):
+            seconds = previous.get('rewrite_seconds', 0) + previous.get('push_seconds', 0)
+            return seconds * max(target.commits, 1) / previous['commits']
+        return target.commits * SECONDS_PER_COMMIT + target.blob_bytes * SECONDS_PER_BYTE
+
+    def estimate_all(self, targets: List[SplitTarget]):
+        """Measure and estimate every target, reading the mirror in parallel."""
+        with ThreadPoolExecutor(max_workers=min(len(targets), os.cpu_count() or 1) or 1) as executor:
+            list(executor.map(self.measure, targets))
+        measured = [target for target in targets if target.name not in self.unmeasured]
+        for target in measured:
+            target.cost = self.estimate(target)
+        default = sum(target.cost for target in measured) / len(measured) if measured else 0.0
+        for target in targets:
+            if target.name in self.unmeasured:
+                target.cost = self.estimate(target, default)
+
+    def record(self, target: SplitTarget, rewrite_seconds: float, push_seconds: float):
+        """Remember how long a target took for the next run's estimates."""
+        with self.lock:
+            self.history.setdefault(self.source_repo_url, {})[target.name] = {
+                'commits': target.commits,
+                'blob_bytes': target.blob_bytes,
+                'rewrite_seconds': round(rewrite_seconds, 3),
+                'push_seconds': round(push_seconds, 3),
+                'recorded_at': time.time(),
+            }
+            self.recorded.add((self.source_repo_url, target.name))
+
+    def save(self):
+        """Merge the timings recorded by this run into the history file and replace it atomically."""
+        if not self.history_path:
+            return
+        # Split service jobs share the file; reread it so their timings are kept
+        with self.lock, locked(self.history_path):
+            history = self.load_history()
+            for source, name in self.recorded:
+                history.setdefault(source, {})[name] = self.history[source][name]
+            replace_json(self.history_path, history)
+
+
+class TargetScheduler:
+    """Run targets longest-first on CPU slots, with their pushes on a separate network pool.
+
+    With fail_fast, the first failure stops targets that have not started and
+    calls cancel() so running ones can stop too; otherwise the other targets
+    carry on and the failures are returned.
+    """
+
+    def __init__(self, cpu_workers: int, network_workers: int, logger: Optional[logging.Logger] = None,
+                 fail_fast: bool = True, cancel: Optional[Callable[[str], None]] = None):
+        self.cpu_workers = max(cpu_workers, 1)
+        self.network_workers = max(network_workers, 1)
+        self.logger = logger or logging.getLogger(__name__)
+        self.fail_fast = fail_fast
+        self.cancel = cancel
+        self.network: Optional[ThreadPoolExecutor] = None
+        self.local = threading.local()
+        self.lock = threading.Lock()
+        self.stopping = threading.Event()
+        self.futures: List[Future] = []
+        self.network_futures: Dict[str, List[Future]] = {}
+        self.rewrite_seconds: Dict[str, float] = {}
+        self.push_seconds: Dict[str, float] = {}
+
+    def active(self) -> bool:
+        """Return True while called from a target running under this scheduler."""
+        return self.network is not None and getattr(self.local, 'target', None) is not None
+
+    def submit_network(self, function: Callable, *args) -> Future:
+        """Queue network work (a push) of the target running in this thread on the network pool."""
+        name = self.local.target
+
+        def timed():
+            if self.stopping.is_set():
+                raise TargetCancelled()
+            start = time.monotonic()
+            try:
+                with target_context(name):
+                    return function(*args)
+            finally:
+                with self.lock:
+                    self.push_seconds[name] = self.push_seconds.get(name, 0.0) + time.monotonic() - start
+
+        future = self.network.submit(timed)
+        with self.lock:
+            self.network_futures.setdefault(name, []).append(future)
+            self.futures.append(future)
+        return future
+
+    def run_target(self, target: SplitTarget, on_start: Optional[Callable[[SplitTarget], None]] = None):
+        """Run the CPU part of one target in a worker thread."""
+        if self.stopping.is_set():
+            # A worker can pick the next target up before the failure reaches run()
+            raise TargetCancelled()
+        if on_start:
+            on_start(target)
+        self.local.target = target.name
+        start = time.monotonic()
+        try:
+            with target_context(target.name):
+                target.run()
+        except BaseException:
+            if self.fail_fast:
+                self.stopping.set()
+            raise
+        finally:
+            self.rewrite_seconds[target.name] = time.monotonic() - start
+            self.local.target = None
+
+    def stop(self, reason: str):
+        """Drop queued work and ask running targets to cancel."""
+        self.stopping.set()
+        with self.lock:
+            for future in self.futures:
+                future.cancel()
+        if self.cancel:
+            self.cancel(reason)
+
+    def run(self, targets: List[SplitTarget], on_done: Optional[Callable[[SplitTarget], None]] = None,
+            on_start: Optional[Callable[[SplitTarget], None]] = None) -> Dict[str, BaseException]:
+        """Run all targets; on_done is called once a target's rewrite and pushes have finished.
+
+        on_start is called in the worker thread as a target's rewrite begins.
+
+        Returns the error of every failed target. With fail_fast the first error
+        is raised instead, once the running targets have stopped.
+        """
+        ordered = sorted(targets, key=lambda target: target.cost, reverse=True)
+        self.logger.info("Schedule (longest first): " + ", ".join(
+            f"{target.name} ~{target.cost:.1f}s" for target in ordered
+        ))
+
+        errors: Dict[str, BaseException] = {}
+        with ThreadPoolExecutor(max_workers=self.network_workers, thread_name_prefix='push') as network, \
+                ThreadPoolExecutor(max_workers=self.cpu_workers, thread_name_prefix='rewrite') as cpu:
+            self.network = network
+            rewrites = {cpu.submit(self.run_target, target, on_start): target for target in ordered}
+            self.futures.extend(rewrites)
+            owners = dict(rewrites)
+            outstanding = {target.name: 1 for target in ordered}
+            pending = set(owners)
+
+            try:
+                while pending:
+                    done, pending = wait(pending, return_when=FIRST_COMPLETED)
+                    for future in done:
+                        target = owners[future]
+                        if future.cancelled() or isinstance(future.exception(), CancelledError):
+                            continue
+                        if future.exception():
+                            if target.name not in errors:
+                                errors[target.name] = future.exception()
+                                self.logger.error(f"Target '{target.name}' failed: {future.exception()}")
+                            if self.fail_fast and len(errors) == 1:
+                                self.stop(f"target '{target.name}' failed")
+
+                        outstanding[target.name] -= 1
+                        if future in rewrites:
+                            # The rewrite is done, so all of its pushes have been queued
+                            for push in self.network_futures.get(target.name, []):
+                                owners[push] = target
+                                pending.add(push)
+                                outstanding[target.name] += 1
+                        if outstanding[target.name] == 0 and target.name not in errors and on_done:
+                            on_done(target)
+            except BaseException:
+                # Ctrl-C: stop everything before the pools wait for their threads
+                self.stop('interrupted')
+                raise
+            finally:
+                self.network = None
+
+        if errors and self.fail_fast:
+            raise next(iter(errors.values()))
+        return errors
+
+    def timings(self, target: SplitTarget) -> Dict[str, float]:
+        """Return how long a target spent rewriting and pushing."""
+        return {
+            'rewrite_seconds': self.rewrite_seconds.get(target.name, 0.0),
+            'push_seconds': self.push_seconds.get(target.name, 0.0),
+        }
+
+
+def main():
+    """Main entry point."""
+    parser = argparse.ArgumentParser(description="Show the estimated cost and schedule order of split targets")
+    parser.add_argument('repo', help='Path of the mirror')
+    parser.add_argument('--project', action='append', default=[], help='Project directory (repeatable)')
+    parser.add_argument('--common', help='Common library path, estimated as common-libs')
+    parser.add_argument('--branch', action='append', default=[], help='Branch (repeatable, branch mode)')
+    parser.add_argument('--history', default=DEFAULT_HISTORY_PATH, help='History file of earlier runs')
+    parser.add_argument('--source-url', default='', help='Source URL the history is keyed by')
+    args = parser.parse_args()
+
+    targets = [SplitTarget(f'{project}-app', run=lambda: None, paths=[project]) for project in args.project]
+    targets += [SplitTarget(f'{branch}-app', run=lambda: None, ref=f'refs/heads/{branch}') for branch in args.branch]
+    if args.common:
+        targets.append(SplitTarget('common-libs', run=lambda: None, paths=[args.common]))
+    if not targets:
+        parser.error("give at least one --project, --branch or --common")
+
+    model = CostModel(args.repo, args.history, args.source_url)
+    try:
+        model.estimate_all(targets)
+    except subprocess.CalledProcessError as e:
+        print(f"Error: {e.stderr.decode().strip()}")
+        sys.exit(1)
+
+    for target in sorted(targets, key=lambda target: target.cost, reverse=True):
+        print(f"{target.name:<24} {target.commits:>7} commits {target.blob_bytes:>12} bytes  ~{target.cost:.2f}s")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,418 @@
+#!/usr/bin/env python3
+"""
+Split Job Queue Service
+
+Runs many monorepo splits on one machine. Jobs are stored in a local SQLite
+queue, each one carrying its own RepoSplitterConfig, and a pool of worker
+processes picks them up. Every job logs to its own file and reports progress
+back to the queue, so `status` can show an ETA per job.
+
+Usage:
+    python split_service.py submit job.json [--name NAME]
+    python split_service.py status [--json]
+    python split_service.py work [--workers 4] [--wait] [--job-dir job_files]
+
+A job file is a JSON object with RepoSplitterConfig fields. A github_token
+in it is never stored in the queue; the worker uses GITHUB_TOKEN from its
+own environment.
+
+Jobs run in the same working directory. Bundles and their manifest are the
+output of one run, so a job that leaves bundle_dir at its default writes
+them to job_files/job-<id>/bundles instead. The timing history, the GitHub
+metadata cache, the target manifest and the preflight cache stay shared, so
+every job learns from the others; their writes are merged under a lock. The
+commit index is a SQLite database and takes care of that itself.
+"""
+
+import os
+import sys
+import json
+import time
+import socket
+import sqlite3
+import logging
+import argparse
+import multiprocessing
+from contextlib import contextmanager
+from dataclasses import asdict, fields
+from typing import List, Dict, Optional
+
+from dotenv import load_dotenv
+
+from split_repo_agent import RepoSplitter, RepoSplitterConfig
+from split_logging import SharedFilter
+from split_progress import stage_summary
+
+
+DEFAULT_DB_PATH = 'split_jobs.db'
+DEFAULT_LOG_DIR = 'job_logs'
+DEFAULT_JOB_DIR = 'job_files'
+
+# Config fields of per-run output that would clash under the same default name, and what they are called per job
+JOB_FILES = {
+    'bundle_dir': 'bundles',
+}
+
+JOBS_SCHEMA = """
+CREATE TABLE IF NOT EXISTS jobs (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    name TEXT NOT NULL,
+    config TEXT NOT NULL,
+    status TEXT NOT NULL DEFAULT 'queued',
+    targets_done INTEGER NOT NULL DEFAULT 0,
+    targets_total INTEGER NOT NULL DEFAULT 0,
+    created_at REAL NOT NULL,
+    started_at REAL,
+    finished_at REAL,
+    worker TEXT,
+    pid INTEGER,
+    log_path TEXT,
+    error TEXT
+)
+"""
+
+
+class JobQueue:
+    """SQLite-backed queue of split jobs shared by the service and its workers."""
+
+    def __init__(self, db_path: str = DEFAULT_DB_PATH):
+        self.db_path = db_path
+        with self.connection() as conn:
+            conn.execute('PRAGMA journal_mode=WAL')
+            conn.execute(JOBS_SCHEMA)
+
+    @contextmanager
+    def connection(self):
+        """Open an autocommit connection; callers use BEGIN IMMEDIATE where they need atomicity."""
+        conn = sqlite3.connect(self.db_path, timeout=30, isolation_level=None)
+        conn.row_factory = sqlite3.Row
+        try:
+            yield conn
+        finally:
+            conn.close()
+
+    def submit(self, config: RepoSplitterConfig, name: str) -> int:
+        """Add a job to the queue and return its id; the GitHub token is left out."""
+        config_data = asdict(config)
+        config_data['github_token'] = ''
+        with self.connection() as conn:
+            cursor = conn.execute(
+                'INSERT INTO jobs (name, config, created_at) VALUES (?, ?, ?)',
+                (name, json.dumps(config_data), time.time())
+            )
+            return cursor.lastrowid
+
+    def claim(self, worker: str) -> Optional[sqlite3.Row]:
+        """Atomically mark the oldest queued job as running and return it."""
+        with self.connection() as conn:
+            conn.execute('BEGIN IMMEDIATE')
+            job = conn.execute(
+                "SELECT * FROM jobs WHERE status = 'queued' ORDER BY id LIMIT 1"
+            ).fetchone()
+            if job is None:
+                conn.execute('COMMIT')
+                return None
+            conn.execute(
+                "UPDATE jobs SET status = 'running', started_at = ?, worker = ?, pid = ? WHERE id = ?",
+                (time.time(), worker, os.getpid(), job['id'])
+            )
+            conn.execute('COMMIT')
+            return conn.execute('SELECT * FROM jobs WHERE id = ?', (job['id'],)).fetchone()
+
+    def set_log_path(self, job_id: int, log_path: str):
+        """Record where a job writes its log."""
+        with self.connection() as conn:
+            conn.execute('UPDATE jobs SET log_path = ? WHERE id = ?', (log_path, job_id))
+
+    def update_progress(self, job_id: int, targets_done: int, targets_total: int):
+        """Record how many of a job's targets have been processed."""
+        with self.connection() as conn:
+            conn.execute(
+                'UPDATE jobs SET targets_done = ?, targets_total = ? WHERE id = ?',
+                (targets_done, targets_total, job_id)
+            )
+
+    def finish(self, job_id: int, error: Optional[str] = None):
+        """Mark a job as succeeded, or failed with the given error."""
+        status = 'failed' if error else 'succeeded'
+        with self.connection() as conn:
+            conn.execute(
+                'UPDATE jobs SET status = ?, finished_at = ?, error = ? WHERE id = ?',
+                (status, time.time(), error, job_id)
+            )
+
+    def requeue_stale(self) -> int:
+        """Put running jobs whose worker process on this host has died back in the queue."""
+        hostname = socket.gethostname()
+        requeued = 0
+        with self.connection() as conn:
+            running = conn.execute("SELECT id, worker, pid FROM jobs WHERE status = 'running'").fetchall()
+            for job in running:
+                if not (job['worker'] or '').startswith(f"{hostname}:") or process_alive(job['pid']):
+                    continue
+                conn.execute(
+                    "UPDATE jobs SET status = 'queued', started_at = NULL, worker = NULL, pid = NULL, "
+                    "targets_done = 0 WHERE id = ?",
+                    (job['id'],)
+                )
+                requeued += 1
+        return requeued
+
+    def jobs(self) -> List[sqlite3.Row]:
+        """Return all jobs, oldest first."""
+        with self.connection() as conn:
+            return conn.execute('SELECT * FROM jobs ORDER BY id').fetchall()
+
+
+def process_alive(pid: Optional[int]) -> bool:
+    """Return True if a process with this pid exists."""
+    if not pid:
+        return False
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        return True
+    return True
+
+
+def progress_path(log_path: str) -> str:
+    """Return where a job writes its progress feed, next to its log."""
+    return os.path.splitext(log_path)[0] + '.progress.json'
+
+
+def read_progress(log_path: Optional[str]) -> Optional[Dict]:
+    """Read the progress feed of a job, if it has written one."""
+    if not log_path:
+        return None
+    try:
+        with open(progress_path(log_path)) as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return None
+
+
+def job_status(job: sqlite3.Row, average_duration: Optional[float], now: float) -> Dict:
+    """Build the status record for one job, including elapsed time and ETA in seconds."""
+    status = {
+        'id': job['id'],
+        'name': job['name'],
+        'status': job['status'],
+        'targets_done': job['targets_done'],
+        'targets_total': job['targets_total'],
+        'worker': job['worker'],
+        'log_path': job['log_path'],
+        'error': job['error'],
+        'elapsed': None,
+        'eta': None,
+        'stages': {},
+    }
+
+    if job['status'] == 'running':
+        elapsed = now - job['started_at']
+        status['elapsed'] = elapsed
+        progress = read_progress(job['log_path'])
+        if progress:
+            # What each running target's git commands are doing right now
+            status['stages'] = {name: target['stage'] for name, target in progress['targets'].items()
+                                if target['stage']}
+        if progress and progress['eta_seconds'] is not None:
+            status['eta'] = progress['eta_seconds']
+        elif job['targets_done']:
+            # Assume the remaining targets take as long as the finished ones on average
+            per_target = elapsed / job['targets_done']
+            status['eta'] = per_target * (job['targets_total'] - job['targets_done'])
+        elif average_duration is not None:
+            status['eta'] = max(average_duration - elapsed, 0)
+    elif job['status'] == 'queued':
+        status['eta'] = average_duration
+    elif job['finished_at'] and job['started_at']:
+        status['elapsed'] = job['finished_at'] - job['started_at']
+
+    return status
+
+
+def queue_status(queue: JobQueue) -> List[Dict]:
+    """Return the status of every job in the queue."""
+    jobs = queue.jobs()
+    durations = [
+        job['finished_at'] - job['started_at']
+        for job in jobs
+        if job['status'] == 'succeeded' and job['started_at']
+    ]
+    average_duration = sum(durations) / len(durations) if durations else None
+    now = time.time()
+    return [job_status(job, average_duration, now) for job in jobs]
+
+
+def job_logger(job_id: int, log_path: str) -> logging.Logger:
+    """Create a logger that writes only to this job's log file."""
+    logger = logging.getLogger(f"split_service.job.{job_id}")
+    logger.setLevel(logging.INFO)
+    logger.propagate = False
+    handler = logging.FileHandler(log_path)
+    handler.setFormatter(logging.Formatter('%(asctime)s - %(levelname)s - %(message)s'))
+    # Git stderr goes to the per-target logs of the run, not the job log
+    handler.addFilter(SharedFilter())
+    logger.addHandler(handler)
+    return logger
+
+
+def isolate_job_files(config: RepoSplitterConfig, job_dir: str):
+    """Point the per-run output a job left at its default into its own directory, so concurrent jobs keep it apart."""
+    defaults = {field.name: field.default for field in fields(RepoSplitterConfig)}
+    for name, file_name in JOB_FILES.items():
+        if getattr(config, name) == defaults[name]:
+            setattr(config, name, os.path.join(job_dir, file_name))
+
+
+def run_job(queue: JobQueue, job: sqlite3.Row, log_dir: str, job_dir: str):
+    """Run one claimed job to completion and record the outcome."""
+    job_id = job['id']
+    log_path = os.path.abspath(os.path.join(log_dir, f"job-{job_id}.log"))
+    queue.set_log_path(job_id, log_path)
+    logger = job_logger(job_id, log_path)
+
+    try:
+        config_data = json.loads(job['config'])
+        config_data['github_token'] = os.getenv('GITHUB_TOKEN', '')
+        config = RepoSplitterConfig(**config_data)
+        # Jobs share a working directory; each writes its own progress feed for `status`
+        config.progress_file = progress_path(log_path)
+        job_files = os.path.abspath(os.path.join(job_dir, f"job-{job_id}"))
+        os.makedirs(job_files, exist_ok=True)
+        isolate_job_files(config, job_files)
+
+        with RepoSplitter(config, logger=logger) as splitter:
+            splitter.progress_callback = lambda done, total: queue.update_progress(job_id, done, total)
+            splitter.split_repositories()
+
+        queue.finish(job_id)
+    except Exception as e:
+        logger.exception(f"Job {job_id} failed")
+        queue.finish(job_id, error=str(e))
+    finally:
+        for handler in list(logger.handlers):
+            handler.close()
+            logger.removeHandler(handler)
+
+
+def worker_loop(db_path: str, log_dir: str, job_dir: str, wait: bool, poll_interval: float):
+    """Claim and run jobs until the queue is empty, or forever when wait is set."""
+    load_dotenv()
+    queue = JobQueue(db_path)
+    worker = f"{socket.gethostname()}:{os.getpid()}"
+
+    while True:
+        job = queue.claim(worker)
+        if job is None:
+            if not wait:
+                return
+            time.sleep(poll_interval)
+            continue
+        run_job(queue, job, log_dir, job_dir)
+
+
+def run_workers(db_path: str, log_dir: str, workers: int, wait: bool, poll_interval: float = 5.0,
+                job_dir: str = DEFAULT_JOB_DIR):
+    """Start a pool of worker processes and wait for them to finish."""
+    os.makedirs(log_dir, exist_ok=True)
+    queue = JobQueue(db_path)
+    requeued = queue.requeue_stale()
+    if requeued:
+        print(f"Requeued {requeued} jobs left running by dead workers")
+
+    # Separate processes keep each job's temp dirs, logging and environment apart
+    processes = [
+        multiprocessing.Process(target=worker_loop, args=(db_path, log_dir, job_dir, wait, poll_interval))
+        for _ in range(workers)
+    ]
+    for process in processes:
+        process.start()
+    try:
+        for process in processes:
+            process.join()
+    except KeyboardInterrupt:
+        for process in processes:
+            process.terminate()
+        raise
+
+
+def format_duration(seconds: Optional[float]) -> str:
+    """Format a duration in seconds for the status table."""
+    if seconds is None:
+        return '-'
+    minutes, seconds = divmod(int(seconds), 60)
+    hours, minutes = divmod(minutes, 60)
+    return f"{hours}:{minutes:02d}:{seconds:02d}"
+
+
+def print_status(statuses: List[Dict]):
+    """Print job statuses as a table."""
+    print(f"{'ID':>4}  {'NAME':<24} {'STATUS':<10} {'TARGETS':>8} {'ELAPSED':>9} {'ETA':>9}")
+    for status in statuses:
+        targets = f"{status['targets_done']}/{status['targets_total']}" if status['targets_total'] else '-'
+        print(f"{status['id']:>4}  {status['name'][:24]:<24} {status['status']:<10} {targets:>8} "
+              f"{format_duration(status['elapsed']):>9} {format_duration(status['eta']):>9}")
+        for name, stage in status['stages'].items():
+            print(f"      {name} {stage_summary(stage)}")
+        if status['error']:
+            print(f"      error: {status['error']}")
+
+
+def main():
+    """Main entry point."""
+    parser = argparse.ArgumentParser(description="Queue and run monorepo split jobs with a worker pool")
+    parser.add_argument('--db', default=os.getenv('SPLIT_SERVICE_DB', DEFAULT_DB_PATH), help='Path of the job queue database')
+    subparsers = parser.add_subparsers(dest='command', required=True)
+
+    submit_parser = subparsers.add_parser('submit', help='Add a split job from a JSON config file')
+    submit_parser.add_argument('config', help='JSON file with RepoSplitterConfig fields')
+    submit_parser.add_argument('--name', help='Job name (default: the config file name)')
+
+    status_parser = subparsers.add_parser('status', help='Show status and ETA of every job')
+    status_parser.add_argument('--json', action='store_true', help='Print machine-readable JSON')
+
+    work_parser = subparsers.add_parser('work', help='Run queued jobs with a pool of workers')
+    work_parser.add_argument('--workers', type=int, default=os.cpu_count(), help='Number of worker processes')
+    work_parser.add_argument('--log-dir', default=DEFAULT_LOG_DIR, help='Directory for per-job log files')
+    work_parser.add_argument('--job-dir', default=DEFAULT_JOB_DIR,
+                             help='Directory for the bundles of each job')
+    work_parser.add_argument('--wait', action='store_true', help='Keep polling for new jobs instead of exiting')
+    args = parser.parse_args()
+
+    try:
+        queue = JobQueue(args.db)
+
+        if args.command == 'submit':
+            with open(args.config) as f:
+                config = RepoSplitterConfig(**json.load(f))
+            if not config.source_repo_url:
+                raise ValueError("source_repo_url is required")
+            name = args.name or os.path.splitext(os.path.basename(args.config))[0]
+            job_id = queue.submit(config, name)
+            print(f"Submitted job {job_id}: {name}")
+            if config.github_token:
+                print("Note: the github_token of the job file was not stored; workers use their GITHUB_TOKEN")
+
+        elif args.command == 'status':
+            statuses = queue_status(queue)
+            if args.json:
+                print(json.dumps(statuses, indent=2))
+            else:
+                print_status(statuses)
+
+        else:
+            run_workers(args.db, args.log_dir, args.workers, args.wait, job_dir=args.job_dir)
+
+    except KeyboardInterrupt:
+        print("\nOperation cancelled by user")
+        sys.exit(1)
+    except Exception as e:
+        print(f"Error: {e}")
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,177 @@
+#!/usr/bin/env python3
+"""
+Common Library Submodule Wiring
+
+Rewrites the history of a split project repository so that every commit
+carries the common library as a submodule (a gitlink plus .gitmodules),
+pinned to the rewritten common-libs commit that matches the monorepo commit
+the project commit came from. The commit maps of the split connect the
+three histories:
+
+    source commit --(project map)--> project commit
+    source commit --(common map)---> common-libs commit
+
+A source commit that did not touch the common library has no common-libs
+commit of its own and is pinned to the one of its first parent, the
+library as it was checked out at that point.
+
+Nothing is copied from common-libs, so project history stays buildable
+(`git clone --recurse-submodules`) without duplicating library objects.
+
+Usage:
+    python submodule_wiring.py SOURCE_REPO PROJECT_REPO COMMON_REPO [--path libft] [--url ../common-libs.git]
+
+    PROJECT_REPO and COMMON_REPO must still hold the .git/filter-repo/commit-map
+    written by the split.
+"""
+
+import sys
+import hashlib
+import logging
+import argparse
+import subprocess
+from typing import List, Dict, Optional, Tuple
+
+from history_rewrite import git, read_commits, read_objects, apply_rewrite, read_filter_repo_map
+
+
+GITLINK_MODE = b'160000'
+TREE_MODE = b'40000'
+BLOB_MODE = b'100644'
+
+TreeEntry = Tuple[bytes, bytes, bytes]  # mode, name, 20-byte object id
+
+
+def pin_commits(source_repo_path: str, common_map: Dict[str, Optional[str]]) -> Dict[str, Optional[str]]:
+    """Return the common-libs commit every source commit should pin, or None before the library existed."""
+    revs = git(source_repo_path, ['rev-list', '--topo-order', '--reverse', '--parents', '--all']).decode()
+    pins: Dict[str, Optional[str]] = {}
+    for line in revs.splitlines():
+        sha, *parents = line.split()
+        pinned = common_map.get(sha)
+        if pinned is None and parents:
+            pinned = pins.get(parents[0])
+        pins[sha] = pinned
+    return pins
+
+
+def parse_tree(raw: bytes) -> List[TreeEntry]:
+    """Split a raw tree object into (mode, name, object id) entries."""
+    entries = []
+    offset = 0
+    while offset < len(raw):
+        space = raw.index(b' ', offset)
+        nul = raw.index(b'\0', space)
+        entries.append((raw[offset:space], raw[space + 1:nul], raw[nul + 1:nul + 21]))
+        offset = nul + 21
+    return entries
+
+
+def build_tree(entries: List[TreeEntry]) -> bytes:
+    """Build a tree object from entries, sorted the way git sorts them."""
+    entries = sorted(entries, key=lambda entry: entry[1] + b'/' if entry[0] == TREE_MODE else entry[1])
+    body = b''.join(mode + b' ' + name + b'\0' + oid for mode, name, oid in entries)
+    return b'tree %d\x00' % len(body) + body
+
+
+def submodule_section(path: str, url: str) -> bytes:
+    """Return the .gitmodules section for the common library submodule."""
+    return f'[submodule "{path}"]\n\tpath = {path}\n\turl = {url}\n'.encode()
+
+
+class SubmoduleWiring:
+    """Pin the common library as a submodule throughout the history of a project repository."""
+
+    def __init__(self, repo_path: str, submodule_path: str, url: str, logger: Optional[logging.Logger] = None):
+        if '/' in submodule_path.strip('/'):
+            raise ValueError(f"Submodule path must be a top-level directory, got '{submodule_path}'")
+        self.repo_path = repo_path
+        self.submodule_path = submodule_path.strip('/')
+        self.url = url
+        self.logger = logger or logging.getLogger(__name__)
+        self.objects: Dict[str, bytes] = {}
+        self.wired_trees: Dict[Tuple[str, str], str] = {}
+        self.gitmodules_blobs: Dict[Optional[str], str] = {}
+
+    def store(self, data: bytes) -> str:
+        """Hash an object and queue it for writing."""
+        sha = hashlib.sha1(data).hexdigest()
+        self.objects[sha] = data
+        return sha
+
+    def gitmodules_blob(self, existing: Optional[str]) -> str:
+        """Return the .gitmodules blob: the project's own one with the library section added."""
+        if existing not in self.gitmodules_blobs:
+            content = read_objects(self.repo_path, [existing])[existing] if existing else b''
+            section = submodule_section(self.submodule_path, self.url)
+            if section not in content:
+                if content and not content.endswith(b'\n'):
+                    content += b'\n'
+                content += section
+            self.gitmodules_blobs[existing] = self.store(b'blob %d\x00' % len(content) + content)
+        return self.gitmodules_blobs[existing]
+
+    def wired_tree(self, tree: str, raw_tree: bytes, pin: str) -> str:
+        """Return tree with the gitlink at submodule_path pointing at pin."""
+        key = (tree, pin)
+        if key not in self.wired_trees:
+            name = self.submodule_path.encode()
+            entries = parse_tree(raw_tree)
+            existing = next((oid.hex() for mode, entry_name, oid in entries if entry_name == b'.gitmodules'), None)
+            entries = [entry for entry in entries if entry[1] not in (name, b'.gitmodules')]
+            entries.append((GITLINK_MODE, name, bytes.fromhex(pin)))
+            entries.append((BLOB_MODE, b'.gitmodules', bytes.fromhex(self.gitmodules_blob(existing))))
+            self.wired_trees[key] = self.store(build_tree(entries))
+        return self.wired_trees[key]
+
+    def wire(self, project_map: Dict[str, Optional[str]], pins: Dict[str, Optional[str]]) -> Dict[str, str]:
+        """Rewrite every branch and tag of the project repository; return the old -> new commit map."""
+        source_of = {new: old for old, new in project_map.items() if new}
+        revs = git(self.repo_path, ['rev-list', '--topo-order', '--reverse', '--branches', '--tags']).decode().split()
+        commits = read_commits(self.repo_path, revs, None)
+        trees = read_objects(self.repo_path, sorted({commit.tree for commit in commits}))
+
+        commit_map: Dict[str, str] = {}
+        unpinned = 0
+        for commit in commits:
+            pin = pins.get(source_of.get(commit.sha))
+            if pin:
+                tree = self.wired_tree(commit.tree, trees[commit.tree], pin)
+            else:
+                tree = commit.tree
+                unpinned += 1
+
+            body = f'tree {tree}\n'.encode()
+            body += b''.join(f'parent {commit_map[parent]}\n'.encode() for parent in commit.parents)
+            body += commit.headers + b'\n\n' + commit.message
+            commit_map[commit.sha] = self.store(b'commit %d\x00' % len(body) + body)
+
+        apply_rewrite(self.repo_path, commit_map, self.objects)
+
+        self.logger.info(f"Wired '{self.submodule_path}' as a submodule into {len(commits) - unpinned} "
+                         f"of {len(commits)} commits ({self.url})")
+        return commit_map
+
+
+def main():
+    """Main entry point."""
+    parser = argparse.ArgumentParser(description="Wire common-libs as a submodule into a split project repository")
+    parser.add_argument('source_repo', help='The monorepo (mirror) the split was made from')
+    parser.add_argument('project_repo', help='Split project repository, rewritten in place')
+    parser.add_argument('common_repo', help='Split common-libs repository')
+    parser.add_argument('--path', default='libft', help='Submodule path inside the project')
+    parser.add_argument('--url', default='../common-libs.git', help='Submodule URL, relative to the project remote')
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+    try:
+        pins = pin_commits(args.source_repo, read_filter_repo_map(args.common_repo))
+        wiring = SubmoduleWiring(args.project_repo, args.path, args.url)
+        wiring.wire(read_filter_repo_map(args.project_repo), pins)
+    except (OSError, ValueError, subprocess.CalledProcessError) as e:
+        print(f"Error: {e}")
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,222 @@
+#!/usr/bin/env python3
+"""
+Target Discovery
+
+Finds the projects of a monorepo instead of reading them from PROJECTS, for
+monorepos with more top-level projects than anyone wants to keep a list of.
+A directory is a project if:
+
+    - its path matches one of the patterns ('*' by default, 'apps/*' for nested ones)
+    - it directly contains one of the marker files, e.g. Makefile (any file if none are given)
+    - it matches no exclude pattern, is not hidden, and is not COMMON_PATH or inside it
+    - it is not inside another project
+
+All of that is decided from a single `git ls-tree` listing of HEAD of the
+mirror. In branch mode the patterns select the branches of the mirror
+instead, apart from its default branch.
+
+The result goes into a manifest file, per source repository, together with
+the tree (or branch tips) it was found in and the rules it was found with.
+Runs on an unchanged monorepo reuse it instead of listing again. A manifest
+of another format version is ignored.
+
+Usage:
+    python target_discovery.py MIRROR [--pattern '*'] [--marker Makefile] [--exclude docs]
+                                      [--common libft] [--mode project|branch]
+                                      [--manifest target_manifest.json] [--source-url URL]
+
+Prints the targets the rules find in a mirror (or any clone).
+"""
+
+import os
+import sys
+import json
+import time
+import hashlib
+import logging
+import argparse
+import subprocess
+from dataclasses import dataclass, asdict
+from fnmatch import fnmatchcase
+from typing import Dict, Iterable, List, Optional
+
+from history_rewrite import git
+from shared_files import locked, replace_json
+
+
+DEFAULT_MANIFEST_PATH = 'target_manifest.json'
+MANIFEST_VERSION = 1
+# PROJECTS or BRANCHES set to this discovers the targets
+AUTO = 'auto'
+
+
+def parse_names(value: Optional[str]) -> List[str]:
+    """Split a comma-separated list such as PROJECTS, dropping blanks."""
+    return [name.strip() for name in (value or '').split(',') if name.strip()]
+
+
+def wants_discovery(value: Optional[str]) -> bool:
+    """Return True if a target list asks for discovery (PROJECTS=auto)."""
+    return (value or '').strip().lower() == AUTO
+
+
+@dataclass
+class DiscoveryRules:
+    """What makes a directory (or branch) a target."""
+    patterns: List[str]
+    markers: List[str]
+    exclude: List[str]
+    common_path: Optional[str] = None
+
+    def key(self) -> str:
+        """Return a fingerprint of the rules; a manifest only applies to the rules it was made with."""
+        return hashlib.sha1(json.dumps(asdict(self), sort_keys=True).encode()).hexdigest()
+
+
+def matches(path: str, pattern: str) -> bool:
+    """Match a path against a glob component by component, so '*' never crosses a '/'."""
+    parts = path.split('/')
+    pattern_parts = pattern.strip('/').split('/')
+    return len(parts) == len(pattern_parts) and all(map(fnmatchcase, parts, pattern_parts))
+
+
+def select_projects(paths: Iterable[str], rules: DiscoveryRules) -> List[str]:
+    """Return the project directories of a tree listing, outermost ones only."""
+    depths = {len(pattern.strip('/').split('/')) for pattern in rules.patterns}
+    markers = set(rules.markers)
+    candidates = set()
+    for path in paths:
+        parts = path.split('/')
+        for depth in depths:
+            if len(parts) <= depth:
+                continue
+            if markers and (len(parts) != depth + 1 or parts[-1] not in markers):
+                continue
+            candidates.add('/'.join(parts[:depth]))
+
+    common = rules.common_path.strip('/') if rules.common_path else None
+    projects: List[str] = []
+    for directory in sorted(candidates, key=lambda directory: (directory.count('/'), directory)):
+        if any(part.startswith('.') for part in directory.split('/')):
+            continue
+        if not any(matches(directory, pattern) for pattern in rules.patterns):
+            continue
+        if any(matches(directory, pattern) for pattern in rules.exclude):
+            continue
+        if common and (directory == common or directory.startswith(f'{common}/') or common.startswith(f'{directory}/')):
+            continue
+        if any(directory.startswith(f'{project}/') for project in projects):
+            continue
+        projects.append(directory)
+    return sorted(projects)
+
+
+def load_manifest(manifest_path: str) -> Dict[str, Dict]:
+    """Read the manifest entries per source repository; an unreadable or outdated manifest has none."""
+    if not manifest_path or not os.path.exists(manifest_path):
+        return {}
+    try:
+        with open(manifest_path) as f:
+            manifest = json.load(f)
+    except (OSError, ValueError):
+        return {}
+    if manifest.get('version') != MANIFEST_VERSION:
+        return {}
+    return manifest.get('sources', {})
+
+
+def cached_targets(manifest_path: str, source_repo_url: str, mode: str) -> Optional[Dict]:
+    """Return the last manifest entry of a source and mode, whatever monorepo state it was made from."""
+    entry = load_manifest(manifest_path).get(source_repo_url)
+    if entry and entry.get('mode') == mode:
+        return entry
+    return None
+
+
+class TargetDiscovery:
+    """Discover the targets of a mirror, reusing the manifest while the monorepo is unchanged."""
+
+    def __init__(self, repo_path: str, rules: DiscoveryRules, manifest_path: str = '',
+                 logger: Optional[logging.Logger] = None):
+        self.repo_path = repo_path
+        self.rules = rules
+        self.manifest_path = manifest_path
+        self.logger = logger or logging.getLogger(__name__)
+
+    def state(self, mode: str) -> str:
+        """Return what the targets depend on: the tree of HEAD, or the branches and their tips."""
+        if mode == 'branch':
+            refs = git(self.repo_path, ['for-each-ref', '--format=%(refname) %(objectname)', 'refs/heads'])
+            return hashlib.sha1(refs).hexdigest()
+        return git(self.repo_path, ['rev-parse', 'HEAD^{tree}']).decode().strip()
+
+    def scan(self, mode: str) -> List[str]:
+        """List the mirror once and apply the rules."""
+        if mode == 'branch':
+            default = git(self.repo_path, ['symbolic-ref', '--short', 'HEAD']).decode().strip()
+            branches = git(self.repo_path, ['for-each-ref', '--format=%(refname:short)', 'refs/heads']).decode().split()
+            return sorted(
+                branch for branch in branches
+                if branch != default
+                and any(fnmatchcase(branch, pattern) for pattern in self.rules.patterns)
+                and not any(fnmatchcase(branch, pattern) for pattern in self.rules.exclude)
+            )
+        listing = git(self.repo_path, ['ls-tree', '-r', '-z', '--name-only', 'HEAD'])
+        return select_projects(listing.decode(errors='replace').split('\0')[:-1], self.rules)
+
+    def discover(self, source_repo_url: str, mode: str) -> List[str]:
+        """Return the targets of the mirror, from the manifest if it was made from the same state and rules."""
+        state = self.state(mode)
+        sources = load_manifest(self.manifest_path)
+        entry = sources.get(source_repo_url)
+        if entry and entry['mode'] == mode and entry['state'] == state and entry['rules'] == self.rules.key():
+            self.logger.info(f"Using {len(entry['targets'])} discovered {mode} targets from {self.manifest_path}")
+            return entry['targets']
+
+        start = time.monotonic()
+        targets = self.scan(mode)
+        self.logger.info(f"Discovered {len(targets)} {mode} targets in {time.monotonic() - start:.2f}s")
+        if self.manifest_path:
+            self.save(source_repo_url, {
+                'mode': mode,
+                'state': state,
+                'rules': self.rules.key(),
+                'targets': targets,
+                'discovered_at': time.time(),
+            })
+        return targets
+
+    def save(self, source_repo_url: str, entry: Dict):
+        """Store the entry of one source in the manifest; split service workers share it."""
+        with locked(self.manifest_path):
+            sources = load_manifest(self.manifest_path)
+            sources[source_repo_url] = entry
+            replace_json(self.manifest_path, {'version': MANIFEST_VERSION, 'sources': sources})
+
+
+def main():
+    """Main entry point."""
+    parser = argparse.ArgumentParser(description="Show the targets the discovery rules find in a mirror")
+    parser.add_argument('repo', help='Path of the mirror (or any clone)')
+    parser.add_argument('--pattern', action='append', default=[], help="Directory or branch glob (repeatable, default '*')")
+    parser.add_argument('--marker', action='append', default=[], help='File a project directory must contain (repeatable)')
+    parser.add_argument('--exclude', action='append', default=[], help='Directory or branch glob to skip (repeatable)')
+    parser.add_argument('--common', help='Common library path, never a project')
+    parser.add_argument('--mode', choices=['project', 'branch'], default='project', help='Discover projects or branches')
+    parser.add_argument('--manifest', default='', help='Manifest file to reuse and update')
+    parser.add_argument('--source-url', help='Source URL the manifest entry is keyed by (default: the repo path)')
+    args = parser.parse_args()
+
+    rules = DiscoveryRules(args.pattern or ['*'], args.marker, args.exclude, args.common)
+    discovery = TargetDiscovery(args.repo, rules, args.manifest)
+    try:
+        targets = discovery.discover(args.source_url or os.path.abspath(args.repo), args.mode)
+    except subprocess.CalledProcessError as e:
+        print(f"Error: {e.stderr.decode().strip()}")
+        sys.exit(1)
+    for target in targets:
+        print(target)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,18 @@
+"""Make the top-level modules importable from the tests, and serve a local remote to push to."""
+
+import os
+import sys
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from local_remote import LocalRemote, NetworkProfile
+
+
+@pytest.fixture
+def local_remote(tmp_path):
+    """A git http-backend remote with the fake GitHub API on a free port, stopped after the test."""
+    remote = LocalRemote(str(tmp_path / 'remote'), NetworkProfile(), port=0).start()
+    yield remote
+    remote.stop()
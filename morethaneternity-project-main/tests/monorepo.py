@@ -0,0 +1,34 @@
+"""Build small monorepos for the tests."""
+
+import os
+import subprocess
+
+from history_rewrite import git
+
+
+class Monorepo:
+    """A small monorepo built commit by commit, with fixed dates so commit IDs are stable."""
+
+    def __init__(self, path: str):
+        self.path = path
+        self.time = 1700000000
+        git(os.path.dirname(path), ['init', '--quiet', '--initial-branch=main', path])
+
+    def run(self, *args: str) -> str:
+        """Run git in the repository and return its stripped output."""
+        self.time += 60
+        env = {**os.environ, 'GIT_AUTHOR_DATE': f'{self.time} +0000', 'GIT_COMMITTER_DATE': f'{self.time} +0000',
+               'GIT_AUTHOR_NAME': 'Splitter', 'GIT_AUTHOR_EMAIL': 'splitter@example.com',
+               'GIT_COMMITTER_NAME': 'Splitter', 'GIT_COMMITTER_EMAIL': 'splitter@example.com'}
+        result = subprocess.run(['git', *args], cwd=self.path, env=env, capture_output=True, text=True, check=True)
+        return result.stdout.strip()
+
+    def commit(self, path: str, content: str, message: str) -> str:
+        """Write path and commit it; return the new commit."""
+        full_path = os.path.join(self.path, path)
+        os.makedirs(os.path.dirname(full_path), exist_ok=True)
+        with open(full_path, 'w') as f:
+            f.write(content)
+        self.run('add', path)
+        self.run('commit', '--quiet', '-m', message)
+        return self.run('rev-parse', 'HEAD')
@@ -0,0 +1,76 @@
+"""Cross-project references in commit messages, and the submodule pins they move."""
+
+import os
+import tempfile
+import unittest
+
+from commit_index import CommitIndex
+from cross_references import CrossReferenceRewriter
+from history_rewrite import git, read_filter_repo_map
+from monorepo import Monorepo
+from submodule_wiring import SubmoduleWiring, pin_commits
+
+
+class CrossReferenceTest(unittest.TestCase):
+    """Rewrite a project wired to common-libs and a common-libs that mentions the project."""
+
+    def setUp(self):
+        temp_dir = tempfile.TemporaryDirectory()
+        self.addCleanup(temp_dir.cleanup)
+        self.temp_dir = temp_dir.name
+        self.repo = Monorepo(os.path.join(self.temp_dir, 'mono'))
+
+        repo = self.repo
+        self.app = repo.commit('app/main.c', 'int main;\n', 'Add app')
+        self.libft = repo.commit('libft/ft.c', 'int ft;\n', f'Add libft for {self.app[:7]}')
+        repo.commit('app/main.c', 'int main(void);\n', f'Use libft from {self.libft[:9]}')
+
+        self.index = CommitIndex(os.path.join(self.temp_dir, 'commit_index.db'))
+        self.run_id = self.index.start_run(repo.path, 'project')
+
+    def split(self, name: str, subdirectory: str) -> str:
+        path = os.path.join(self.temp_dir, name)
+        git(self.temp_dir, ['clone', '--quiet', self.repo.path, path])
+        git(path, ['filter-repo', '--subdirectory-filter', subdirectory, '--force', '--quiet'])
+        return path
+
+    def test_references_and_pins_follow_the_rewrite(self):
+        common_path = self.split('common-libs', 'libft')
+        common_map = read_filter_repo_map(common_path)
+        app_path = self.split('app', 'app')
+        app_map = read_filter_repo_map(app_path)
+        wired = SubmoduleWiring(app_path, 'libft', '../common-libs.git').wire(
+            app_map, pin_commits(self.repo.path, common_map))
+        app_map = {old: wired.get(new) if new else None for old, new in app_map.items()}
+        self.index.record(self.run_id, 'common-libs', common_map)
+        self.index.record(self.run_id, 'app', app_map)
+
+        rewriter = CrossReferenceRewriter(self.repo.path, self.index, self.run_id, submodule_path='libft')
+        rewriter.rewrite({'common-libs': (common_path, common_map), 'app': (app_path, app_map)})
+
+        first_app = git(app_path, ['rev-list', '--max-parents=0', 'HEAD']).decode().strip()
+        common_head = git(common_path, ['rev-parse', 'HEAD']).decode().strip()
+        self.assertEqual(git(common_path, ['log', '-1', '--format=%s']).decode().strip(),
+                         f'Add libft for app@{first_app[:7]}')
+        self.assertEqual(git(app_path, ['log', '-1', '--format=%s']).decode().strip(),
+                         f'Use libft from common-libs@{common_head[:9]}')
+        # The message of the pinned common-libs commit changed, and the gitlink went with it
+        gitlink = git(app_path, ['ls-tree', 'HEAD', 'libft']).decode().split()
+        self.assertEqual(gitlink[:3], ['160000', 'commit', common_head])
+        self.assertEqual(git(app_path, ['ls-tree', first_app, 'libft']).decode(), '')
+
+    def test_batched_lookups_match_single_ones(self):
+        app_map = read_filter_repo_map(self.split('app', 'app'))
+        self.index.record(self.run_id, 'app', app_map)
+        shas = [self.app, self.app[:7], self.libft[:12], 'deadbeef']
+
+        batched = self.index.lookup_many(shas, run_id=self.run_id)
+        for sha in shas:
+            self.assertEqual(batched[sha], self.index.lookup(sha, run_id=self.run_id), sha)
+        new = app_map[self.app]
+        self.assertEqual([row['source_sha'] for row in self.index.reverse_many([new[:8]], 'app')[new[:8]]],
+                         [self.app])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,88 @@
+"""The common library closure of a project and the trimmed common Makefile."""
+
+import os
+import tempfile
+import unittest
+
+from dependency_closure import DependencyClosure, trim_callback, trim_named_sources
+from history_rewrite import git
+from monorepo import Monorepo
+
+
+LIBFT_MAKEFILE = """NAME = libft.a
+SRC = ft_used \\
+\tft_unused \\
+\tft_helper
+
+OBJS = $(addsuffix .o, $(SRC))
+
+$(NAME): $(OBJS)
+\tar rcs $@ $^
+"""
+
+APP_MAKEFILE = """LIBFT_PATH = ../libft
+
+app: src/main.c
+\tmake -C $(LIBFT_PATH)
+\tcc -I$(LIBFT_PATH) -o app src/main.c -L$(LIBFT_PATH) -lft
+"""
+
+
+class DependencyClosureTest(unittest.TestCase):
+    """A project only gets the common sources it uses, and the common Makefile stops naming the rest."""
+
+    def setUp(self):
+        temp_dir = tempfile.TemporaryDirectory()
+        self.addCleanup(temp_dir.cleanup)
+        self.temp_dir = temp_dir.name
+        self.repo = Monorepo(os.path.join(self.temp_dir, 'mono'))
+
+        repo = self.repo
+        repo.commit('libft/libft.h', 'int ft_used(void);\nint ft_unused(void);\n', 'Add libft header')
+        repo.commit('libft/ft_helper.c', 'int ft_helper(void)\n{\n\treturn (1);\n}\n', 'Add ft_helper')
+        repo.commit('libft/ft_used.c', '#include "libft.h"\n\nint ft_used(void)\n{\n\treturn (ft_helper());\n}\n',
+                    'Add ft_used')
+        repo.commit('libft/ft_unused.c', '#include "libft.h"\n\nint ft_unused(void)\n{\n\treturn (0);\n}\n',
+                    'Add ft_unused')
+        repo.commit('libft/Makefile', LIBFT_MAKEFILE, 'Build libft')
+        repo.commit('app/src/main.c', '#include "libft.h"\n\nint main(void)\n{\n\treturn (ft_used());\n}\n',
+                    'Add app')
+        repo.commit('app/Makefile', APP_MAKEFILE, 'Build app')
+
+        self.closure = DependencyClosure(repo.path, 'libft')
+        self.closure.load(['app'])
+
+    def test_unused_source_is_left_out(self):
+        files = self.closure.closure('app')
+
+        self.assertEqual(files, ['libft/Makefile', 'libft/ft_helper.c', 'libft/ft_used.c', 'libft/libft.h'])
+        self.assertEqual(self.closure.missing_sources(files), {'libft/Makefile': ['libft/ft_unused.c']})
+
+    def test_trim_named_sources(self):
+        trimmed = trim_named_sources(LIBFT_MAKEFILE.encode(), ['libft/ft_unused.c']).decode()
+
+        self.assertIn('SRC = ft_used \\\n\tft_helper\n', trimmed)
+        self.assertNotIn('ft_unused', trimmed)
+
+    def test_split_history_names_only_kept_sources(self):
+        files = self.closure.closure('app')
+        callback_path = os.path.join(self.temp_dir, 'trim.py')
+        with open(callback_path, 'w') as f:
+            f.write(trim_callback({'lib/Makefile': self.closure.missing_sources(files)['libft/Makefile']}))
+
+        split_path = os.path.join(self.temp_dir, 'split')
+        git(self.temp_dir, ['clone', '--quiet', self.repo.path, split_path])
+        paths = [arg for path in ['app/', *files] for arg in ('--path', path)]
+        git(split_path, ['filter-repo', *paths, '--path-rename', 'libft/:lib/',
+                         '--file-info-callback', callback_path, '--force', '--quiet'])
+
+        self.assertEqual(git(split_path, ['ls-files', 'lib']).decode().split(),
+                         ['lib/Makefile', 'lib/ft_helper.c', 'lib/ft_used.c', 'lib/libft.h'])
+        for sha in git(split_path, ['rev-list', 'HEAD', '--', 'lib/Makefile']).decode().split():
+            makefile = git(split_path, ['show', f'{sha}:lib/Makefile']).decode()
+            self.assertIn('SRC = ft_used \\\n\tft_helper\n', makefile)
+            self.assertNotIn('ft_unused', makefile)
+
+
+if __name__ == '__main__':
+    unittest.main()
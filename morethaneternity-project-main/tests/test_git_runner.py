@@ -0,0 +1,63 @@
+"""Timeouts and cancellation of the git commands the rewrite modules run."""
+
+import time
+import tempfile
+import threading
+import unittest
+import subprocess
+
+from git_runner import GitRunner, TargetCancelled, install_runner
+from history_rewrite import git
+
+
+# A git command that hangs in a child process of its own, the way a stuck helper would
+HANG = ['-c', 'alias.hang=!sleep 30', 'hang']
+
+
+class GitRunnerTest(unittest.TestCase):
+    """history_rewrite.git goes through the installed runner, with its timeout and its cancel."""
+
+    def setUp(self):
+        temp_dir = tempfile.TemporaryDirectory()
+        self.addCleanup(temp_dir.cleanup)
+        self.temp_dir = temp_dir.name
+
+    def install(self, runner: GitRunner):
+        previous = install_runner(runner)
+        self.addCleanup(install_runner, previous)
+
+    def test_rewrite_timeout_stops_the_process_group(self):
+        self.install(GitRunner({'rewrite': 1}))
+
+        start = time.monotonic()
+        with self.assertRaises(subprocess.TimeoutExpired):
+            git(self.temp_dir, HANG)
+        # The output pipes only close once the sleep the alias started is gone too
+        self.assertLess(time.monotonic() - start, 10)
+
+    def test_cancel_stops_running_and_later_commands(self):
+        runner = GitRunner()
+        self.install(runner)
+        errors = []
+
+        def hang():
+            try:
+                git(self.temp_dir, HANG)
+            except Exception as e:
+                errors.append(e)
+
+        thread = threading.Thread(target=hang)
+        thread.start()
+        while not runner.processes:
+            time.sleep(0.05)
+        self.assertEqual(runner.cancel(), 1)
+        thread.join(timeout=10)
+
+        self.assertFalse(thread.is_alive())
+        self.assertIsInstance(errors[0], TargetCancelled)
+        with self.assertRaises(TargetCancelled):
+            git(self.temp_dir, ['version'])
+
+
+if __name__ == '__main__':
+    unittest.main()
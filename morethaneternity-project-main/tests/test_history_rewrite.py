@@ -0,0 +1,82 @@
+"""The sharded rewriter against git filter-repo."""
+
+import os
+import tempfile
+import unittest
+
+from history_rewrite import HistoryRewriter
+from monorepo import Monorepo
+
+
+class HistoryRewriteTest(unittest.TestCase):
+    """Rewrite every branch and tag and compare with git filter-repo."""
+
+    def setUp(self):
+        temp_dir = tempfile.TemporaryDirectory()
+        self.addCleanup(temp_dir.cleanup)
+        self.repo = Monorepo(os.path.join(temp_dir.name, 'mono'))
+
+        repo = self.repo
+        first = repo.commit('fractol/main.c', 'int main;\n', 'Add fractol')
+        self.outside = outside = repo.commit('libft/ft.c', 'int ft;\n', 'Add libft')
+        second = repo.commit('fractol/main.c', 'int main(void);\n', f'Fix {first[:7]}, which broke the build')
+        repo.run('tag', '-a', 'v1.0', '-m', 'First release')
+        repo.run('checkout', '--quiet', '-b', 'feature')
+        repo.commit('fractol/zoom.c', 'int zoom;\n', f'Add zoom on top of {second}')
+        repo.run('checkout', '--quiet', 'main')
+        repo.commit('fractol/color.c', 'int color;\n', f'Colors, unrelated to {outside[:10]}')
+        repo.run('merge', '--quiet', '--no-ff', '-m', 'Merge feature', 'feature')
+        repo.run('checkout', '--quiet', '--orphan', 'libft-only')
+        repo.run('rm', '-r', '-f', '--quiet', '.')
+        repo.commit('libft/other.c', 'int other;\n', 'Only libft')
+        repo.run('checkout', '--quiet', 'main')
+        for index in range(4):
+            repo.commit('fractol/main.c', f'int main(void); // {index}\n', f'Tweak {index}')
+        self.refs = ['refs/heads/main', 'refs/heads/feature', 'refs/heads/libft-only', 'refs/tags/v1.0']
+
+    def test_matches_filter_repo(self):
+        rewriter = HistoryRewriter(self.repo.path, 'fractol')
+        result = rewriter.rewrite_refs({ref: None for ref in self.refs}, shards=3)
+
+        # Raises if any commit or ref differs from filter-repo, quoted hashes included
+        rewriter.verify(result)
+        self.assertIsNone(result.tips['refs/heads/libft-only'])
+
+    def test_quoted_hashes_follow_the_rewrite(self):
+        rewriter = HistoryRewriter(self.repo.path, 'fractol')
+        result = rewriter.rewrite_refs({ref: None for ref in self.refs}, shards=2)
+        rewriter.write(result, 'refs/heads/main')
+
+        first, second = self.repo.run('rev-list', '--reverse', '--first-parent', 'main').split()[:2]
+        self.assertEqual(self.repo.run('log', '-1', '--format=%s', second), f'Fix {first[:7]}, which broke the build')
+        zoom = self.repo.run('log', '-1', '--format=%s', 'feature')
+        self.assertEqual(zoom, f'Add zoom on top of {second}')
+        # The libft commit was pruned, so its hash is left as it was
+        self.assertEqual(self.repo.run('log', '-1', '--format=%s', 'main~5'), f'Colors, unrelated to {self.outside[:10]}')
+        # Only libft changed on this branch, so nothing is left of it
+        self.assertNotIn('refs/heads/libft-only', self.repo.run('for-each-ref', '--format=%(refname)'))
+
+    def test_cutoff_per_ref(self):
+        self.repo.run('branch', '--quiet', '-D', 'libft-only')
+        rewriter = HistoryRewriter(self.repo.path, 'fractol')
+        cutoffs = rewriter.find_cutoffs(['refs/heads/main', 'refs/heads/feature', 'refs/tags/v1.0'], max_commits=2)
+        result = rewriter.rewrite_refs(cutoffs, shards=2)
+        rewriter.verify(result)
+        rewriter.write(result, 'refs/heads/main')
+
+        refs = self.repo.run('for-each-ref', '--format=%(refname)').split()
+        self.assertEqual(sorted(refs), ['refs/heads/feature', 'refs/heads/main', 'refs/tags/v1.0'])
+        # Each ref keeps what is left of its own last two first-parent commits on top of a synthesized
+        # root; the libft commit below the tag is pruned
+        expected = {'refs/heads/main': ['Tweak 3', 'Tweak 2'], 'refs/heads/feature': ['Add zoom', 'Fix'],
+                    'refs/tags/v1.0': ['Fix']}
+        for ref, subjects in expected.items():
+            history = self.repo.run('log', '--first-parent', '--format=%s', ref).splitlines()
+            self.assertEqual(len(history), len(subjects) + 1, ref)
+            for subject, start in zip(history, subjects):
+                self.assertTrue(subject.startswith(start), f'{ref}: {subject}')
+            self.assertTrue(history[-1].startswith('Import history up to '), ref)
+
+
+if __name__ == '__main__':
+    unittest.main()
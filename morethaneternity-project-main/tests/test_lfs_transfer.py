@@ -0,0 +1,151 @@
+"""LFS transfers against the LFS server of local_remote.py."""
+
+import os
+import time
+import hashlib
+import tempfile
+import unittest
+from unittest import mock
+
+import lfs_transfer
+from lfs_transfer import LfsTransfer, LfsError, lfs_endpoint, scan_pointers
+from local_remote import LocalRemote, NetworkProfile
+from monorepo import Monorepo
+
+
+def make_objects(count: int, tag: str = 'object'):
+    """Return {oid: content} of count small distinct objects."""
+    contents = [f'{tag} {index}\n'.encode() * (index + 1) for index in range(count)]
+    return {hashlib.sha256(content).hexdigest(): content for content in contents}
+
+
+def pointer_file(content: bytes) -> str:
+    """Return the LFS pointer file git-lfs writes for content."""
+    oid = hashlib.sha256(content).hexdigest()
+    return f'version https://git-lfs.github.com/spec/v1\noid sha256:{oid}\nsize {len(content)}\n'
+
+
+class LfsTransferTest(unittest.TestCase):
+    """Download, cache and upload LFS objects through the local LFS server."""
+
+    def setUp(self):
+        self.temp_dir = tempfile.TemporaryDirectory()
+        self.remote = LocalRemote(os.path.join(self.temp_dir.name, 'remote'), NetworkProfile()).start()
+        self.addCleanup(self.temp_dir.cleanup)
+        self.addCleanup(self.remote.stop)
+        self.remote.create_repo('splitter', 'mono')
+        self.cache_dir = os.path.join(self.temp_dir.name, 'lfs_cache')
+
+    def store_on_source(self, contents):
+        """Put objects into the LFS storage of the source repository."""
+        for oid, content in contents.items():
+            path = self.remote.lfs_path('splitter', 'mono', oid)
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            with open(path, 'wb') as f:
+                f.write(content)
+
+    def transfer(self, workers: int = 8) -> LfsTransfer:
+        source_url = lfs_endpoint(self.remote.clone_url('splitter', 'mono'))
+        return LfsTransfer(self.cache_dir, source_lfs_url=source_url, workers=workers)
+
+    def test_download_into_shared_cache(self):
+        contents = make_objects(5)
+        self.store_on_source(contents)
+        transfer = self.transfer()
+
+        transfer.fetch({oid: len(content) for oid, content in contents.items()})
+
+        for oid, content in contents.items():
+            with open(transfer.cache.path(oid), 'rb') as f:
+                self.assertEqual(f.read(), content)
+        self.assertEqual(transfer.stats['fetched'], 5)
+        self.assertEqual(transfer.stats['fetched_bytes'], sum(map(len, contents.values())))
+        self.assertEqual(self.remote.stats['lfs_downloads'], 5)
+
+    def test_second_target_hits_cache(self):
+        contents = make_objects(4)
+        self.store_on_source(contents)
+        objects = {oid: len(content) for oid, content in contents.items()}
+        transfer = self.transfer()
+
+        transfer.fetch(objects)
+        # A second target needs some of the same objects; a later run starts from the same cache
+        transfer.fetch(dict(list(objects.items())[:2]))
+        self.transfer().fetch(objects)
+
+        self.assertEqual(self.remote.stats['lfs_downloads'], 4)
+        self.assertEqual(transfer.stats['fetched'], 4)
+
+    def test_parallel_upload_batches(self):
+        contents = make_objects(12)
+        self.store_on_source(contents)
+        objects = {oid: len(content) for oid, content in contents.items()}
+        transfer = self.transfer(workers=12)
+        transfer.fetch(objects)
+        self.remote.create_repo('splitter', 'fractol-app')
+        self.remote.profile.latency = 0.2
+
+        # Three batch requests of four objects each
+        with mock.patch.object(lfs_transfer, 'BATCH_SIZE', 4):
+            start = time.monotonic()
+            uploaded = transfer.push(objects, self.remote.clone_url('splitter', 'fractol-app'))
+            elapsed = time.monotonic() - start
+
+        self.assertEqual(uploaded, 12)
+        self.assertEqual(self.remote.stats['lfs_uploads'], 12)
+        for oid, content in contents.items():
+            with open(self.remote.lfs_path('splitter', 'fractol-app', oid), 'rb') as f:
+                self.assertEqual(f.read(), content)
+        # 3 batches and 12 uploads one after another would take at least 3s
+        self.assertLess(elapsed, 2.0)
+        # The server has them all now, so nothing is sent again
+        self.assertEqual(transfer.push(objects, self.remote.clone_url('splitter', 'fractol-app')), 0)
+
+    def test_per_object_error(self):
+        contents = make_objects(3)
+        missing = make_objects(1, 'missing')
+        self.store_on_source(contents)
+        objects = {oid: len(content) for oid, content in {**contents, **missing}.items()}
+        transfer = self.transfer()
+
+        with self.assertRaisesRegex(LfsError, 'Object does not exist'):
+            transfer.fetch(objects)
+        self.assertFalse(any(transfer.cache.has(oid, size) for oid, size in objects.items()))
+        self.assertEqual(self.remote.stats['lfs_downloads'], 0)
+        # The failed objects are not left in flight: the next target asks again instead of waiting
+        with self.assertRaisesRegex(LfsError, 'Object does not exist'):
+            transfer.fetch(objects)
+
+
+class ScanPointersTest(unittest.TestCase):
+    """Find the LFS objects the pointers reachable from some refs point at."""
+
+    def setUp(self):
+        temp_dir = tempfile.TemporaryDirectory()
+        self.addCleanup(temp_dir.cleanup)
+        self.repo = Monorepo(os.path.join(temp_dir.name, 'mono'))
+        self.old, self.image, self.data, self.extra = (
+            make_objects(1, tag).popitem() for tag in ('old', 'image', 'data', 'extra'))
+
+        repo = self.repo
+        repo.commit('fractol/image.png', pointer_file(self.old[1]), 'Add image')
+        repo.commit('fractol/image.png', pointer_file(self.image[1]), 'Update image')
+        repo.commit('libft/data.bin', pointer_file(self.data[1]), 'Add data')
+        # Starts like a pointer but has no oid, and one too big to be a pointer
+        repo.commit('fractol/notes.txt', 'version https://git-lfs.github.com/spec/v1\nsize 3\n', 'Add notes')
+        repo.commit('fractol/big.txt', pointer_file(b'big') + 'x' * 2000, 'Add big file')
+        repo.run('checkout', '--quiet', '-b', 'feature')
+        repo.commit('fractol/extra.png', pointer_file(self.extra[1]), 'Add extra')
+        repo.run('checkout', '--quiet', 'main')
+
+    def test_pointers_reachable_from_refs(self):
+        expected = {oid: len(content) for oid, content in (self.old, self.image, self.data)}
+        self.assertEqual(scan_pointers(self.repo.path, ['refs/heads/main']), expected)
+
+        expected[self.extra[0]] = len(self.extra[1])
+        self.assertEqual(scan_pointers(self.repo.path, ['refs/heads/main', 'refs/heads/feature']), expected)
+        self.assertEqual(scan_pointers(self.repo.path, []), {})
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,102 @@
+"""A whole split pushed to the local remote and cloned back."""
+
+import os
+import hashlib
+import subprocess
+
+import pytest
+
+from monorepo import Monorepo
+from split_repo_agent import RepoSplitter, RepoSplitterConfig
+
+
+def clone(remote_url: str, path: str) -> str:
+    subprocess.run(['git', 'clone', '--quiet', remote_url, path], check=True, capture_output=True)
+    return path
+
+
+def run_git(path: str, *args: str) -> str:
+    return subprocess.run(['git', *args], cwd=path, check=True, capture_output=True, text=True).stdout.strip()
+
+
+def oid_of(content: bytes) -> str:
+    return hashlib.sha256(content).hexdigest()
+
+
+def store_lfs_object(repo: Monorepo, content: bytes) -> str:
+    """Put content into the local LFS store of repo and return its pointer file."""
+    oid = oid_of(content)
+    path = os.path.join(repo.path, '.git', 'lfs', 'objects', oid[:2], oid[2:4], oid)
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with open(path, 'wb') as f:
+        f.write(content)
+    return f'version https://git-lfs.github.com/spec/v1\noid sha256:{oid}\nsize {len(content)}\n'
+
+
+@pytest.fixture
+def monorepo(tmp_path):
+    """fractol and libft with a feature branch and a release tag."""
+    repo = Monorepo(str(tmp_path / 'mono'))
+    repo.commit('fractol/main.c', 'int main;\n', 'Add fractol')
+    repo.commit('libft/ft.c', 'int ft;\n', 'Add libft')
+    repo.commit('fractol/main.c', 'int main(void);\n', 'Fix fractol')
+    repo.run('tag', '-a', 'v1.0', '-m', 'First release')
+    repo.run('checkout', '--quiet', '-b', 'feature')
+    repo.commit('fractol/zoom.c', 'int zoom;\n', 'Add zoom')
+    repo.run('checkout', '--quiet', 'main')
+    repo.commit('libft/ft.c', 'int ft(void);\n', 'Fix libft')
+    return repo
+
+
+@pytest.mark.parametrize('shards', [0, 2])
+def test_pushed_targets_clone_back(tmp_path, monkeypatch, local_remote, monorepo, shards):
+    # The splitter keeps its history, caches and logs in the directory it runs in
+    monkeypatch.chdir(tmp_path)
+    config = RepoSplitterConfig(source_repo_url=monorepo.path, org='splitter', github_token='any', mode='project',
+                                projects=['fractol'], common_path='libft', github_api_url=local_remote.api_url,
+                                refs_include=['main', 'feature', 'refs/tags/v*'], rewrite_shards=shards)
+    with RepoSplitter(config) as splitter:
+        splitter.split_repositories()
+
+    project = clone(local_remote.clone_url('splitter', 'fractol-app'), str(tmp_path / 'fractol-app'))
+    assert sorted(os.listdir(project)) == ['.git', 'main.c']
+    assert run_git(project, 'log', '--format=%s', 'main').splitlines() == ['Fix fractol', 'Add fractol']
+    assert run_git(project, 'log', '-1', '--format=%s', 'origin/feature') == 'Add zoom'
+    assert run_git(project, 'tag') == 'v1.0'
+    assert run_git(project, 'show', 'v1.0:main.c') == 'int main(void);'
+
+    common = clone(local_remote.clone_url('splitter', 'common-libs'), str(tmp_path / 'common-libs'))
+    assert sorted(os.listdir(common)) == ['.git', 'ft.c']
+    assert run_git(common, 'log', '--format=%s').splitlines() == ['Fix libft', 'Add libft']
+    assert local_remote.stats['repos_created'] == 2
+
+
+def test_each_target_gets_its_own_lfs_objects(tmp_path, monkeypatch, local_remote, monorepo):
+    monkeypatch.chdir(tmp_path)
+    image, data, extra = b'fractol image', b'libft data', b'unpublished image'
+    monorepo.commit('fractol/.gitattributes', '*.png filter=lfs diff=lfs merge=lfs -text\n', 'Track images')
+    monorepo.commit('fractol/image.png', store_lfs_object(monorepo, image), 'Add image')
+    monorepo.commit('libft/data.bin', store_lfs_object(monorepo, data), 'Add data')
+    # Only main is published, so the object of this branch goes nowhere
+    monorepo.run('checkout', '--quiet', 'feature')
+    monorepo.commit('fractol/extra.png', store_lfs_object(monorepo, extra), 'Add extra image')
+    monorepo.run('checkout', '--quiet', 'main')
+
+    config = RepoSplitterConfig(source_repo_url=monorepo.path, org='splitter', github_token='any', mode='project',
+                                projects=['fractol'], common_path='libft', github_api_url=local_remote.api_url,
+                                lfs=True, lfs_cache=str(tmp_path / 'lfs_cache'))
+    with RepoSplitter(config) as splitter:
+        splitter.split_repositories()
+
+    uploaded = {
+        repo: {oid_of(content) for content in (image, data, extra)
+               if os.path.exists(local_remote.lfs_path('splitter', repo, oid_of(content)))}
+        for repo in ('fractol-app', 'common-libs')
+    }
+    assert uploaded == {'fractol-app': {oid_of(image)}, 'common-libs': {oid_of(data)}}
+    assert local_remote.stats['lfs_uploads'] == 2
+    with open(local_remote.lfs_path('splitter', 'fractol-app', oid_of(image)), 'rb') as f:
+        assert f.read() == image
+
+    project = clone(local_remote.clone_url('splitter', 'fractol-app'), str(tmp_path / 'fractol-app'))
+    assert run_git(project, 'show', 'HEAD:image.png').startswith('version https://git-lfs.github.com/spec/v1')
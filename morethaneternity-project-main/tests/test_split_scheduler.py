@@ -0,0 +1,120 @@
+"""Cost estimates of split targets and the order and pools they run in."""
+
+import os
+import json
+import tempfile
+import threading
+import unittest
+
+from split_scheduler import CostModel, SplitTarget, TargetScheduler, SECONDS_PER_COMMIT, SECONDS_PER_BYTE
+from monorepo import Monorepo
+
+
+SOURCE_URL = 'https://example.com/mono.git'
+
+
+class CostModelTest(unittest.TestCase):
+    """Measure targets in the mirror and scale earlier timings by their size."""
+
+    def setUp(self):
+        temp_dir = tempfile.TemporaryDirectory()
+        self.addCleanup(temp_dir.cleanup)
+        self.history_path = os.path.join(temp_dir.name, 'split_history.json')
+        self.repo = Monorepo(os.path.join(temp_dir.name, 'mono'))
+        self.repo.commit('fractol/main.c', 'int main;\n', 'Add fractol')
+        self.repo.commit('libft/ft.c', 'int ft;\n', 'Add libft')
+        self.repo.commit('fractol/main.c', 'int main(void);\n', 'Fix fractol')
+
+    def model(self) -> CostModel:
+        return CostModel(self.repo.path, self.history_path, SOURCE_URL)
+
+    def target(self, name: str, **fields) -> SplitTarget:
+        return SplitTarget(name, run=lambda: None, **fields)
+
+    def test_estimate_from_the_mirror(self):
+        fractol = self.target('fractol-app', paths=['fractol'])
+        self.model().estimate_all([fractol])
+
+        self.assertEqual((fractol.commits, fractol.blob_bytes), (2, len('int main(void);\n')))
+        self.assertAlmostEqual(fractol.cost, 2 * SECONDS_PER_COMMIT + fractol.blob_bytes * SECONDS_PER_BYTE)
+
+    def test_estimate_scales_earlier_timings(self):
+        with open(self.history_path, 'w') as f:
+            json.dump({SOURCE_URL: {'fractol-app': {'commits': 1, 'rewrite_seconds': 3.0, 'push_seconds': 1.0}}}, f)
+        fractol = self.target('fractol-app', paths=['fractol'])
+        self.model().estimate_all([fractol])
+
+        # Twice the commits of the recorded run
+        self.assertAlmostEqual(fractol.cost, 8.0)
+
+    def test_missing_ref_gets_a_default_estimate(self):
+        fractol = self.target('fractol-app', paths=['fractol'])
+        libft = self.target('common-libs', paths=['libft'])
+        missing = self.target('gone-app', ref='refs/heads/gone')
+        model = self.model()
+
+        with self.assertLogs(model.logger, 'WARNING') as logs:
+            model.estimate_all([fractol, libft, missing])
+
+        self.assertIn("Cannot measure 'gone-app' at refs/heads/gone", logs.output[0])
+        self.assertEqual(missing.commits, 0)
+        self.assertAlmostEqual(missing.cost, (fractol.cost + libft.cost) / 2)
+
+        model.record(missing, rewrite_seconds=2.0, push_seconds=0.5)
+        self.assertAlmostEqual(model.estimate(missing), 2.5)
+
+
+class TargetSchedulerTest(unittest.TestCase):
+    """Run rewrites longest-first on the CPU pool and pushes on the network pool."""
+
+    def test_longest_first(self):
+        started = []
+        targets = [SplitTarget(name, run=lambda name=name: started.append(name), cost=cost)
+                   for name, cost in [('small', 1.0), ('large', 3.0), ('medium', 2.0)]]
+
+        TargetScheduler(cpu_workers=1, network_workers=1).run(targets)
+
+        self.assertEqual(started, ['large', 'medium', 'small'])
+
+    def test_pushes_do_not_hold_rewrite_slots(self):
+        scheduler = TargetScheduler(cpu_workers=1, network_workers=2)
+        threads = {}
+        second_rewrite = threading.Event()
+
+        def push(name):
+            threads[f'{name} push'] = threading.current_thread().name
+            if name == 'first':
+                # Only finishes once the next rewrite ran on the single CPU slot
+                self.assertTrue(second_rewrite.wait(timeout=5))
+
+        def rewrite(name):
+            threads[f'{name} rewrite'] = threading.current_thread().name
+            if name == 'second':
+                second_rewrite.set()
+            scheduler.submit_network(push, name)
+
+        done = []
+        targets = [SplitTarget('first', run=lambda: rewrite('first'), cost=2.0),
+                   SplitTarget('second', run=lambda: rewrite('second'), cost=1.0)]
+        errors = scheduler.run(targets, on_done=lambda target: done.append(target.name))
+
+        self.assertEqual(errors, {})
+        self.assertEqual(sorted(done), ['first', 'second'])
+        for key, thread in threads.items():
+            self.assertTrue(thread.startswith('push' if key.endswith('push') else 'rewrite'), f'{key}: {thread}')
+        self.assertGreater(scheduler.timings(targets[0])['push_seconds'], 0)
+
+    def test_continue_returns_failures(self):
+        def fail():
+            raise RuntimeError('rewrite failed')
+
+        done = []
+        targets = [SplitTarget('broken', run=fail, cost=2.0), SplitTarget('fine', run=lambda: None, cost=1.0)]
+        errors = TargetScheduler(1, 1, fail_fast=False).run(targets, on_done=lambda target: done.append(target.name))
+
+        self.assertEqual(list(errors), ['broken'])
+        self.assertEqual(done, ['fine'])
+
+
+if __name__ == '__main__':
+    unittest.main()
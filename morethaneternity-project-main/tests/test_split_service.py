@@ -0,0 +1,74 @@
+"""Split service jobs: what they keep apart and what they share."""
+
+import os
+import json
+import tempfile
+import unittest
+import multiprocessing
+
+from split_repo_agent import RepoSplitterConfig
+from split_scheduler import CostModel, SplitTarget
+from split_service import JobQueue, isolate_job_files
+
+
+def record_timing(history_path: str, name: str):
+    """Record and save the timing of one target, as a job does at the end of its run."""
+    model = CostModel('.', history_path, 'https://example.com/mono.git')
+    model.record(SplitTarget(name, run=None, commits=10), rewrite_seconds=1.0, push_seconds=0.5)
+    model.save()
+
+
+class SplitServiceTest(unittest.TestCase):
+    """Jobs keep their bundles apart, share the history, and never store the token."""
+
+    def setUp(self):
+        temp_dir = tempfile.TemporaryDirectory()
+        self.addCleanup(temp_dir.cleanup)
+        self.temp_dir = temp_dir.name
+
+    def config(self, **overrides) -> RepoSplitterConfig:
+        return RepoSplitterConfig(source_repo_url='https://example.com/mono.git', org='splitter',
+                                  github_token='ghp_secret', mode='project', **overrides)
+
+    def test_token_is_not_stored(self):
+        queue = JobQueue(os.path.join(self.temp_dir, 'jobs.db'))
+        queue.submit(self.config(), 'team-a')
+
+        stored = json.loads(queue.jobs()[0]['config'])
+        self.assertEqual(stored['github_token'], '')
+        with open(os.path.join(self.temp_dir, 'jobs.db'), 'rb') as f:
+            self.assertNotIn(b'ghp_secret', f.read())
+
+    def test_only_bundles_are_isolated(self):
+        config = self.config()
+        defaults = self.config()
+        isolate_job_files(config, os.path.join(self.temp_dir, 'job-1'))
+
+        self.assertEqual(config.bundle_dir, os.path.join(self.temp_dir, 'job-1', 'bundles'))
+        for name in ('history_file', 'github_cache', 'commit_index', 'target_manifest', 'preflight_cache',
+                     'metrics_file'):
+            self.assertEqual(getattr(config, name), getattr(defaults, name), name)
+
+        explicit = self.config(bundle_dir='/srv/bundles/team-a')
+        isolate_job_files(explicit, os.path.join(self.temp_dir, 'job-2'))
+        self.assertEqual(explicit.bundle_dir, '/srv/bundles/team-a')
+
+    def test_concurrent_jobs_keep_each_others_timings(self):
+        history_path = os.path.join(self.temp_dir, 'split_history.json')
+        processes = [
+            multiprocessing.Process(target=record_timing, args=(history_path, f'project{index}-app'))
+            for index in range(8)
+        ]
+        for process in processes:
+            process.start()
+        for process in processes:
+            process.join()
+
+        with open(history_path) as f:
+            history = json.load(f)
+        self.assertEqual(sorted(history['https://example.com/mono.git']),
+                         sorted(f'project{index}-app' for index in range(8)))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,84 @@
+"""Project history wired to common-libs: every commit pins the library as it was."""
+
+import os
+import tempfile
+import unittest
+
+from history_rewrite import git, read_filter_repo_map
+from monorepo import Monorepo
+from submodule_wiring import SubmoduleWiring, pin_commits, submodule_section
+
+
+class SubmoduleWiringTest(unittest.TestCase):
+    """Split app and libft, wire libft into app and check the gitlink of every commit."""
+
+    def setUp(self):
+        temp_dir = tempfile.TemporaryDirectory()
+        self.addCleanup(temp_dir.cleanup)
+        self.temp_dir = temp_dir.name
+        self.repo = Monorepo(os.path.join(self.temp_dir, 'mono'))
+
+        repo = self.repo
+        self.sources = {
+            'app before libft': repo.commit('app/main.c', 'int main;\n', 'Add app'),
+            'libft v1': repo.commit('libft/ft.c', 'int ft;\n', 'Add libft'),
+            'app on v1': repo.commit('app/main.c', 'int main(void);\n', 'Use libft'),
+            'libft v2': repo.commit('libft/ft.c', 'int ft(void);\n', 'Fix libft'),
+            'app on v2': repo.commit('app/main.c', 'int main(int argc);\n', 'Take arguments'),
+        }
+        repo.run('checkout', '--quiet', '-b', 'feature')
+        self.sources['libft v3'] = repo.commit('libft/ft.c', 'long ft(void);\n', 'Widen ft')
+        self.sources['app on v3'] = repo.commit('app/main.c', 'long main(int argc);\n', 'Widen main')
+        repo.run('checkout', '--quiet', 'main')
+
+        self.common_path = self.split('common-libs', 'libft')
+        self.common_map = read_filter_repo_map(self.common_path)
+        self.app_path = self.split('app', 'app')
+        self.app_map = read_filter_repo_map(self.app_path)
+
+    def split(self, name: str, subdirectory: str) -> str:
+        path = os.path.join(self.temp_dir, f'{name}.git')
+        git(self.temp_dir, ['clone', '--quiet', '--bare', self.repo.path, path])
+        git(path, ['filter-repo', '--subdirectory-filter', subdirectory, '--force', '--quiet'])
+        return path
+
+    def common_commit(self, source: str) -> str:
+        return self.common_map[self.sources[source]]
+
+    def test_pins_follow_the_first_parent(self):
+        pins = pin_commits(self.repo.path, self.common_map)
+
+        self.assertIsNone(pins[self.sources['app before libft']])
+        self.assertEqual(pins[self.sources['libft v2']], self.common_commit('libft v2'))
+        # App commits did not touch libft and pin what their parent had checked out
+        self.assertEqual(pins[self.sources['app on v1']], self.common_commit('libft v1'))
+        self.assertEqual(pins[self.sources['app on v2']], self.common_commit('libft v2'))
+        self.assertEqual(pins[self.sources['app on v3']], self.common_commit('libft v3'))
+
+    def test_every_project_commit_pins_its_library_commit(self):
+        pins = pin_commits(self.repo.path, self.common_map)
+        wired = SubmoduleWiring(self.app_path, 'libft', '../common-libs.git').wire(self.app_map, pins)
+
+        expected = {'app before libft': None, 'app on v1': 'libft v1', 'app on v2': 'libft v2',
+                    'app on v3': 'libft v3'}
+        for source, library in expected.items():
+            commit = wired[self.app_map[self.sources[source]]]
+            gitlink = git(self.app_path, ['ls-tree', commit, 'libft']).decode().split()
+            if library is None:
+                self.assertEqual(gitlink, [], source)
+                continue
+            self.assertEqual(gitlink[:3], ['160000', 'commit', self.common_commit(library)], source)
+            self.assertEqual(git(self.app_path, ['show', f'{commit}:.gitmodules']),
+                             submodule_section('libft', '../common-libs.git'))
+            # The pinned commit exists in common-libs with the library as the source commit had it
+            self.assertEqual(git(self.common_path, ['show', f'{self.common_commit(library)}:ft.c']),
+                             git(self.repo.path, ['show', f'{self.sources[source]}:libft/ft.c']))
+
+        # Branches moved to the wired commits
+        for branch, source in [('main', 'app on v2'), ('feature', 'app on v3')]:
+            self.assertEqual(git(self.app_path, ['rev-parse', branch]).decode().strip(),
+                             wired[self.app_map[self.sources[source]]])
+
+
+if __name__ == '__main__':
+    unittest.main()